@@ -1,22 +1,39 @@
+import click
+import time
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from flask_restful import Api
 from flasgger import Swagger
-from models import db
+from models import db, User
 from config import Config
+from services.instrumentation import init_instrumentation
+from services.log import configure_logging, get_logger
+from services.blob_store import sweep_blobs
+from services.reconciler import reconcile_status, reconcile_storage
+from services.search import ensure_search_index, rebuild_search_index
+from services.usage import reconcile_usage
+from services.user_cache import load_user
+
+log = get_logger('app')
 
 def create_app():
+    configure_logging()
     app = Flask(__name__)
     
     # Load configuration
     app.config.from_object(Config)
+    init_instrumentation(app)
     
     # Initialize extensions
     db.init_app(app)
     migrate = Migrate(app, db)
     jwt = JWTManager(app)
+
+    @jwt.user_lookup_loader
+    def user_lookup_callback(jwt_header, jwt_data):
+        return load_user(jwt_data['sub'])
     api = Api(app)
     swagger = Swagger(app)
     CORS(
@@ -24,23 +41,108 @@ def create_app():
         origins=['*', 'https://sync-hub-app.vercel.app', 'http://localhost:5173'],
         supports_credentials=True,
         methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-        allow_headers=['Content-Type', 'Authorization']
+        allow_headers=['Content-Type', 'Authorization'],
+        expose_headers=['X-Next-Cursor']
     )
     
+    # Schema changes go through migrations (flask db upgrade); creating
+    # missing tables at startup is opt-in for throwaway databases
+    if Config.DB_CREATE_ALL:
+        with app.app_context():
+            db.create_all()
+            ensure_search_index()
+
     # Import blueprints
     from routes.auth import auth_bp
     from routes.devices import devices_bp
     from routes.sync import sync_bp
-    from quick_upload import quick_upload_bp
+    from routes.events import events_bp
+    from services.sync_journal import compact_journal
+    from quick_upload import quick_upload_bp, backfill_thumbnails
+    from resumable_upload import resumable_upload_bp, abort_stale_sessions
 
     
     # ✅ Register blueprints with unique prefixes
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(devices_bp, url_prefix='/api/devices')
     app.register_blueprint(sync_bp, url_prefix='/api/sync')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
 
     # Main file upload/download routes
     app.register_blueprint(quick_upload_bp, url_prefix='/api/files')
+    app.register_blueprint(resumable_upload_bp, url_prefix='/api/files/uploads')
+
+    @app.cli.command('abort-stale-uploads')
+    def abort_stale_uploads_command():
+        """Abort resumable uploads idle for longer than UPLOAD_SESSION_TTL."""
+        count = abort_stale_sessions()
+        print(f"Aborted {count} stale upload sessions")
+
+    @app.cli.command('compact-sync-journal')
+    def compact_sync_journal_command():
+        """Drop superseded and expired events from the sync change journal."""
+        removed = compact_journal()
+        print(f"Removed {removed['superseded']} superseded events and {removed['tombstones']} expired deletes")
+
+    @app.cli.command('generate-thumbnails')
+    @click.option('--all', 'retry_all', is_flag=True, help='Also retry failed files and files without previews.')
+    def generate_thumbnails_command(retry_all):
+        """Render pending image thumbnails and video posters."""
+        count = backfill_thumbnails(retry_all)
+        print(f"Rendered previews for {count} files")
+
+    @app.cli.command('reconcile-usage')
+    def reconcile_usage_command():
+        """Check per-folder storage usage against the files table and fix drift."""
+        result = reconcile_usage()
+        print(f"Checked {result['users']} users, corrected {result['corrected']} folders "
+              f"({result['drift_bytes']} bytes of drift)")
+
+    @app.cli.command('reconcile-storage')
+    @click.option('--repair', is_flag=True, help='Delete orphaned objects and files whose object is missing.')
+    @click.option('--max-keys', type=int, help='Keys to check this run (default RECONCILE_BATCH).')
+    @click.option('--loop', is_flag=True, help='Keep running, every RECONCILE_INTERVAL seconds.')
+    @click.option('--status', is_flag=True, help='Show the checkpoint and what the pass has found.')
+    def reconcile_storage_command(repair, max_keys, loop, status):
+        """Check the MinIO bucket against the files table, continuing from the last run."""
+        if status:
+            print(reconcile_status())
+            return
+        while True:
+            result = reconcile_storage(repair, max_keys)
+            print(f"Checked {result['keys']} keys: {result['orphan_objects']} orphaned objects, "
+                  f"{result['orphan_thumbnails']} orphaned thumbnails, {result['missing_objects']} files "
+                  f"missing from storage, {result['size_mismatches']} size mismatches; deleted "
+                  f"{result['deleted_objects']} objects and {result['deleted_files']} files"
+                  + (" (pass complete)" if result['pass_complete'] else f" (up to {result['position']})"))
+            if not loop:
+                return
+            time.sleep(Config.RECONCILE_INTERVAL)
+
+    @app.cli.command('sweep-blobs')
+    @click.option('--grace', type=int, help='Seconds a blob must have been unreferenced (default BLOB_SWEEP_GRACE).')
+    def sweep_blobs_command(grace):
+        """Delete deduplicated blobs no file has referred to for a while."""
+        count = sweep_blobs(grace)
+        print(f"Deleted {count} unreferenced blobs")
+
+    @app.cli.command('set-storage-quota')
+    @click.argument('email')
+    @click.argument('quota')
+    def set_storage_quota_command(email, quota):
+        """Set a user's storage quota in bytes (0 = unlimited, default = STORAGE_QUOTA)."""
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            raise click.ClickException(f"No user {email}")
+        user.storage_quota = None if quota == 'default' else int(quota)
+        db.session.commit()
+        print(f"Storage quota of {email} set to {quota}")
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Create the file search index if missing and re-index every file."""
+        count = rebuild_search_index()
+        print(f"Indexed {count} files")
 
 
     
@@ -53,9 +155,12 @@ def create_app():
             'version': '1.0.0',
             'endpoints': {
                 'auth': '/api/auth/login, /api/auth/register',
-                'files': '/api/files, /api/files/upload, /api/files/<id>/download',
+                'files': '/api/files, /api/files/search, /api/files/usage, /api/files/upload, /api/files/<id>/download, /api/files/<id>/thumbnail',
+                'sync': '/api/sync/status, /api/sync/changes, /api/sync/trigger',
+                'events': '/api/events/stream',
 
                 'devices': '/api/devices',
+                'metrics': '/metrics',
                 'test': '/api/test'
             }
         }), 200
@@ -85,9 +190,10 @@ if __name__ == '__main__':
     with app.app_context():
         try:
             db.create_all()
-            print("✅ Database tables created successfully")
+            ensure_search_index()
+            log.info("Database tables created")
         except Exception as e:
-            print(f"❌ Error creating database tables: {e}")
+            log.error("Error creating database tables", error=str(e))
     
     import os
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,587 @@
+"""ASGI entry point: `uvicorn asgi:app` (needs the optional aiohttp and
+uvicorn packages, see requirements-asgi.txt).
+
+File transfers (download, form upload, resumable chunk upload) run as
+native async handlers that stream between the client and MinIO with
+aiohttp, so a slow client only costs an idle coroutine instead of a worker.
+Their short database steps run in threads. Every other request is passed
+to the Flask app on a fixed pool of ASGI_WSGI_THREADS threads.
+"""
+import asyncio
+import json
+import re
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from flask_jwt_extended import decode_token
+from jwt import ExpiredSignatureError, PyJWTError
+from minio.helpers import MAX_MULTIPART_COUNT
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File as FilePart, MultipartDecoder, NeedData
+from werkzeug.wrappers import Request
+from app import app as flask_app
+from config import Config
+from models import db, File, UploadSession, UploadPart
+from quick_upload import download_plan, stored_representation
+from services.async_storage import async_storage
+from services.compression import DecodedRange, storage_codec
+from services.instrumentation import begin_request
+from services.log import get_logger
+from services.minio_service import STAGING_PREFIX, file_object_name, minio_service
+from services.sync_journal import record_change
+from services.thumbnails import schedule_thumbnails
+from services.usage import QuotaExceeded, check_quota
+from services.user_cache import load_user
+
+log = get_logger('asgi')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, body):
+        super().__init__(body)
+        self.status = status
+        self.body = body
+
+
+def _environ(scope, body):
+    """The WSGI environ of an HTTP scope, reading the body from `body`."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        if key in environ:
+            # Repeated headers are joined, cookies with their own separator
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+def _request_from_scope(scope):
+    """A body-less werkzeug Request carrying the scope's headers."""
+    return Request(_environ(scope, BytesIO()))
+
+
+async def _body(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('Client disconnected')
+        if message.get('body'):
+            yield message['body']
+        if not message.get('more_body'):
+            return
+
+
+class _StreamedUpload:
+    """The file part of a form upload, forwarded to a MinIO multipart upload.
+
+    At most one part is buffered, and the request body is only read on
+    while that part is being sent, so memory per upload stays at
+    ASGI_UPLOAD_PART_SIZE however slow either side is. If the form sends
+    the file before folder_type, the object is staged and copied to its
+    final name once the rest of the form is known.
+    """
+
+    def __init__(self, filename, fields):
+        self.filename = filename
+        self.file_id = str(uuid.uuid4())
+        self.staged = 'folder_type' not in fields
+        if self.staged:
+            self.object_name = f"{STAGING_PREFIX}{uuid.uuid4()}"
+        else:
+            self.object_name = file_object_name(fields['folder_type'], self.file_id, filename)
+        self.upload_id = None
+        self.buffer = bytearray()
+        self.parts = []
+        self.size = 0
+
+    async def start(self, fields):
+        self.upload_id = await asyncio.to_thread(
+            minio_service.create_multipart_upload, self.object_name, _metadata(self.filename, fields)
+        )
+
+    async def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= Config.ASGI_UPLOAD_PART_SIZE:
+            await self._send_part(bytes(self.buffer[:Config.ASGI_UPLOAD_PART_SIZE]))
+            del self.buffer[:Config.ASGI_UPLOAD_PART_SIZE]
+
+    async def _send_part(self, data):
+        if len(self.parts) >= MAX_MULTIPART_COUNT:
+            raise HTTPError(413, {'error': 'File too large'})
+        part_number = len(self.parts) + 1
+        etag = await async_storage.upload_part(self.object_name, self.upload_id, part_number, data)
+        self.parts.append((part_number, etag))
+
+    async def finish(self, fields):
+        """Complete the upload and return the object's final name."""
+        if self.buffer or not self.parts:
+            await self._send_part(bytes(self.buffer))
+            self.buffer.clear()
+        await asyncio.to_thread(
+            minio_service.complete_multipart_upload, self.object_name, self.upload_id, self.parts
+        )
+        self.upload_id = None
+        if not self.staged:
+            return self.object_name
+
+        folder_type = fields.get('folder_type', 'documents')
+        final_object = file_object_name(folder_type, self.file_id, self.filename)
+        try:
+            await asyncio.to_thread(
+                minio_service.copy_file, self.object_name, final_object, _metadata(self.filename, fields)
+            )
+        finally:
+            await asyncio.to_thread(minio_service.delete_file, self.object_name)
+        return final_object
+
+    async def abort(self):
+        if self.upload_id:
+            try:
+                await asyncio.to_thread(minio_service.abort_multipart_upload, self.object_name, self.upload_id)
+            except Exception as e:
+                log.warning("MinIO abort error", upload_id=self.upload_id, error=str(e))
+
+
+def _metadata(filename, fields):
+    return {
+        'title': fields.get('title', filename),
+        'description': fields.get('description', ''),
+        'device': fields.get('device_name', 'Unknown Device')
+    }
+
+
+class WsgiBridge:
+    """Runs a WSGI app for ASGI requests on a fixed pool of threads.
+
+    The request body is read first (spooled to disk past 64 KiB), then the
+    app runs on one of the pool's threads and its response is sent chunk by
+    chunk as the app yields it, so streamed responses (/api/events/stream)
+    hold a thread for as long as they are open. Once the client has gone
+    the app's iterator is closed at its next chunk.
+    """
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        body = SpooledTemporaryFile(max_size=64 * 1024)
+        try:
+            async for chunk in _body(receive):
+                body.write(chunk)
+        except ConnectionError:
+            body.close()
+            return
+        body.seek(0)
+
+        gone = threading.Event()
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            gone.set()
+
+        loop = asyncio.get_running_loop()
+        watcher = asyncio.create_task(watch())
+        try:
+            await loop.run_in_executor(self.executor, self._run, loop, scope, body, send, gone)
+        finally:
+            watcher.cancel()
+            body.close()
+
+    def _run(self, loop, scope, body, send, gone):
+        response = {}
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def begin():
+            if response.pop('headers', None) is not None:
+                emit({'type': 'http.response.start', 'status': response['status'], 'headers': response['raw']})
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and 'status' in response and 'headers' not in response:
+                # Too late to replace the headers that were already sent
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+            response['raw'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return write
+
+        def write(data):
+            begin()
+            emit({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        result = self.wsgi_app(_environ(scope, body), start_response)
+        try:
+            for data in result:
+                if gone.is_set():
+                    return
+                if data:
+                    write(data)
+            begin()
+            emit({'type': 'http.response.body'})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncFileApp:
+    """Routes file transfers to async handlers and everything else to Flask."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiBridge(flask_app, Config.ASGI_WSGI_THREADS)
+        # (method, Flask rule for metrics, path pattern, handler)
+        self.routes = [
+            ('GET', '/api/files/<file_id>/download',
+             re.compile(r'^/api/files/(?P<file_id>[^/]+)/download$'), self.download),
+            ('POST', '/api/files/upload', re.compile(r'^/api/files/upload$'), self.upload),
+            ('PUT', '/api/files/uploads/<session_id>/chunks/<int:part_number>',
+             re.compile(r'^/api/files/uploads/(?P<session_id>[^/]+)/chunks/(?P<part_number>\d+)$'),
+             self.upload_chunk),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        handler = await self._match(scope) if scope['type'] == 'http' else None
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        func, params, rule = handler
+        req = _request_from_scope(scope)
+        started = []
+        record = begin_request(scope['method'], rule)
+
+        async def counted_receive():
+            message = await receive()
+            record.bytes_in += len(message.get('body', b''))
+            return message
+
+        async def counted_send(message):
+            record.bytes_out += len(message.get('body', b''))
+            await send(message)
+
+        async def start(status, headers):
+            headers = dict(headers, **self._cors_headers(req))
+            started.append(status)
+            record.status = status
+            await counted_send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in headers.items()]
+            })
+
+        try:
+            await func(req, counted_receive, counted_send, start, **params)
+        except HTTPError as e:
+            if started:
+                raise
+            await self._send_json(start, counted_send, e.status, e.body)
+        except ConnectionError:
+            # The client went away mid-transfer
+            pass
+        except Exception as e:
+            log.exception("Async transfer error", route=rule)
+            if started:
+                raise
+            await self._send_json(start, counted_send, 500, {'error': str(e)})
+        finally:
+            record.finish()
+
+    async def _match(self, scope):
+        for method, rule, pattern, func in self.routes:
+            match = pattern.match(scope['path'])
+            if match and scope['method'] == method:
+                if func == self.upload and (Config.STORAGE_DEDUP or storage_codec()):
+                    # Deduplication hashes the spooled upload before storing
+                    # it, and compression sniffs it first
+                    return None
+                # Checking may mean a request to MinIO, so not on the loop
+                if not await asyncio.to_thread(lambda: minio_service.available):
+                    # Let Flask report the outage the usual way
+                    return None
+                return func, match.groupdict(), rule
+        return None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_storage.close()
+                self.wsgi.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _cors_headers(self, req):
+        # Mirrors the Flask-CORS setup in create_app (any origin, with credentials)
+        origin = req.headers.get('Origin')
+        if not origin:
+            return {}
+        return {
+            'Access-Control-Allow-Origin': origin,
+            'Access-Control-Allow-Credentials': 'true',
+            'Vary': 'Origin'
+        }
+
+    async def _send_json(self, start, send, status, data):
+        body = json.dumps(data).encode()
+        await start(status, {'Content-Type': 'application/json', 'Content-Length': len(body)})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _authenticate(self, req):
+        """The JWT identity of the request, checked like @jwt_required()."""
+        token = None
+        auth_header = req.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            token = auth_header[len('Bearer '):]
+        if not token:
+            raise HTTPError(401, {'msg': 'Missing Authorization Header'})
+
+        def check():
+            with self.flask_app.app_context():
+                claims = decode_token(token)
+                if load_user(claims['sub']) is None:
+                    raise HTTPError(401, {'msg': f"Error loading the user {claims['sub']}"})
+                return claims['sub']
+
+        try:
+            return await asyncio.to_thread(check)
+        except ExpiredSignatureError:
+            raise HTTPError(401, {'msg': 'Token has expired'})
+        except PyJWTError as e:
+            raise HTTPError(422, {'msg': str(e)})
+
+    def _in_app(self, func, *args):
+        def run():
+            with self.flask_app.app_context():
+                try:
+                    return func(*args)
+                except Exception:
+                    db.session.rollback()
+                    raise
+        return asyncio.to_thread(run)
+
+    # Downloads
+
+    async def download(self, req, receive, send, start, file_id):
+        user_id = await self._authenticate(req)
+
+        def load():
+            file = File.query.filter_by(id=file_id, user_id=user_id).first()
+            return (file.filename, file.object_name, file.content_codec, file.size) if file else None
+
+        found = await self._in_app(load)
+        if not found:
+            raise HTTPError(404, {'error': 'File not found'})
+        filename, object_name, codec, size = found
+
+        try:
+            stat = await async_storage.stat(object_name)
+        except FileNotFoundError:
+            raise HTTPError(404, {'error': 'File not found in storage'})
+
+        stat, decode, encoding_headers = stored_representation(req, stat, codec, size)
+        status, headers, offset, length = download_plan(req, stat, filename)
+        headers.update(encoding_headers)
+        headers['Content-Type'] = 'application/octet-stream'
+        await start(status, headers)
+        if status in (200, 206) and length and decode:
+            decoded = DecodedRange(codec, offset, length)
+            async for chunk in async_storage.iter_file(object_name):
+                data = decoded.feed(chunk)
+                if data:
+                    await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+                if decoded.done:
+                    break
+            else:
+                data = decoded.flush()
+                if data:
+                    await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        elif status in (200, 206) and length:
+            chunks = async_storage.iter_file(object_name, offset=offset, length=length if status == 206 else 0)
+            async for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    # Form uploads
+
+    async def upload(self, req, receive, send, start):
+        user_id = await self._authenticate(req)
+
+        content_type, options = parse_options_header(req.headers.get('Content-Type', ''))
+        if content_type != 'multipart/form-data' or 'boundary' not in options:
+            raise HTTPError(400, {'error': 'No file provided'})
+
+        def check():
+            # Before the body is read: the request size bounds the file's.
+            # Bodies of unknown length (chunked) are checked in save().
+            try:
+                check_quota(user_id, req.content_length)
+            except QuotaExceeded as e:
+                raise HTTPError(413, e.to_dict())
+
+        await self._in_app(check)
+
+        decoder = MultipartDecoder(options['boundary'].encode('latin-1'))
+        fields = {}
+        state = {'upload': None, 'part': None}
+        try:
+            async for chunk in _body(receive):
+                decoder.receive_data(chunk)
+                await self._read_form(decoder, fields, state)
+            decoder.receive_data(None)
+            await self._read_form(decoder, fields, state)
+
+            upload = state['upload']
+            if upload is None:
+                raise HTTPError(400, {'error': 'No file provided'})
+            object_name = await upload.finish(fields)
+        except BaseException:
+            if state['upload']:
+                await state['upload'].abort()
+            raise
+
+        def save():
+            try:
+                check_quota(user_id, upload.size)
+            except QuotaExceeded as e:
+                raise HTTPError(413, e.to_dict())
+            title = fields.get('title', upload.filename)
+            folder_type = fields.get('folder_type', 'documents')
+            new_file = File(
+                id=upload.file_id,
+                filename=upload.filename,
+                title=title,
+                description=fields.get('description', ''),
+                folder_type=folder_type,
+                device_name=fields.get('device_name', 'Unknown Device'),
+                size=upload.size,
+                object_name=object_name,
+                cloudinary_url=f"http://{Config.MINIO_ENDPOINT}/{minio_service.bucket}/{object_name}",
+                user_id=user_id
+            )
+            db.session.add(new_file)
+            schedule_thumbnails(new_file, object_name)
+            record_change(new_file, 'create')
+            db.session.commit()
+            return {
+                'message': 'File uploaded successfully',
+                'id': new_file.id,
+                'filename': new_file.filename,
+                'title': title,
+                'folder_type': folder_type,
+                'deduplicated': False
+            }
+
+        try:
+            result = await self._in_app(save)
+        except Exception:
+            await asyncio.to_thread(minio_service.delete_file, object_name)
+            raise
+        await self._send_json(start, send, 201, result)
+
+    async def _read_form(self, decoder, fields, state):
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, FilePart) and event.name == 'file' and state['upload'] is None:
+                if not event.filename:
+                    raise HTTPError(400, {'error': 'No file selected'})
+                state['upload'] = _StreamedUpload(event.filename, fields)
+                await state['upload'].start(fields)
+                state['part'] = ('file', None, None)
+            elif isinstance(event, Field):
+                state['part'] = ('field', event.name, bytearray())
+            elif isinstance(event, FilePart):
+                state['part'] = ('skip', None, None)
+            elif isinstance(event, Data):
+                kind, name, value = state['part']
+                if kind == 'file':
+                    await state['upload'].write(event.data)
+                elif kind == 'field':
+                    value += event.data
+                    if len(value) > Config.ASGI_MAX_FIELD_SIZE:
+                        raise HTTPError(413, {'error': f'Form field {name} too large'})
+                    if not event.more_data:
+                        fields[name] = value.decode('utf-8', 'replace')
+            event = decoder.next_event()
+
+    # Resumable upload chunks
+
+    async def upload_chunk(self, req, receive, send, start, session_id, part_number):
+        user_id = await self._authenticate(req)
+        part_number = int(part_number)
+        length = req.content_length
+
+        def load():
+            session = UploadSession.query.filter_by(id=session_id, user_id=user_id).first()
+            if not session:
+                raise HTTPError(404, {'error': 'Upload not found'})
+            if session.status != 'active':
+                raise HTTPError(409, {'error': f'Upload is {session.status}'})
+            if not 1 <= part_number <= MAX_MULTIPART_COUNT:
+                raise HTTPError(400, {'error': f'Chunk number must be between 1 and {MAX_MULTIPART_COUNT}'})
+            if length is None:
+                raise HTTPError(411, {'error': 'Content-Length required'})
+            if length > session.chunk_size:
+                raise HTTPError(413, {'error': f'Chunk larger than {session.chunk_size} bytes'})
+            received = sum(p.size for p in session.parts if p.part_number != part_number)
+            try:
+                check_quota(user_id, received + length)
+            except QuotaExceeded as e:
+                raise HTTPError(413, e.to_dict())
+            return session.object_name, session.upload_id
+
+        object_name, upload_id = await self._in_app(load)
+
+        # Streamed straight through: the chunk is never held in memory
+        etag = await async_storage.upload_part(object_name, upload_id, part_number, _body(receive), length)
+
+        def save():
+            db.session.merge(UploadPart(session_id=session_id, part_number=part_number, etag=etag, size=length))
+            UploadSession.query.filter_by(id=session_id).update({'updated_at': datetime.utcnow()})
+            db.session.commit()
+
+        await self._in_app(save)
+        await self._send_json(start, send, 200, {'part_number': part_number, 'etag': etag, 'size': length})
+
+
+app = AsyncFileApp(flask_app)
@@ -0,0 +1,407 @@
+"""Load test of the file API: throughput, p50/p99 latency and peak RSS per operation.
+
+Starts the MinIO stand-in (benchmarks/minio_standin.py), or uses a local
+MinIO given with --minio-endpoint, and a server on a fresh SQLite database
+(or --database-url, e.g. a local Postgres). Seeds --users users with
+--seed-files files of --file-size bytes each, then runs every scenario as
+--requests requests at --concurrency:
+
+  login      POST /api/auth/login
+  heartbeat  POST /api/devices/heartbeat
+  upload     POST /api/files/upload
+  download   GET /api/files/<id>/download
+  listing    GET /api/files
+  move       POST /api/files/move/<id>
+  delete     DELETE /api/files/delete/<id>
+
+Peak RSS is the sum of the server processes' peak resident sizes (Linux
+only), read after each scenario. Results are printed as a table and
+written as JSON with --output.
+
+Comparing revisions: --compare REV [REV ...] checks each git revision out
+into a temporary worktree and benchmarks it the same way ("." is the
+working tree; this script and the stand-in always come from the working
+tree). --baseline FILE compares one run against a saved --output file.
+Either way the last run is compared with the first, and p50/p99 latency
+up or throughput down by more than --threshold percent is reported as a
+regression and makes the exit status 1. Use SQLite when comparing
+revisions whose schemas differ.
+
+Run from backend/:  python benchmarks/bench_api.py [--scenarios upload,download] [--output results.json]
+                    python benchmarks/bench_api.py --compare HEAD~5 . --scenarios listing,download
+Needs aiohttp, and gunicorn (or uvicorn for --server asgi).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_asgi import free_port, percentile, wait_for
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(BENCHMARKS)
+SCENARIOS = ('login', 'heartbeat', 'upload', 'download', 'listing', 'move', 'delete')
+PASSWORD = 'bench-password'
+
+
+def peak_rss_mb(pid):
+    """Sum of VmHWM over a process and its descendants, in MiB; None where /proc is missing."""
+    total, pids = 0, [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as children:
+                pids.extend(int(child) for child in children.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            if current == pid:
+                return None
+    return round(total / 1024, 1)
+
+
+class Client:
+    """The API calls the scenarios make, on one aiohttp session."""
+
+    def __init__(self, session, base, args):
+        self.session = session
+        self.base = base
+        self.args = args
+        self.payload = os.urandom(args.file_size)
+        self.users = []
+        self.files = []
+        self.uploaded = []
+
+    def _body(self):
+        # A unique prefix keeps content-addressed storage from deduplicating uploads
+        tag = uuid.uuid4().bytes
+        return tag + self.payload[len(tag):] if len(self.payload) > len(tag) else tag[:len(self.payload)]
+
+    async def register(self, i):
+        email = f'bench-{uuid.uuid4().hex[:12]}-{i}@example.com'
+        async with self.session.post(f'{self.base}/api/auth/register', json={
+            'email': email, 'name': f'Bench {i}', 'password': PASSWORD
+        }) as response:
+            data = await response.json()
+            if response.status != 201:
+                raise RuntimeError(f'Registration failed ({response.status}): {data}')
+        self.users.append({'email': email, 'headers': {'Authorization': f"Bearer {data['token']}"}})
+
+    async def upload(self, user, i):
+        form = aiohttp.FormData()
+        form.add_field('folder_type', 'documents')
+        form.add_field('file', self._body(), filename=f'bench_{i}.bin')
+        async with self.session.post(f'{self.base}/api/files/upload', data=form, headers=user['headers']) as response:
+            data = await response.json()
+            if response.status != 201:
+                return False, 0, None
+            return True, self.args.file_size, (user, data['id'])
+
+    async def seed(self, count, into):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def one(i):
+            async with semaphore:
+                for attempt in range(3):
+                    try:
+                        ok, _, entry = await self.upload(self.users[i % len(self.users)], i)
+                    except aiohttp.ClientError:
+                        # A kept-alive connection the server just closed; seeding isn't timed
+                        continue
+                    if ok:
+                        into.append(entry)
+                        return
+                raise RuntimeError('Seeding upload failed')
+
+        await asyncio.gather(*(one(i) for i in range(count)))
+
+    # Scenarios: each takes the request index and returns (ok, bytes moved)
+
+    async def login(self, i):
+        user = self.users[i % len(self.users)]
+        async with self.session.post(f'{self.base}/api/auth/login', json={
+            'email': user['email'], 'password': PASSWORD
+        }) as response:
+            await response.read()
+            return response.status == 200, 0
+
+    async def heartbeat(self, i):
+        user_index = i % len(self.users)
+        async with self.session.post(f'{self.base}/api/devices/heartbeat', json={
+            'device_id': f'bench-device-{user_index}', 'device_name': 'Bench', 'device_type': 'laptop'
+        }, headers=self.users[user_index]['headers']) as response:
+            await response.read()
+            return response.status == 200, 0
+
+    async def upload_scenario(self, i):
+        ok, size, entry = await self.upload(self.users[i % len(self.users)], i)
+        if ok:
+            self.uploaded.append(entry)
+        return ok, size
+
+    async def download(self, i):
+        user, file_id = random.choice(self.files)
+        async with self.session.get(f'{self.base}/api/files/{file_id}/download', headers=user['headers']) as response:
+            size = 0
+            async for chunk in response.content.iter_any():
+                size += len(chunk)
+            return response.status == 200 and size == self.args.file_size, size
+
+    async def listing(self, i):
+        user = self.users[i % len(self.users)]
+        async with self.session.get(f'{self.base}/api/files', headers=user['headers']) as response:
+            body = await response.read()
+            return response.status == 200, len(body)
+
+    async def move(self, i):
+        user, file_id = self.files[i % len(self.files)]
+        # Each pass over the files moves them to the other folder
+        folder = 'archives' if (i // len(self.files)) % 2 == 0 else 'documents'
+        async with self.session.post(f'{self.base}/api/files/move/{file_id}', json={
+            'folder_type': folder
+        }, headers=user['headers']) as response:
+            await response.read()
+            return response.status == 200, 0
+
+    async def delete(self, i):
+        user, file_id = self.uploaded.pop()
+        async with self.session.delete(f'{self.base}/api/files/delete/{file_id}', headers=user['headers']) as response:
+            await response.read()
+            return response.status == 200, 0
+
+
+async def run_scenario(call, requests, concurrency):
+    latencies, failures, moved = [], 0, 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal failures, moved
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok, size = await call(i)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                ok, size = False, 0
+            if not ok:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            moved += size
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'failures': failures,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'mb_per_s': round(moved / elapsed / 1e6, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(max(latencies, default=0) * 1000, 1),
+        'elapsed_s': round(elapsed, 2)
+    }
+
+
+async def run_load(base, server_pid, args):
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        client = Client(session, base, args)
+        for i in range(args.users):
+            await client.register(i)
+        await client.seed(args.users * args.seed_files, client.files)
+        results = {'seed_peak_rss_mb': peak_rss_mb(server_pid), 'scenarios': {}}
+
+        calls = {
+            'login': client.login, 'heartbeat': client.heartbeat, 'upload': client.upload_scenario,
+            'download': client.download, 'listing': client.listing, 'move': client.move, 'delete': client.delete
+        }
+        for name in SCENARIOS:
+            if name not in args.scenarios:
+                continue
+            if name == 'delete' and len(client.uploaded) < args.requests:
+                # Untimed: there must be a file for every delete
+                await client.seed(args.requests - len(client.uploaded), client.uploaded)
+            result = await run_scenario(calls[name], args.requests, args.concurrency)
+            result['peak_rss_mb'] = peak_rss_mb(server_pid)
+            results['scenarios'][name] = result
+            print(f"  {name:>9}: " + ', '.join(f"{key}={value}" for key, value in result.items()), flush=True)
+        return results
+
+
+def server_command(args, port):
+    if args.server == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(args.workers),
+                '--port', str(port), '--log-level', 'warning']
+    return [sys.executable, '-m', 'gunicorn', '-k', 'gthread', '-w', str(args.workers),
+            '--threads', str(args.threads), '-b', f'127.0.0.1:{port}', '--timeout', '300', 'app:app']
+
+
+def run_tree(backend, label, minio_endpoint, args):
+    """Benchmark the backend in `backend` against a fresh database."""
+    port = free_port()
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    env = dict(
+        os.environ,
+        MINIO_ENDPOINT=minio_endpoint,
+        DATABASE_URL=database_url,
+        DB_CREATE_ALL='true',
+        # SQLite's single writer would otherwise be the heartbeat bottleneck
+        DEVICE_REGISTRY_URL=os.environ.get('DEVICE_REGISTRY_URL', 'memory://'),
+        # Admit the whole login burst: the scenario measures hashing, not
+        # the 429s a single busy process sheds beyond its queue
+        PASSWORD_HASH_QUEUE=os.environ.get('PASSWORD_HASH_QUEUE', str(args.concurrency)),
+        LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'),
+        LOG_REQUEST_SAMPLE_RATE='0',
+        # The ASGI server's Flask threads, like gunicorn's --threads
+        ASGI_WSGI_THREADS=str(args.threads)
+    )
+    server = subprocess.Popen(
+        server_command(args, port), cwd=backend, env=env,
+        stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL
+    )
+    print(f"{label}: {args.server} server, {args.users} users x {args.seed_files} files of "
+          f"{args.file_size} bytes, {args.requests} requests at concurrency {args.concurrency}", flush=True)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        asyncio.run(wait_for(f'{base}/api/test', timeout=60))
+        results = asyncio.run(run_load(base, server.pid, args))
+    finally:
+        server.terminate()
+        server.wait()
+    return dict(
+        revision=label,
+        started_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        settings={key: getattr(args, key) for key in (
+            'server', 'workers', 'threads', 'users', 'seed_files', 'file_size', 'requests', 'concurrency'
+        )},
+        database='sqlite' if not args.database_url else args.database_url.split(':', 1)[0],
+        storage='stand-in' if not args.minio_endpoint else 'minio',
+        **results
+    )
+
+
+def git(*args):
+    return subprocess.run(['git', *args], cwd=BACKEND, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def run_revision(revision, minio_endpoint, args):
+    if revision == '.':
+        return run_tree(BACKEND, f"{git('rev-parse', '--short', 'HEAD')}+worktree", minio_endpoint, args)
+    commit = git('rev-parse', '--short', revision)
+    root = git('rev-parse', '--show-toplevel')
+    backend = os.path.relpath(BACKEND, root)
+    checkout = tempfile.mkdtemp(prefix=f'bench-{commit}-')
+    git('worktree', 'add', '--detach', checkout, commit)
+    try:
+        return run_tree(os.path.join(checkout, backend), commit, minio_endpoint, args)
+    finally:
+        git('worktree', 'remove', '--force', checkout)
+        shutil.rmtree(checkout, ignore_errors=True)
+
+
+def compare(runs, threshold):
+    """Print last-vs-first changes per scenario; returns the regressions found."""
+    base, head = runs[0], runs[-1]
+    regressions = []
+    print(f"\n{'scenario':>9}  {'metric':<14}" + ''.join(f"{run['revision']:>20}" for run in runs) + f"{'change':>10}")
+    for name, head_result in head['scenarios'].items():
+        base_result = base['scenarios'].get(name)
+        if base_result is None:
+            continue
+        for metric, worse_if_higher in (('throughput_rps', False), ('p50_ms', True), ('p99_ms', True),
+                                        ('peak_rss_mb', True)):
+            before, after = base_result.get(metric), head_result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            values = ''.join(f"{run['scenarios'].get(name, {}).get(metric, '-')!s:>20}" for run in runs)
+            flag = ''
+            if metric != 'peak_rss_mb' and (change if worse_if_higher else -change) > threshold:
+                flag = '  REGRESSION'
+                regressions.append({'scenario': name, 'metric': metric, 'before': before, 'after': after,
+                                    'change_pct': round(change, 1)})
+            print(f"{name:>9}  {metric:<14}{values}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        type=lambda value: [name for name in value.split(',') if name])
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--seed-files', type=int, default=50, help='files per user')
+    parser.add_argument('--file-size', type=int, default=256 * 1024)
+    parser.add_argument('--requests', type=int, default=200, help='per scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--server', choices=('sync', 'asgi'), default='sync')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--database-url', help='defaults to a fresh SQLite file per run')
+    parser.add_argument('--minio-endpoint', help='a local MinIO instead of the stand-in')
+    parser.add_argument('--request-timeout', type=float, default=120)
+    parser.add_argument('--compare', nargs='+', metavar='REV')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=20, help='regression threshold, percent')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help="show the server's log")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.seed_files < 1 and {'download', 'move'} & set(args.scenarios):
+        parser.error('download and move need --seed-files of at least 1')
+
+    standin = None
+    minio_endpoint = args.minio_endpoint
+    if not minio_endpoint:
+        minio_port = free_port()
+        standin = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARKS, 'minio_standin.py'), '--port', str(minio_port)], cwd=BACKEND
+        )
+        minio_endpoint = f'127.0.0.1:{minio_port}'
+    try:
+        if standin:
+            asyncio.run(wait_for(f'http://{minio_endpoint}/bench?location'))
+        if args.compare:
+            runs = [run_revision(revision, minio_endpoint, args) for revision in args.compare]
+        else:
+            runs = [run_revision('.', minio_endpoint, args)]
+    finally:
+        if standin:
+            standin.terminate()
+            standin.wait()
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            saved = json.load(baseline)
+        # A single run, or the last run of a comparison
+        runs.insert(0, saved['runs'][-1] if 'runs' in saved else saved)
+    regressions = compare(runs, args.threshold) if len(runs) > 1 else []
+
+    if args.output:
+        result = runs[0] if len(runs) == 1 else {'runs': runs, 'threshold': args.threshold, 'regressions': regressions}
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Load test: concurrent downloads under sync gunicorn vs the ASGI mode.
+
+Starts the MinIO stand-in (benchmarks/minio_standin.py) with a per-chunk
+delay so every transfer takes a while, then for each mode starts a server
+on a fresh SQLite database, uploads --files files through it and runs
+--requests downloads at --concurrency. A probe hits /api/test throughout
+to show how responsive the server stays for everything else.
+
+  sync  gunicorn app:app with --sync-workers sync workers
+  asgi  uvicorn asgi:app with one worker
+
+Run from backend/:  python benchmarks/bench_asgi.py [--concurrency 100] [--requests 200]
+Needs aiohttp and uvicorn (requirements-asgi.txt).
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+
+async def run_load(base, args):
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        async with session.post(f'{base}/api/auth/register', json={
+            'email': 'bench@example.com', 'name': 'Bench', 'password': 'password'
+        }) as response:
+            token = (await response.json())['token']
+        headers = {'Authorization': f'Bearer {token}'}
+
+        file_ids = []
+        payload = os.urandom(args.size)
+        for i in range(args.files):
+            form = aiohttp.FormData()
+            form.add_field('folder_type', 'documents')
+            form.add_field('file', payload, filename=f'file_{i}.bin')
+            async with session.post(f'{base}/api/files/upload', data=form, headers=headers) as response:
+                file_ids.append((await response.json())['id'])
+
+        latencies, probes, failures = [], [], 0
+        semaphore = asyncio.Semaphore(args.concurrency)
+        done = asyncio.Event()
+
+        async def download():
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                url = f'{base}/api/files/{random.choice(file_ids)}/download'
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        body = await response.read()
+                        if response.status != 200 or len(body) != args.size:
+                            failures += 1
+                            return
+                except aiohttp.ClientError:
+                    failures += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                async with session.get(f'{base}/api/test') as response:
+                    await response.read()
+                probes.append(time.perf_counter() - started)
+                await asyncio.sleep(0.05)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(download() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    return {
+        'downloads_per_s': round(len(latencies) / elapsed, 1),
+        'mb_per_s': round(len(latencies) * args.size / elapsed / 1e6, 1),
+        'failures': failures,
+        'download_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'download_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'probe_p50_ms': round(percentile(probes, 50) * 1000, 1),
+        'probe_p99_ms': round(percentile(probes, 99) * 1000, 1),
+        'elapsed_s': round(elapsed, 2)
+    }
+
+
+def server_command(mode, port, args):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '-w', str(args.sync_workers),
+                '-b', f'127.0.0.1:{port}', '--timeout', '300', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--size', type=int, default=1024 * 1024)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--sync-workers', type=int, default=4)
+    parser.add_argument('--chunk-delay', type=float, default=0.02)
+    parser.add_argument('--modes', default='sync,asgi')
+    args = parser.parse_args()
+
+    minio_port = free_port()
+    standin = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND, 'benchmarks', 'minio_standin.py'),
+         '--port', str(minio_port), '--chunk-delay', str(args.chunk_delay)],
+        cwd=BACKEND
+    )
+    print(f"{args.requests} downloads of {args.size} bytes at concurrency {args.concurrency}, "
+          f"storage chunk delay {args.chunk_delay}s")
+    try:
+        asyncio.run(wait_for(f'http://127.0.0.1:{minio_port}/bench?location'))
+        for mode in args.modes.split(','):
+            port = free_port()
+            env = dict(
+                os.environ,
+                MINIO_ENDPOINT=f'127.0.0.1:{minio_port}',
+                DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+                DB_CREATE_ALL='true',
+                DEVICE_REGISTRY_URL='memory://',
+                PASSWORD_HASH_WORKERS='0'
+            )
+            server = subprocess.Popen(
+                server_command(mode, port, args), cwd=BACKEND, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                base = f'http://127.0.0.1:{port}'
+                asyncio.run(wait_for(f'{base}/api/test'))
+                result = asyncio.run(run_load(base, args))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{mode:>5}: " + ', '.join(f"{key}={value}" for key, value in result.items()))
+    finally:
+        standin.terminate()
+        standin.wait()
+
+
+if __name__ == '__main__':
+    main()
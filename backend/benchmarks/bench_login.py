@@ -0,0 +1,139 @@
+"""Benchmark: login bursts against concurrent file listing latency.
+
+A thread pool of --server-workers threads plays the part of sync server
+workers. A burst of logins and a stream of file listings are queued on it
+at the same time; listing latency includes the wait for a free worker.
+Each hashing mode runs in its own subprocess so Config picks up its
+settings:
+
+  inline  PASSWORD_HASH_WORKERS=0 with an unbounded queue (the old behaviour)
+  pool    PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_QUEUE=2 (429 beyond that)
+
+Run from backend/:  python benchmarks/bench_login.py [--logins 64] [--listings 200]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = {
+    'inline': {'PASSWORD_HASH_WORKERS': '0', 'PASSWORD_HASH_QUEUE': '100000'},
+    'pool': {'PASSWORD_HASH_WORKERS': '2', 'PASSWORD_HASH_QUEUE': '2'},
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_mode(args):
+    from config import Config
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from models import db, File, User
+    from datetime import datetime
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com', name='Bench')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+        db.session.execute(File.__table__.insert(), [
+            {
+                'id': str(uuid.uuid4()),
+                'filename': f'file_{i}.txt',
+                'title': f'File {i}',
+                'folder_type': 'documents',
+                'size': i,
+                'device_name': 'Bench',
+                'created_at': datetime(2025, 1, 1),
+                'user_id': user.id
+            }
+            for i in range(100)
+        ])
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+
+    client = app.test_client()
+
+    def login():
+        response = client.post('/api/auth/login', json={'email': 'bench@example.com', 'password': 'password'})
+        return 'login', response.status_code, time.perf_counter()
+
+    def listing(queued):
+        response = client.get('/api/files', headers={'Authorization': f'Bearer {token}'})
+        return 'listing', response.status_code, time.perf_counter() - queued
+
+    # Warm up the hashing pool and the user cache
+    login()
+    listing(time.perf_counter())
+    time.sleep(0.5)
+
+    results = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.server_workers) as workers:
+        futures = [workers.submit(login) for _ in range(args.logins)]
+        for _ in range(args.listings):
+            futures.append(workers.submit(listing, time.perf_counter()))
+            time.sleep(args.listing_interval)
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    logins = [r for r in results if r[0] == 'login']
+    listings = [r[2] * 1000 for r in results if r[0] == 'listing']
+    ok = [r for r in logins if r[1] == 200]
+    login_time = max(r[2] for r in ok) - started if ok else 0.0
+    return {
+        'logins_ok': len(ok),
+        'logins_rejected': sum(1 for r in logins if r[1] == 429),
+        'login_throughput': round(len(ok) / login_time, 1) if login_time else 0.0,
+        'listing_p50_ms': round(percentile(listings, 50), 1),
+        'listing_p99_ms': round(percentile(listings, 99), 1),
+        'elapsed_s': round(elapsed, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--listings', type=int, default=200)
+    parser.add_argument('--listing-interval', type=float, default=0.005)
+    parser.add_argument('--server-workers', type=int, default=8)
+    parser.add_argument('--mode', choices=sorted(MODES))
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    print(f"{args.logins} logins + {args.listings} listings on {args.server_workers} server workers")
+    for mode, env in MODES.items():
+        # Devices go to memory so SQLite write locks don't skew the numbers
+        child_env = dict(os.environ, MINIO_ENDPOINT='', DEVICE_REGISTRY_URL='memory://', **env)
+        child_env.pop('DATABASE_URL', None)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--mode', mode] + sys.argv[1:],
+            env=child_env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>7}: " + ', '.join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Microbenchmark: File listing serialization, ORM dicts + jsonify vs the
+Core-select row serializer in serializers.py.
+
+Run from backend/:  python benchmarks/bench_serializers.py [rows ...]
+Defaults to 10000 and 100000 rows in an in-memory SQLite database.
+"""
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from models import db, File, User
+from serializers import file_select, iter_json_array
+
+
+def legacy_listing(user_id):
+    files = File.query.filter_by(user_id=user_id).all()
+    result = []
+    for f in files:
+        result.append({
+            'id': f.id,
+            'filename': f.filename,
+            'title': f.title,
+            'description': f.description or '',
+            'folder_type': f.folder_type,
+            'size': f.size or 0,
+            'device_name': f.device_name or 'Unknown Device',
+            'url': f.cloudinary_url or '',
+            'created_at': f.created_at.isoformat() if f.created_at else None
+        })
+    return jsonify(result).get_data()
+
+
+def row_listing(user_id):
+    rows = db.session.execute(file_select(File.user_id == user_id)).all()
+    return ''.join(iter_json_array(rows)).encode()
+
+
+def seed(count):
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(id=1, email='bench@example.com', name='Bench', password_hash='x'))
+    start = datetime(2025, 1, 1)
+    folders = ['documents', 'music', 'videos', 'images', 'archives']
+    db.session.execute(File.__table__.insert(), [
+        {
+            'id': str(uuid.uuid4()),
+            'filename': f'file_{i}.bin',
+            'title': f'File {i}',
+            'description': 'benchmark file' if i % 3 else None,
+            'folder_type': folders[i % len(folders)],
+            'size': i * 1024,
+            'device_name': 'Bench Laptop',
+            'cloudinary_url': f'http://localhost:9000/synchub-files/documents/{i}',
+            'created_at': start + timedelta(seconds=i // 4),
+            'user_id': 1,
+        }
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def best_of(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        body = func(1)
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(body)
+
+
+def main(sizes):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        print(f"{'rows':>8}  {'legacy (s)':>10}  {'rows (s)':>10}  {'speedup':>7}  {'bytes':>10}")
+        for count in sizes:
+            seed(count)
+            legacy_time, legacy_bytes = best_of(legacy_listing)
+            row_time, row_bytes = best_of(row_listing)
+            print(f"{count:>8}  {legacy_time:>10.3f}  {row_time:>10.3f}  "
+                  f"{legacy_time / row_time:>6.1f}x  {row_bytes:>10}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,125 @@
+"""Contract check of the device registry backends: upsert, bulk heartbeats,
+TTL expiry, per-user listing and removal, run against each backend.
+
+The Redis backend runs against the in-process stand-in
+(benchmarks/redis_standin.py) unless --redis-url points at a real server;
+the SQL backend uses an in-memory SQLite database.
+
+Run from backend/:  python benchmarks/check_device_registry.py [--backends memory,sql,redis]
+Needs redis (the redis-py client) for the Redis backend.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from models import db, User
+from services.device_registry import MemoryDeviceRegistry, RedisDeviceRegistry, SQLDeviceRegistry
+
+TTL = 1
+BACKENDS = ('memory', 'sql', 'redis')
+
+
+def check(registry):
+    """Run the checks, returning the failures as messages."""
+    failures = []
+
+    def expect(name, actual, expected):
+        if actual != expected:
+            failures.append(f"{name}: expected {expected!r}, got {actual!r}")
+
+    first = registry.upsert(1, 'laptop', name='Laptop', type='laptop', ip_address='10.0.0.1')
+    expect('new device', (first['name'], first['type'], first['ip_address']), ('Laptop', 'laptop', '10.0.0.1'))
+    later = first['last_seen'] + timedelta(milliseconds=100)
+    second = registry.upsert(1, 'laptop', last_seen=later, ip_address='10.0.0.2')
+    expect('update keeps fields', second['name'], 'Laptop')
+    expect('update sets fields', second['ip_address'], '10.0.0.2')
+    expect('update keeps registration', second['registered_at'], first['registered_at'])
+    expect('update moves last_seen', second['last_seen'], later)
+    stale = registry.upsert(1, 'laptop', last_seen=first['last_seen'])
+    expect('older heartbeat keeps last_seen', stale['last_seen'], later)
+
+    registry.upsert(1, 'phone', name='Phone', type='phone')
+    registry.upsert(2, 'laptop', name='Other laptop')
+    expect('listing of user 1', [d['device_id'] for d in registry.list_devices(1)], ['laptop', 'phone'])
+    expect('listing of user 2', [d['name'] for d in registry.list_devices(2)], ['Other laptop'])
+    expect('listing of user 3', registry.list_devices(3), [])
+
+    now = datetime.utcnow()
+    registry.touch_many({
+        (1, 'phone'): {'last_seen': now, 'ip_address': '10.0.0.3'},
+        (3, 'tablet'): {'last_seen': now, 'name': 'Tablet'},
+    })
+    phone = {d['device_id']: d for d in registry.list_devices(1)}.get('phone') or {}
+    expect('bulk heartbeat updates', phone.get('ip_address'), '10.0.0.3')
+    expect('bulk heartbeat creates', [d['name'] for d in registry.list_devices(3)], ['Tablet'])
+
+    registry.remove(1, 'phone')
+    expect('removal', [d['device_id'] for d in registry.list_devices(1)], ['laptop'])
+
+    # Keep user 2's laptop alive past the TTL; everything else expires
+    time.sleep(TTL * 0.6)
+    registry.upsert(2, 'laptop')
+    time.sleep(TTL * 0.6)
+    expect('expired devices are not listed', registry.list_devices(1), [])
+    expect('seen devices outlive the TTL', [d['device_id'] for d in registry.list_devices(2)], ['laptop'])
+    revived = registry.upsert(1, 'laptop')
+    expect('expired device registers anew', revived['name'], 'Unknown Device')
+    expect('expired device gets a new registration', revived['registered_at'] > first['registered_at'], True)
+    return failures
+
+
+def sql_registry():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    context = app.app_context()
+    context.push()
+    db.create_all()
+    for user_id in (1, 2, 3):
+        db.session.add(User(id=user_id, email=f'user{user_id}@example.com', name='Check', password_hash='x'))
+    db.session.commit()
+    return SQLDeviceRegistry(ttl_seconds=TTL)
+
+
+def redis_registry(url):
+    import redis
+
+    if url is None:
+        from redis_standin import RedisStandin
+
+        url = RedisStandin().start().url
+    client = redis.Redis.from_url(url)
+    client.flushall()
+    return RedisDeviceRegistry(client, ttl_seconds=TTL, namespace='check')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--redis-url', help='a Redis server to use instead of the stand-in (it is flushed)')
+    args = parser.parse_args()
+
+    failed = False
+    for backend in args.backends.split(','):
+        if backend == 'memory':
+            registry = MemoryDeviceRegistry(ttl_seconds=TTL)
+        elif backend == 'sql':
+            registry = sql_registry()
+        else:
+            registry = redis_registry(args.redis_url)
+        failures = check(registry)
+        print(f"{backend:8} {'ok' if not failures else 'FAILED'}")
+        for failure in failures:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""In-memory stand-in for MinIO, for load tests without a real server.
+
+Speaks the S3 subset the app uses through minio-py and presigned URLs:
+bucket location/exists/create, object PUT/GET (ranged)/HEAD/DELETE,
+server-side copy and multipart uploads (including part copies and part
+listings).
+Signatures are not checked. --chunk-delay sleeps between 64 KiB chunks
+of every GET, to make transfers take as long as they do on slow links.
+
+Run from backend/:  python benchmarks/minio_standin.py --port 9100 [--chunk-delay 0.01]
+Needs aiohttp.
+"""
+import argparse
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib.parse import unquote
+from aiohttp import web
+
+CHUNK_SIZE = 64 * 1024
+S3_NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+def _iso8601(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class Obj:
+    def __init__(self, data, headers):
+        self.data = data
+        self.etag = hashlib.md5(data).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.content_type = headers.get('Content-Type', 'application/octet-stream')
+        self.metadata = {k.lower(): v for k, v in headers.items() if k.lower().startswith('x-amz-meta-')}
+
+
+class Store:
+    def __init__(self, chunk_delay=0.0):
+        self.chunk_delay = chunk_delay
+        self.objects = {}
+        self.uploads = {}
+
+    def _xml(self, body, status=200):
+        return web.Response(
+            status=status, content_type='application/xml',
+            text=f'<?xml version="1.0" encoding="UTF-8"?>{body}'
+        )
+
+    def _not_found(self, key):
+        return self._xml(
+            f'<Error><Code>NoSuchKey</Code><Message>Not found</Message><Key>{key}</Key></Error>', 404
+        )
+
+    def _copy_source(self, request):
+        source = unquote(request.headers['x-amz-copy-source']).lstrip('/')
+        _, key = source.split('/', 1)
+        obj = self.objects.get(key.split('?', 1)[0])
+        if obj is None:
+            return None, None
+        data = obj.data
+        source_range = request.headers.get('x-amz-copy-source-range')
+        if source_range:
+            start, end = source_range.split('=', 1)[1].split('-')
+            data = data[int(start):int(end) + 1]
+        return obj, data
+
+    async def handle(self, request):
+        bucket, _, key = request.path.lstrip('/').partition('/')
+        key = unquote(key)
+        query = request.query
+        method = request.method
+
+        if not key:
+            if 'location' in query:
+                return self._xml(f'<LocationConstraint xmlns="{S3_NS}"></LocationConstraint>')
+            return web.Response(status=200)
+
+        if method == 'POST' and 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = {'key': key, 'headers': dict(request.headers), 'parts': {}}
+            return self._xml(
+                f'<InitiateMultipartUploadResult xmlns="{S3_NS}"><Bucket>{bucket}</Bucket>'
+                f'<Key>{key}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>'
+            )
+        if method == 'POST' and 'uploadId' in query:
+            upload = self.uploads.pop(query['uploadId'])
+            await request.read()
+            data = b''.join(upload['parts'][n] for n in sorted(upload['parts']))
+            obj = self.objects[key] = Obj(data, upload['headers'])
+            return self._xml(
+                f'<CompleteMultipartUploadResult xmlns="{S3_NS}"><Location>/{bucket}/{key}</Location>'
+                f'<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>"{obj.etag}"</ETag>'
+                f'</CompleteMultipartUploadResult>'
+            )
+        if method == 'DELETE' and 'uploadId' in query:
+            self.uploads.pop(query['uploadId'], None)
+            return web.Response(status=204)
+
+        if method == 'GET' and 'uploadId' in query:
+            upload = self.uploads.get(query['uploadId'])
+            if upload is None:
+                return self._xml('<Error><Code>NoSuchUpload</Code></Error>', 404)
+            now = _iso8601(datetime.now(timezone.utc))
+            parts = ''.join(
+                f'<Part><PartNumber>{n}</PartNumber><ETag>"{hashlib.md5(data).hexdigest()}"</ETag>'
+                f'<Size>{len(data)}</Size><LastModified>{now}</LastModified></Part>'
+                for n, data in sorted(upload['parts'].items())
+            )
+            return self._xml(
+                f'<ListPartsResult xmlns="{S3_NS}"><Bucket>{bucket}</Bucket><Key>{key}</Key>'
+                f'<UploadId>{query["uploadId"]}</UploadId><IsTruncated>false</IsTruncated>{parts}</ListPartsResult>'
+            )
+        if method == 'PUT' and 'uploadId' in query:
+            upload = self.uploads.get(query['uploadId'])
+            if upload is None:
+                return self._xml('<Error><Code>NoSuchUpload</Code></Error>', 404)
+            if 'x-amz-copy-source' in request.headers:
+                _, data = self._copy_source(request)
+                if data is None:
+                    return self._not_found(key)
+                upload['parts'][int(query['partNumber'])] = data
+                return self._xml(
+                    f'<CopyPartResult><ETag>"{hashlib.md5(data).hexdigest()}"</ETag>'
+                    f'<LastModified>{_iso8601(datetime.now(timezone.utc))}</LastModified></CopyPartResult>'
+                )
+            data = await request.read()
+            upload['parts'][int(query['partNumber'])] = data
+            return web.Response(headers={'ETag': f'"{hashlib.md5(data).hexdigest()}"'})
+
+        if method == 'PUT':
+            if 'x-amz-copy-source' in request.headers:
+                source, data = self._copy_source(request)
+                if data is None:
+                    return self._not_found(key)
+                headers = dict(request.headers)
+                if request.headers.get('x-amz-metadata-directive') != 'REPLACE':
+                    headers = dict(source.metadata, **{'Content-Type': source.content_type})
+                obj = self.objects[key] = Obj(data, headers)
+                return self._xml(
+                    f'<CopyObjectResult><ETag>"{obj.etag}"</ETag>'
+                    f'<LastModified>{_iso8601(obj.last_modified)}</LastModified></CopyObjectResult>'
+                )
+            obj = self.objects[key] = Obj(await request.read(), request.headers)
+            return web.Response(headers={'ETag': f'"{obj.etag}"'})
+
+        if method == 'DELETE':
+            self.objects.pop(key, None)
+            return web.Response(status=204)
+
+        obj = self.objects.get(key)
+        if obj is None:
+            return self._not_found(key) if method == 'GET' else web.Response(status=404)
+        headers = {
+            'ETag': f'"{obj.etag}"',
+            'Last-Modified': format_datetime(obj.last_modified, usegmt=True),
+            'Content-Type': obj.content_type,
+            'Accept-Ranges': 'bytes',
+            **obj.metadata
+        }
+        if method == 'HEAD':
+            headers['Content-Length'] = str(len(obj.data))
+            return web.Response(headers=headers)
+
+        data, status = obj.data, 200
+        byte_range = request.http_range
+        if request.headers.get('Range'):
+            start = byte_range.start or 0
+            stop = min(byte_range.stop or len(data), len(data))
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{len(data)}'
+            data, status = data[start:stop], 206
+        headers['Content-Length'] = str(len(data))
+
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        for offset in range(0, len(data), CHUNK_SIZE):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            await response.write(data[offset:offset + CHUNK_SIZE])
+        await response.write_eof()
+        return response
+
+
+def make_app(chunk_delay=0.0):
+    store = Store(chunk_delay)
+    app = web.Application(client_max_size=1024 ** 3)
+    app['store'] = store
+    app.router.add_route('*', '/{tail:.*}', store.handle)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='In-memory MinIO stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--chunk-delay', type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(make_app(args.chunk_delay), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
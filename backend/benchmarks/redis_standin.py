@@ -0,0 +1,288 @@
+"""In-process stand-in for Redis, for checks and load tests without a server.
+
+Speaks RESP2 and RESP3 for the commands the app's Redis backends use:
+strings with expiry (GET, SET EX/PX, MGET, DEL, EXPIRE, TTL), sorted sets
+(ZADD, ZREM, ZRANGE, ZREMRANGEBYSCORE), MULTI/EXEC pipelines and the
+connection handshake (HELLO, CLIENT, SELECT). Keys expire like in Redis,
+on access. Nothing is persisted.
+
+Run from backend/:  python benchmarks/redis_standin.py --port 6390
+or start it in a thread with RedisStandin().start() and use its url.
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+
+class CommandError(Exception):
+    pass
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}  # {key: time.monotonic() deadline}
+
+    def _live(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _get(self, key, kind):
+        if not self._live(key):
+            return None
+        if not isinstance(self.data[key], kind):
+            raise CommandError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return self.data[key]
+
+    def _set_expiry(self, key, seconds):
+        self.expires[key] = time.monotonic() + seconds
+
+    # Connection
+
+    def ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def client(self, *args):
+        return 'OK'
+
+    def select(self, db):
+        return 'OK'
+
+    def flushall(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return 'OK'
+
+    # Keys and strings
+
+    def get(self, key):
+        return self._get(key, bytes)
+
+    def mget(self, *keys):
+        return [self.data[key] if self._live(key) and isinstance(self.data[key], bytes) else None
+                for key in keys]
+
+    def set(self, key, value, *options):
+        options = [option.decode().upper() for option in options]
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for i, option in enumerate(options):
+            if option == 'EX':
+                self._set_expiry(key, int(options[i + 1]))
+            elif option == 'PX':
+                self._set_expiry(key, int(options[i + 1]) / 1000)
+        return 'OK'
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key):
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def expire(self, key, seconds):
+        if not self._live(key):
+            return 0
+        self._set_expiry(key, int(seconds))
+        return 1
+
+    def ttl(self, key):
+        if not self._live(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return max(0, round(self.expires[key] - time.monotonic()))
+
+    # Sorted sets: {member: score}
+
+    def zadd(self, key, *args):
+        zset = self._get(key, dict)
+        if zset is None:
+            zset = self.data[key] = {}
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def zrem(self, key, *members):
+        zset = self._get(key, dict) or {}
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def zrange(self, key, start, stop, *options):
+        zset = self._get(key, dict) or {}
+        members = sorted(zset, key=lambda member: (zset[member], member))
+        start, stop = int(start), int(stop)
+        stop = len(members) + stop if stop < 0 else stop
+        selected = members[max(0, len(members) + start if start < 0 else start):stop + 1]
+        if any(option.upper() == b'WITHSCORES' for option in options):
+            return [item for member in selected for item in (member, repr(zset[member]).encode())]
+        return selected
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self._get(key, dict) or {}
+        low, high = _score(low), _score(high)
+        doomed = [member for member, score in zset.items() if low <= score <= high]
+        for member in doomed:
+            del zset[member]
+        return len(doomed)
+
+
+def _score(value):
+    value = value.decode().lower()
+    return {'-inf': float('-inf'), '+inf': float('inf'), 'inf': float('inf')}.get(value) or float(value)
+
+
+COMMANDS = {
+    'PING': 'ping', 'CLIENT': 'client', 'SELECT': 'select', 'FLUSHALL': 'flushall',
+    'GET': 'get', 'MGET': 'mget', 'SET': 'set', 'DEL': 'delete', 'EXPIRE': 'expire', 'TTL': 'ttl',
+    'ZADD': 'zadd', 'ZREM': 'zrem', 'ZRANGE': 'zrange', 'ZREMRANGEBYSCORE': 'zremrangebyscore',
+}
+
+
+def encode(value, protocol=2):
+    if isinstance(value, CommandError):
+        return f"-{value}\r\n".encode()
+    if value is None:
+        return b'_\r\n' if protocol == 3 else b'$-1\r\n'
+    if isinstance(value, int):
+        return f":{int(value)}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, dict):
+        items = [item for pair in value.items() for item in pair]
+        if protocol == 3:
+            return b'%%%d\r\n' % len(value) + b''.join(encode(item, protocol) for item in items)
+        value = items
+    return b'*%d\r\n' % len(value) + b''.join(encode(item, protocol) for item in value)
+
+
+def hello(protocol):
+    return {
+        'server': 'redis', 'version': '7.2.0', 'proto': protocol, 'id': 1,
+        'mode': 'standalone', 'role': 'master', 'modules': [],
+    }
+
+
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # Inline command, as sent by telnet or redis-cli pings
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+class RedisStandin:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.store = Store()
+        self.loop = None
+        self.server = None
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    def execute(self, args):
+        name = args[0].decode().upper()
+        if name not in COMMANDS:
+            return CommandError(f"ERR unknown command '{name}'")
+        try:
+            return getattr(self.store, COMMANDS[name])(*args[1:])
+        except CommandError as e:
+            return e
+        except (TypeError, ValueError, IndexError):
+            return CommandError(f"ERR syntax error in '{name}'")
+
+    async def handle(self, reader, writer):
+        queued, protocol = None, 2
+        try:
+            while (args := await read_command(reader)) is not None:
+                if not args:
+                    continue
+                name = args[0].decode().upper()
+                if name == 'HELLO':
+                    # Optional protocol version, then AUTH/SETNAME options
+                    if len(args) > 1 and args[1] not in (b'2', b'3'):
+                        reply = CommandError('NOPROTO unsupported protocol version')
+                    else:
+                        protocol = int(args[1]) if len(args) > 1 else protocol
+                        reply = hello(protocol)
+                elif name == 'MULTI':
+                    queued, reply = [], 'OK'
+                elif name == 'EXEC':
+                    reply = [self.execute(command) for command in queued] if queued is not None else \
+                        CommandError('ERR EXEC without MULTI')
+                    queued = None
+                elif name == 'DISCARD':
+                    queued, reply = None, 'OK'
+                elif queued is not None:
+                    queued.append(args)
+                    reply = 'QUEUED'
+                else:
+                    reply = self.execute(args)
+                writer.write(encode(reply, protocol))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    def start(self):
+        """Serve on a background thread; returns self once listening."""
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.serve())
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True, name='redis-standin').start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    standin = RedisStandin(args.host, args.port)
+
+    async def run():
+        server = await standin.serve()
+        print(f"Redis stand-in listening on {standin.url}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
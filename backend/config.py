@@ -25,6 +25,9 @@ class Config:
     # Use SQLite for deployment if PostgreSQL fails
     if DATABASE_URL and 'postgresql' in DATABASE_URL:
         SQLALCHEMY_DATABASE_URI = DATABASE_URL
+    elif DATABASE_URL and DATABASE_URL.startswith('sqlite'):
+        # e.g. sqlite:////tmp/bench.db for throwaway databases
+        SQLALCHEMY_DATABASE_URI = DATABASE_URL
     else:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///synchub.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -32,7 +35,39 @@ class Config:
         'pool_pre_ping': True,
         'pool_recycle': 300,
     }
+    # Create missing tables at startup instead of running migrations
+    DB_CREATE_ALL = os.getenv('DB_CREATE_ALL', 'False').lower() == 'true'
     JWT_SECRET_KEY = os.getenv('JWT_SECRET', 'your-secret-key')
+    # Password hashing: any werkzeug method string. Hashes made with other
+    # parameters are upgraded on the user's next login. Hashing runs on
+    # PASSWORD_HASH_WORKERS processes (0 = inline) with at most
+    # PASSWORD_HASH_QUEUE calls waiting; beyond that requests get a 429.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 8))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+    PASSWORD_HASH_RETRY_AFTER = int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 1))
+    # Users resolved from JWT identities are cached per process
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+
+    # Logs go to stdout as one JSON object per line (LOG_FORMAT=text for
+    # terminals). Info and debug records are kept with probability
+    # LOG_SAMPLE_RATE, and a LOG_REQUEST_SAMPLE_RATE share of requests get an
+    # access log line; warnings, errors and requests slower than
+    # LOG_SLOW_REQUEST_MS are always logged.
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+    LOG_REQUEST_SAMPLE_RATE = float(os.getenv('LOG_REQUEST_SAMPLE_RATE', 0.01))
+    LOG_SLOW_REQUEST_MS = float(os.getenv('LOG_SLOW_REQUEST_MS', 1000))
+
+    # Request metrics (latency split into DB, storage and serialization
+    # time, bytes in and out, requests in flight) are served in the
+    # Prometheus text format at /metrics. They are kept per worker process.
+    # With METRICS_TOKEN set, scrapes need "Authorization: Bearer <token>".
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
     # MinIO Configuration
     MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', 'localhost:9000')
@@ -40,6 +75,165 @@ class Config:
     MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin')
     MINIO_BUCKET = os.getenv('MINIO_BUCKET', 'synchub-files')
     MINIO_SECURE = os.getenv('MINIO_SECURE', 'False').lower() == 'true'
+    # HTTP pool of the MinIO client, per worker process. Requests wait up to
+    # MINIO_POOL_TIMEOUT seconds for one of MINIO_POOL_SIZE connections
+    # instead of opening extra ones. Idempotent requests are retried
+    # MINIO_RETRIES times with exponential backoff (MINIO_RETRY_BACKOFF
+    # seconds, doubling) on connection errors, timeouts and 5xx answers.
+    MINIO_POOL_SIZE = int(os.getenv('MINIO_POOL_SIZE', 32))
+    MINIO_POOL_TIMEOUT = float(os.getenv('MINIO_POOL_TIMEOUT', 10))
+    MINIO_CONNECT_TIMEOUT = float(os.getenv('MINIO_CONNECT_TIMEOUT', 5))
+    MINIO_READ_TIMEOUT = float(os.getenv('MINIO_READ_TIMEOUT', 60))
+    MINIO_TCP_KEEPALIVE = os.getenv('MINIO_TCP_KEEPALIVE', 'True').lower() == 'true'
+    MINIO_RETRIES = int(os.getenv('MINIO_RETRIES', 3))
+    MINIO_RETRY_BACKOFF = float(os.getenv('MINIO_RETRY_BACKOFF', 0.2))
+    # After MINIO_BREAKER_THRESHOLD failed requests in a row, storage counts
+    # as down (storage calls fail at once and routes return their usual
+    # storage error) for MINIO_BREAKER_RESET seconds; then the next request
+    # to reach MinIO decides whether it is back. 0 disables this.
+    MINIO_BREAKER_THRESHOLD = int(os.getenv('MINIO_BREAKER_THRESHOLD', 5))
+    MINIO_BREAKER_RESET = float(os.getenv('MINIO_BREAKER_RESET', 30))
+    # Uploads are streamed to MinIO as multipart uploads of this part size
+    # (minimum 5 MiB); at most MINIO_UPLOAD_PARALLELISM + 1 parts are held
+    # in memory per upload.
+    MINIO_PART_SIZE = int(os.getenv('MINIO_PART_SIZE', 16 * 1024 * 1024))
+    MINIO_UPLOAD_PARALLELISM = int(os.getenv('MINIO_UPLOAD_PARALLELISM', 2))
+    # Downloads are relayed to the client in chunks of this size
+    MINIO_DOWNLOAD_CHUNK_SIZE = int(os.getenv('MINIO_DOWNLOAD_CHUNK_SIZE', 256 * 1024))
+    # Presigned URLs let clients move bytes to and from MinIO directly. They
+    # are valid for PRESIGNED_URL_EXPIRY seconds and signed for
+    # MINIO_PUBLIC_ENDPOINT, the address clients reach MinIO on, if that
+    # differs from MINIO_ENDPOINT. Direct uploads hand out at most
+    # PRESIGNED_PART_BATCH part URLs per request.
+    PRESIGNED_URL_EXPIRY = int(os.getenv('PRESIGNED_URL_EXPIRY', 15 * 60))
+    MINIO_PUBLIC_ENDPOINT = os.getenv('MINIO_PUBLIC_ENDPOINT', '')
+    MINIO_PUBLIC_SECURE = os.getenv('MINIO_PUBLIC_SECURE', str(MINIO_SECURE)).lower() == 'true'
+    PRESIGNED_PART_BATCH = int(os.getenv('PRESIGNED_PART_BATCH', 100))
+
+    # File listings are paginated; clients pass ?limit= up to the maximum
+    FILES_PAGE_SIZE = int(os.getenv('FILES_PAGE_SIZE', 100))
+    FILES_MAX_PAGE_SIZE = int(os.getenv('FILES_MAX_PAGE_SIZE', 1000))
+    # Search results come in pages too. Queries use their first
+    # SEARCH_MAX_TERMS words; value facets list the SEARCH_FACET_LIMIT
+    # most common values. Totals are counted up to SEARCH_COUNT_LIMIT.
+    SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 50))
+    SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', 200))
+    SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', 16))
+    SEARCH_FACET_LIMIT = int(os.getenv('SEARCH_FACET_LIMIT', 20))
+    SEARCH_COUNT_LIMIT = int(os.getenv('SEARCH_COUNT_LIMIT', 1000))
+
+    # Bucket listings read metadata in batches, stat'ing objects the listing
+    # returned without metadata this many at a time
+    MINIO_LIST_BATCH_SIZE = int(os.getenv('MINIO_LIST_BATCH_SIZE', 1000))
+    MINIO_STAT_CONCURRENCY = int(os.getenv('MINIO_STAT_CONCURRENCY', 16))
+
+    # Storage quota per user in bytes of file content (0 = unlimited); a
+    # user's storage_quota column overrides it. Usage is counted as files
+    # change; `flask reconcile-usage` re-checks the counts against the files
+    # table USAGE_RECONCILE_BATCH users at a time.
+    STORAGE_QUOTA = int(os.getenv('STORAGE_QUOTA', 0))
+    USAGE_RECONCILE_BATCH = int(os.getenv('USAGE_RECONCILE_BATCH', 500))
+
+    # `flask reconcile-storage` checks the bucket against the files table,
+    # RECONCILE_BATCH keys per run, continuing from where the last run
+    # stopped (every RECONCILE_INTERVAL seconds with --loop). Objects and
+    # rows younger than RECONCILE_GRACE seconds may belong to a transfer in
+    # progress and are left alone. The files table is read
+    # RECONCILE_PAGE_SIZE rows at a time.
+    RECONCILE_BATCH = int(os.getenv('RECONCILE_BATCH', 100000))
+    RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', 300))
+    RECONCILE_GRACE = int(os.getenv('RECONCILE_GRACE', 24 * 3600))
+    RECONCILE_PAGE_SIZE = int(os.getenv('RECONCILE_PAGE_SIZE', 1000))
+
+    # Content-addressed storage: identical uploads of a user share one object
+    STORAGE_DEDUP = os.getenv('STORAGE_DEDUP', 'False').lower() == 'true'
+    # Blobs nothing refers to any more are deleted by `flask sweep-blobs`
+    # once they have been unreferenced for BLOB_SWEEP_GRACE seconds
+    BLOB_SWEEP_GRACE = int(os.getenv('BLOB_SWEEP_GRACE', 3600))
+
+    # Compression at rest (opt-in): STORAGE_COMPRESSION=gzip, or zstd (needs
+    # the zstandard package, otherwise gzip). Per-file uploads are sniffed
+    # and stored compressed unless they are a packed format or a trial on
+    # the first COMPRESSION_SNIFF_SIZE bytes saves less than
+    # COMPRESSION_MIN_SAVINGS. COMPRESSION_LEVEL 0 means the codec default.
+    STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', 'off').lower()
+    COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 0))
+    COMPRESSION_SNIFF_SIZE = int(os.getenv('COMPRESSION_SNIFF_SIZE', 64 * 1024))
+    COMPRESSION_MIN_SAVINGS = float(os.getenv('COMPRESSION_MIN_SAVINGS', 0.1))
+
+    # Resumable uploads: chunks are PUT individually (all but the last at
+    # least 5 MiB) and sessions idle for UPLOAD_SESSION_TTL seconds are
+    # aborted by `flask abort-stale-uploads`
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 * 1024))
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 3600))
+
+    # Batch moves: server-side copies run this many at a time
+    MOVE_CONCURRENCY = int(os.getenv('MOVE_CONCURRENCY', 8))
+    MOVE_BATCH_LIMIT = int(os.getenv('MOVE_BATCH_LIMIT', 500))
+
+    # Device registry backend: sql:// (app database), memory:// (single
+    # process only) or a redis:// URL. Devices count as active for
+    # DEVICE_ACTIVE_SECONDS after their last heartbeat and are forgotten
+    # after DEVICE_TTL_SECONDS.
+    DEVICE_REGISTRY_URL = os.getenv('DEVICE_REGISTRY_URL', 'sql://')
+    DEVICE_ACTIVE_SECONDS = int(os.getenv('DEVICE_ACTIVE_SECONDS', 300))
+    DEVICE_TTL_SECONDS = int(os.getenv('DEVICE_TTL_SECONDS', 30 * 24 * 3600))
+    # Heartbeats are buffered and written to the registry in one batch every
+    # HEARTBEAT_FLUSH_INTERVAL seconds, or once this many devices are pending
+    HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', 5))
+    HEARTBEAT_MAX_PENDING = int(os.getenv('HEARTBEAT_MAX_PENDING', 5000))
+
+    # Block-level delta re-uploads: clients diff against block signatures of
+    # the stored version and send only changed blocks
+    DELTA_BLOCK_SIZE = int(os.getenv('DELTA_BLOCK_SIZE', 64 * 1024))
+    DELTA_MIN_BLOCK_SIZE = int(os.getenv('DELTA_MIN_BLOCK_SIZE', 4 * 1024))
+    DELTA_MAX_BLOCK_SIZE = int(os.getenv('DELTA_MAX_BLOCK_SIZE', 8 * 1024 * 1024))
+    # Signatures are cached per object version (ETag) and block size, up to
+    # this many blocks' worth in each worker
+    DELTA_SIGNATURE_CACHE_BLOCKS = int(os.getenv('DELTA_SIGNATURE_CACHE_BLOCKS', 200000))
+
+    # Delta sync: /api/sync/changes pages through each user's change journal.
+    # `flask compact-sync-journal` drops superseded events older than
+    # SYNC_JOURNAL_RETENTION seconds and delete events older than
+    # SYNC_TOMBSTONE_RETENTION; clients whose cursor predates removed
+    # deletes are told to do a full re-list.
+    SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+    SYNC_MAX_PAGE_SIZE = int(os.getenv('SYNC_MAX_PAGE_SIZE', 5000))
+    SYNC_JOURNAL_RETENTION = int(os.getenv('SYNC_JOURNAL_RETENTION', 7 * 24 * 3600))
+    SYNC_TOMBSTONE_RETENTION = int(os.getenv('SYNC_TOMBSTONE_RETENTION', 90 * 24 * 3600))
+
+    # Server-sent events: memory:// reaches clients on the same worker only,
+    # a redis:// URL fans events out to all workers. Idle streams get a
+    # keep-alive comment every EVENTS_KEEPALIVE seconds.
+    EVENTS_BROKER_URL = os.getenv('EVENTS_BROKER_URL', 'memory://')
+    EVENTS_KEEPALIVE = float(os.getenv('EVENTS_KEEPALIVE', 15))
+    EVENTS_MAX_QUEUE = int(os.getenv('EVENTS_MAX_QUEUE', 1000))
+
+    # ASGI mode (uvicorn asgi:app): file transfers share one aiohttp pool of
+    # this many MinIO connections, and form uploads are forwarded in parts
+    # of ASGI_UPLOAD_PART_SIZE (minimum 5 MiB), the most held per upload
+    ASGI_STORAGE_CONNECTIONS = int(os.getenv('ASGI_STORAGE_CONNECTIONS', 1000))
+    ASGI_UPLOAD_PART_SIZE = int(os.getenv('ASGI_UPLOAD_PART_SIZE', 5 * 1024 * 1024))
+    ASGI_MAX_FIELD_SIZE = int(os.getenv('ASGI_MAX_FIELD_SIZE', 500 * 1024))
+    # Threads running the Flask app for every other request; each open
+    # /api/events/stream connection holds one
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 32))
+
+    # Previews: image thumbnails (Pillow, or ffmpeg) and video posters
+    # (ffmpeg) are rendered after upload on THUMBNAIL_WORKERS background
+    # threads, one JPEG per THUMBNAIL_SIZES bounding box. Jobs beyond
+    # THUMBNAIL_QUEUE stay pending for `flask generate-thumbnails`; images
+    # over THUMBNAIL_MAX_SOURCE_SIZE bytes get no preview.
+    THUMBNAILS_ENABLED = os.getenv('THUMBNAILS_ENABLED', 'True').lower() == 'true'
+    THUMBNAIL_SIZES = sorted(int(size) for size in os.getenv('THUMBNAIL_SIZES', '128,512').split(','))
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+    THUMBNAIL_QUEUE = int(os.getenv('THUMBNAIL_QUEUE', 64))
+    THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 80))
+    THUMBNAIL_MAX_SOURCE_SIZE = int(os.getenv('THUMBNAIL_MAX_SOURCE_SIZE', 50 * 1024 * 1024))
+    THUMBNAIL_FFMPEG = os.getenv('THUMBNAIL_FFMPEG', 'ffmpeg')
+    THUMBNAIL_TIMEOUT = int(os.getenv('THUMBNAIL_TIMEOUT', 60))
+    THUMBNAIL_CACHE_MAX_AGE = int(os.getenv('THUMBNAIL_CACHE_MAX_AGE', 365 * 24 * 3600))
 
     # Frontend URL
     FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
@@ -1,37 +1,79 @@
+import uuid
 from datetime import datetime
+from config import Config
+from services.device_registry import create_device_registry
+from services.heartbeat import HeartbeatBuffer
+from services.events import publish
+from services.log import get_logger
 
-# Track active devices in real-time
-active_devices = {}  # {device_name: {'last_seen': datetime, 'ip': str, 'status': 'active'}}
+log = get_logger('devices')
 
-def register_device(device_name, device_type, ip_address, user_email):
+# Devices are tracked per (user_id, device_id) in the configured backend
+registry = create_device_registry()
+# Heartbeats are coalesced in memory and written to the registry in batches
+heartbeats = HeartbeatBuffer(registry)
+
+def device_id_for(user_id, device_name):
+    """Stable id for clients that don't send their own device_id"""
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"synchub:{user_id}:{device_name}").hex[:16]
+
+def register_device(user_id, device_id, device_name, device_type, ip_address, user_email=None):
     """Register a device as active"""
-    active_devices[device_name] = {
-        'last_seen': datetime.utcnow(),
-        'ip': ip_address,
+    record = registry.upsert(
+        user_id,
+        device_id,
+        name=device_name,
+        type=device_type,
+        ip_address=ip_address,
+        user_email=user_email
+    )
+    log.debug('Device marked active', user_id=user_id, device_id=device_id, device_name=device_name)
+    publish(user_id, 'device', {
+        'id': device_id,
+        'name': record['name'],
+        'type': record['type'],
         'status': 'active',
+        'last_seen': record['last_seen'].isoformat()
+    })
+    return record
+
+def record_heartbeat(user_id, device_id, device_name, device_type, ip_address):
+    """Mark a device as seen; written to the registry on the next flush"""
+    last_seen = datetime.utcnow()
+    heartbeats.record(
+        user_id,
+        device_id,
+        last_seen=last_seen,
+        name=device_name,
+        type=device_type,
+        ip_address=ip_address
+    )
+    publish(user_id, 'device', {
+        'id': device_id,
+        'name': device_name,
         'type': device_type,
-        'user_email': user_email
-    }
-    print(f"Device {device_name} marked as ACTIVE")
+        'status': 'active',
+        'last_seen': last_seen.isoformat()
+    })
 
-def get_devices():
-    """Get list of all devices with their status"""
+def get_devices(user_id):
+    """Get list of a user's devices with their status"""
     device_list = []
     current_time = datetime.utcnow()
     
-    for i, (device_name, device_info) in enumerate(active_devices.items()):
+    for i, device_info in enumerate(registry.list_devices(user_id)):
         time_diff = (current_time - device_info['last_seen']).total_seconds()
-        status = 'active' if time_diff < 300 else 'inactive'  # 5 minutes threshold
+        status = 'active' if time_diff < Config.DEVICE_ACTIVE_SECONDS else 'inactive'
         
         device_list.append({
-            'id': device_info.get('db_id', i + 1),
-            'name': device_name,
-            'type': device_info.get('type', 'laptop'),
+            'id': device_info['device_id'],
+            'name': device_info['name'],
+            'type': device_info.get('type') or 'laptop',
             'status': status,
             'last_seen': device_info['last_seen'].isoformat(),
             'is_main_device': i == 0,
-            'user_name': device_info.get('user_email', 'user@example.com').split('@')[0],
-            'ip_address': device_info.get('ip', '127.0.0.1')
+            'user_name': (device_info.get('user_email') or 'user@example.com').split('@')[0],
+            'ip_address': device_info.get('ip_address') or '127.0.0.1'
         })
     
     # Default device if none exist
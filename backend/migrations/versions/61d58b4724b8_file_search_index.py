@@ -0,0 +1,67 @@
+"""file search index
+
+Revision ID: 61d58b4724b8
+Revises: d6d9b2001727
+Create Date: 2026-10-18 09:22:26.408653
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '61d58b4724b8'
+down_revision = 'd6d9b2001727'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Full-text index over filename, title and description, kept current by
+    # the database itself (see services/search.py)
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # Rewrites the files table once to fill the column
+        op.execute(
+            "ALTER TABLE files ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', regexp_replace(coalesce(filename, ''), '[^[:alnum:]]+', ' ', 'g')), 'A') || "
+            "setweight(to_tsvector('simple', regexp_replace(coalesce(title, ''), '[^[:alnum:]]+', ' ', 'g')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+            ") STORED"
+        )
+        op.execute("CREATE INDEX ix_files_search ON files USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE files_fts USING fts5("
+            "filename, title, description, content='files', content_rowid='rowid', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        op.execute(
+            "CREATE TRIGGER files_fts_insert AFTER INSERT ON files BEGIN "
+            "INSERT INTO files_fts(rowid, filename, title, description) "
+            "VALUES (new.rowid, new.filename, new.title, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER files_fts_delete AFTER DELETE ON files BEGIN "
+            "INSERT INTO files_fts(files_fts, rowid, filename, title, description) "
+            "VALUES ('delete', old.rowid, old.filename, old.title, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER files_fts_update AFTER UPDATE OF filename, title, description ON files BEGIN "
+            "INSERT INTO files_fts(files_fts, rowid, filename, title, description) "
+            "VALUES ('delete', old.rowid, old.filename, old.title, old.description); "
+            "INSERT INTO files_fts(rowid, filename, title, description) "
+            "VALUES (new.rowid, new.filename, new.title, new.description); END"
+        )
+        op.execute("INSERT INTO files_fts(files_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_files_search")
+        op.execute("ALTER TABLE files DROP COLUMN IF EXISTS search_vector")
+    elif dialect == 'sqlite':
+        for trigger in ('files_fts_insert', 'files_fts_delete', 'files_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS files_fts")
@@ -1,7 +1,7 @@
 import enum
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from services.password_hasher import password_hasher
 
 db = SQLAlchemy()
 
@@ -18,24 +18,156 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.Enum(UserRole), default=UserRole.USER, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
+    # Bytes the user may store; NULL for the STORAGE_QUOTA default, 0 for no limit
+    storage_quota = db.Column(db.BigInteger)
     
+    # Hashing runs on the shared hasher's process pool and may raise HasherBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
 
 class File(db.Model):
     __tablename__ = 'files'
+    __table_args__ = (
+        # Keyset pagination of a user's library, newest first, with or
+        # without a folder filter
+        db.Index('ix_files_user_folder_created', 'user_id', 'folder_type', 'created_at', 'id'),
+        db.Index('ix_files_user_created', 'user_id', 'created_at', 'id'),
+        # The storage reconciler walks files in object key order
+        db.Index('ix_files_object_name', 'object_name', 'id'),
+    )
     id = db.Column(db.String(36), primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
     folder_type = db.Column(db.String(50), nullable=False)
-    size = db.Column(db.Integer, default=0)
+    size = db.Column(db.BigInteger, default=0)
     device_name = db.Column(db.String(100))
     cloudinary_url = db.Column(db.String(500))
     cloudinary_public_id = db.Column(db.String(255))
-    # object_name = db.Column(db.String(500))  # Temporarily comment out for database recreation
+    # Key of the object holding the content: the file's own object
+    # (file_object_name) or its blob's. Compared bytewise on Postgres, the
+    # order bucket listings come in.
+    object_name = db.Column(db.String(500).with_variant(db.String(500, collation='C'), 'postgresql'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # Set when the content is stored once in a shared, content-addressed blob
+    blob_id = db.Column(db.Integer, db.ForeignKey('blobs.id'), index=True)
+    blob = db.relationship('Blob')
+    # Preview renditions in thumbnails/{id}/: pending, ready, failed or
+    # unsupported; NULL for files that get no preview. The version is bumped
+    # on every render so thumbnail URLs can be cached for good.
+    thumbnail_status = db.Column(db.String(20))
+    thumbnail_version = db.Column(db.Integer, default=0)
+    # How the object is stored: gzip, zstd or identity (sniffed, kept raw);
+    # NULL if it was never considered for compression. stored_size is the
+    # object's size in storage, size the original's.
+    content_codec = db.Column(db.String(10))
+    stored_size = db.Column(db.BigInteger)
+
+# Bytes and file count of a user's folder, kept up to date with every change
+# to the files table (services/usage.py)
+class StorageUsage(db.Model):
+    __tablename__ = 'storage_usage'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    folder_type = db.Column(db.String(50), primary_key=True)
+    bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    file_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Id the File row gets once the upload completes
+    file_id = db.Column(db.String(36), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(255), nullable=False)
+    description = db.Column(db.Text)
+    folder_type = db.Column(db.String(50), nullable=False)
+    device_name = db.Column(db.String(100))
+    object_name = db.Column(db.String(500), nullable=False)
+    upload_id = db.Column(db.String(255), nullable=False)  # MinIO multipart upload id
+    total_size = db.Column(db.BigInteger)  # declared by the client, if known
+    chunk_size = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='active', nullable=False)  # active, completed, aborted
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    parts = db.relationship('UploadPart', cascade='all, delete-orphan', order_by='UploadPart.part_number')
+
+class UploadPart(db.Model):
+    __tablename__ = 'upload_parts'
+    session_id = db.Column(db.String(36), db.ForeignKey('upload_sessions.id'), primary_key=True)
+    part_number = db.Column(db.Integer, primary_key=True)
+    etag = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'digest', name='uq_blobs_user_digest'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    digest = db.Column(db.String(64), nullable=False)  # SHA-256, hex
+    object_name = db.Column(db.String(500), nullable=False)
+    size = db.Column(db.BigInteger, default=0)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    # Bytes that didn't have to be sent to storage because the blob existed
+    upload_bytes_saved = db.Column(db.BigInteger, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # When the last reference went away. The row stays as a tombstone, so an
+    # upload of the same content reuses it, until `flask sweep-blobs`
+    # deletes it and its object.
+    released_at = db.Column(db.DateTime, index=True)
+
+# Where the storage reconciler (services/reconciler.py) is in its pass over
+# the bucket, so each run picks up where the last one stopped
+class ReconcileCheckpoint(db.Model):
+    __tablename__ = 'reconcile_checkpoints'
+    name = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.String(500))  # last key checked; NULL at the start of a pass
+    pass_started_at = db.Column(db.DateTime)
+    passes = db.Column(db.Integer, default=0, nullable=False)
+    # JSON counts of the pass so far, and of the last complete pass
+    stats = db.Column(db.Text)
+    last_pass_stats = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SyncState(db.Model):
+    __tablename__ = 'sync_states'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    # Sequence number of the user's latest change
+    last_seq = db.Column(db.BigInteger, default=0, nullable=False)
+    # Delete events up to this sequence number have been compacted away;
+    # clients with an older cursor must re-list everything
+    horizon_seq = db.Column(db.BigInteger, default=0, nullable=False)
+    last_change_at = db.Column(db.DateTime)
+
+class ChangeEvent(db.Model):
+    __tablename__ = 'change_events'
+    __table_args__ = (
+        db.Index('ix_change_events_user_file_seq', 'user_id', 'file_id', 'seq'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    seq = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    file_id = db.Column(db.String(36), nullable=False)
+    action = db.Column(db.String(20), nullable=False)  # create, update, move, delete
+    # JSON of the file as it was after the change; empty for deletes
+    payload = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class Device(db.Model):
+    __tablename__ = 'devices'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    device_id = db.Column(db.String(64), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    device_type = db.Column(db.String(50), default='laptop')
+    ip_address = db.Column(db.String(45))
+    user_email = db.Column(db.String(120))
+    registered_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
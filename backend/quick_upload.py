@@ -1,11 +1,33 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, redirect
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import tuple_
+from werkzeug.http import http_date, quote_etag
+import base64
+import io
+import json
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from services.minio_service import minio_service
+from types import SimpleNamespace
+from config import Config
+from services.minio_service import file_object_name, is_missing, minio_service
 from models import db, File
+from services.blob_store import store_blob, release_blob, dedup_stats
+from services.compression import IDENTITY, compression_stats, iter_decoded
+from services.search import search_files
+from services.sync_journal import record_change
+from services.usage import QuotaExceeded, check_quota, get_usage
+from services.delta_sync import WEAK_ALGORITHM, block_signatures, plan_segments, apply_delta
+from services.thumbnails import (
+    schedule_thumbnails, generate_thumbnails, delete_thumbnails, preview_kind,
+    pick_size, thumbnail_object_name, thumbnail_pipeline
+)
+from serializers import file_select, json_array_response, serialize_file, serialize_file_row
+from services.log import get_logger
+from services.user_cache import admin_required
 
 quick_upload_bp = Blueprint('quick_upload', __name__)
+log = get_logger('files')
 
 @quick_upload_bp.route('/upload', methods=['POST', 'OPTIONS'])
 @jwt_required()
@@ -15,6 +37,9 @@ def quick_upload():
 
     try:
         current_user_id = get_jwt_identity()
+        # Before the body is read: the request size bounds the file's. Bodies
+        # of unknown length (chunked) are checked once stored, below.
+        check_quota(current_user_id, request.content_length)
 
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -42,21 +67,41 @@ def quick_upload():
 
         if minio_service.available:
             try:
-                file.stream.seek(0)
-                result = minio_service.upload_file(
-                    file.stream,
-                    file.filename,
-                    folder_type,
-                    file_id,
-                    {'title': title, 'description': description, 'device': device_name}
-                )
+                if Config.STORAGE_DEDUP:
+                    blob, result = store_blob(current_user_id, file.stream)
+                    new_file.blob = blob
+                    new_file.object_name = blob.object_name
+                else:
+                    result = minio_service.upload_file(
+                        file.stream,
+                        file.filename,
+                        folder_type,
+                        file_id,
+                        {'title': title, 'description': description, 'device': device_name},
+                        # Previews are rendered from the stored bytes, videos
+                        # by ffmpeg reading byte ranges, so those stay raw
+                        compress=preview_kind(file.filename) is None
+                    )
+                    new_file.object_name = result['object_name']
+                    new_file.content_codec = result['codec']
+                    new_file.stored_size = result['stored_size']
                 new_file.cloudinary_url = result['url']
                 new_file.size = result['size']
+                check_quota(current_user_id, new_file.size)
                 
                 db.session.add(new_file)
+                schedule_thumbnails(new_file, new_file.object_name)
+                record_change(new_file, 'create')
                 db.session.commit()
+            except QuotaExceeded:
+                db.session.rollback()
+                # Only remove content this upload stored, not a shared blob
+                if result.get('uploaded', True):
+                    minio_service.delete_file(new_file.object_name)
+                raise
             except Exception as e:
-                print(f"MinIO upload failed: {e}")
+                db.session.rollback()
+                log.exception('MinIO upload failed', filename=file.filename)
                 return jsonify({'error': f'Upload failed: {str(e)}'}), 500
         else:
             return jsonify({'error': 'MinIO not available'}), 500
@@ -66,35 +111,74 @@ def quick_upload():
             'id': file_id,
             'filename': file.filename,
             'title': title,
-            'folder_type': folder_type
+            'folder_type': folder_type,
+            'deduplicated': Config.STORAGE_DEDUP and not result.get('uploaded', True)
         }), 201
 
+    except QuotaExceeded as e:
+        return jsonify(e.to_dict()), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _encode_cursor(f):
+    raw = json.dumps([f.created_at.isoformat(), f.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    created_at, file_id = json.loads(raw)
+    return datetime.fromisoformat(created_at), str(file_id)
+
+def _paginate_files(*criteria):
+    """Select one page of files matching criteria, keyset-paginated on
+    (created_at, id) from the request args.
+
+    Supports ?limit=, ?cursor= (the X-Next-Cursor of the previous page) and
+    ?sort=-created_at (newest first, default) or ?sort=created_at. Raises
+    ValueError on invalid arguments. Returns (rows, next_cursor).
+    """
+    limit = request.args.get('limit', Config.FILES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, Config.FILES_MAX_PAGE_SIZE))
+
+    sort = request.args.get('sort', '-created_at')
+    if sort not in ('created_at', '-created_at'):
+        raise ValueError(f'Unsupported sort: {sort}')
+    descending = sort.startswith('-')
+
+    stmt = file_select(*criteria)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            position = _decode_cursor(cursor)
+        except Exception:
+            raise ValueError('Invalid cursor')
+        key = tuple_(File.created_at, File.id)
+        stmt = stmt.where(key < position if descending else key > position)
+
+    if descending:
+        stmt = stmt.order_by(File.created_at.desc(), File.id.desc())
+    else:
+        stmt = stmt.order_by(File.created_at.asc(), File.id.asc())
+
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _file_page_response(*criteria):
+    try:
+        rows, next_cursor = _paginate_files(*criteria)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return json_array_response(rows, headers=headers)
+
 @quick_upload_bp.route('', methods=['GET'])
 @jwt_required()
 def get_all_files():
     try:
         current_user_id = get_jwt_identity()
-        files = File.query.filter_by(user_id=current_user_id).all()
-
-        result = []
-        for f in files:
-            file_data = {
-                'id': f.id,
-                'filename': f.filename,
-                'title': f.title,
-                'description': f.description or '',
-                'folder_type': f.folder_type,
-                'size': f.size or 0,
-                'device_name': f.device_name or 'Unknown Device',
-                'url': f.cloudinary_url or '',
-                'created_at': f.created_at.isoformat() if f.created_at else None
-            }
-            result.append(file_data)
-
-        return jsonify(result), 200
+        return _file_page_response(File.user_id == current_user_id)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -104,26 +188,94 @@ def get_all_files():
 def get_files_by_folder(folder_type):
     try:
         current_user_id = get_jwt_identity()
-        files = File.query.filter_by(user_id=current_user_id, folder_type=folder_type).all()
-
-        result = []
-        for f in files:
-            file_data = {
-                'id': f.id,
-                'filename': f.filename,
-                'title': f.title,
-                'description': f.description or '',
-                'folder_type': f.folder_type,
-                'size': f.size or 0,
-                'device_name': f.device_name or 'Unknown Device',
-                'url': f.cloudinary_url or '',
-                'created_at': f.created_at.isoformat() if f.created_at else None
-            }
-            result.append(file_data)
-
-        return jsonify(result), 200
+        return _file_page_response(File.user_id == current_user_id, File.folder_type == folder_type)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _search_filters(args):
+    """Facet filters of a search request; repeat a parameter to accept several values."""
+    def datetime_arg(name):
+        value = args.get(name)
+        try:
+            return datetime.fromisoformat(value) if value else None
+        except ValueError:
+            raise ValueError(f'Invalid {name}: {value}')
+
+    def size_arg(name):
+        value = args.get(name)
+        if value is None:
+            return None
+        if not value.isdigit():
+            raise ValueError(f'Invalid {name}: {value}')
+        return int(value)
+
+    return {
+        'folder_type': args.getlist('folder_type'),
+        'device_name': args.getlist('device_name'),
+        'size': args.getlist('size'),
+        'date': args.getlist('date'),
+        'min_size': size_arg('min_size'),
+        'max_size': size_arg('max_size'),
+        'created_after': datetime_arg('created_after'),
+        'created_before': datetime_arg('created_before')
+    }
+
+def _encode_search_cursor(position):
+    rank, created_at, file_id = position
+    raw = json.dumps([rank, created_at.isoformat(), file_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_search_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    rank, created_at, file_id = json.loads(raw)
+    if rank is not None:
+        rank = float(rank)
+    return rank, datetime.fromisoformat(created_at), str(file_id)
+
+@quick_upload_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search():
+    """Full-text search over filename, title and description (?q=), with
+    facet filters and counts.
+
+    Filters: folder_type, device_name, size (under-1mb, 1mb-10mb, 10mb-100mb,
+    100mb-1gb, over-1gb), date (past-day, past-week, past-month, past-year,
+    older), min_size, max_size, created_after and created_before. Results
+    are ranked by relevance; pass next_cursor back as ?cursor= for the next
+    page. The total (a string like "1000+" past SEARCH_COUNT_LIMIT) and the
+    facet counts come with the first page only; ?facets=true asks for them
+    on later pages too and ?facets=false skips the facets.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        cursor = request.args.get('cursor')
+        try:
+            after = _decode_search_cursor(cursor) if cursor else None
+        except Exception:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        counts = request.args.get('facets', '').lower()
+
+        try:
+            found = search_files(
+                current_user_id,
+                request.args.get('q', ''),
+                _search_filters(request.args),
+                limit=request.args.get('limit', type=int),
+                after=after,
+                facets=counts in ('1', 'true') or (after is None and counts not in ('0', 'false')),
+                total=counts in ('1', 'true') or after is None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        next_position = found.pop('next_position')
+        found['results'] = [serialize_file_row(row) for row in found['results']]
+        found['next_cursor'] = _encode_search_cursor(next_position) if next_position else None
+        return jsonify(found), 200
 
     except Exception as e:
+        log.exception('Search error')
         return jsonify({'error': str(e)}), 500
 
 @quick_upload_bp.route('/<file_id>/download', methods=['GET', 'OPTIONS'])
@@ -140,32 +292,148 @@ def download_file(file_id):
             return jsonify({'error': 'File not found'}), 404
 
         if minio_service.available:
+            object_name = file.object_name
             try:
-                object_name = f"{file.folder_type}/{file_id}_{file.filename}"
-                response = minio_service.client.get_object(minio_service.bucket, object_name)
-                file_data = response.read()
-
-                return Response(
-                    file_data,
-                    mimetype='application/octet-stream',
-                    headers={
-                        'Content-Disposition': f'attachment; filename="{file.filename}"',
-                        'Content-Length': str(len(file_data)),
-                    }
-                )
+                stat = minio_service.stat_file(object_name)
             except Exception as e:
-                print(f"MinIO download error: {e}")
-                # Clean up orphaned database record
-                db.session.delete(file)
-                db.session.commit()
-                return jsonify({'error': 'File not found in storage - record cleaned up'}), 404
+                if not is_missing(e):
+                    raise
+                # The row is kept: the reconciler (services/reconciler.py)
+                # decides whether the object is really gone
+                log.warning('File missing from storage', file_id=file_id, object_name=object_name)
+                return jsonify({'error': 'File not found in storage'}), 404
+
+            return _stream_object(object_name, stat, file.filename, file.content_codec, file.size)
         else:
             return jsonify({'error': 'MinIO not available'}), 404
 
     except Exception as e:
-        print(f"Download error: {e}")
+        log.exception('Download error', file_id=file_id)
+        return jsonify({'error': str(e)}), 500
+
+@quick_upload_bp.route('/<file_id>/download-url', methods=['GET', 'OPTIONS'])
+@jwt_required()
+def get_download_url(file_id):
+    """Short-lived presigned URL to download a file straight from storage.
+
+    With ?redirect=true the response is a redirect to it instead.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        file = File.query.filter_by(id=file_id, user_id=current_user_id).first()
+
+        if not file:
+            return jsonify({'error': 'File not found'}), 404
+        if not minio_service.available:
+            return jsonify({'error': 'MinIO not available'}), 404
+
+        url = minio_service.presigned_download_url(
+            file.object_name, file.filename,
+            file.content_codec if file.content_codec != IDENTITY else None
+        )
+        if request.args.get('redirect', 'false').lower() == 'true':
+            return redirect(url, 302)
+        return jsonify({'url': url, 'filename': file.filename, 'expires_in': Config.PRESIGNED_URL_EXPIRY}), 200
+
+    except Exception as e:
+        log.exception('Download URL error', file_id=file_id)
         return jsonify({'error': str(e)}), 500
 
+def download_plan(req, stat, filename):
+    """Work out a conditional, range-aware download of an object.
+
+    `req` is any werkzeug request (the ASGI transfer routes build one from
+    the scope). Returns (status, headers, offset, length); only 200 and 206
+    have a body, the byte range [offset, offset + length) of the object.
+    """
+    etag = stat.etag
+    last_modified = stat.last_modified.replace(microsecond=0) if stat.last_modified else None
+    size = stat.size
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Accept-Ranges': 'bytes',
+        'ETag': quote_etag(etag),
+    }
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+
+    # Conditional GET
+    if req.if_none_match:
+        not_modified = req.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(
+            last_modified and req.if_modified_since
+            and last_modified <= req.if_modified_since
+        )
+    if not_modified:
+        return 304, headers, 0, 0
+
+    # A Range is only honoured while If-Range (if sent) still matches
+    byte_range = req.range
+    if byte_range and (byte_range.units != 'bytes' or len(byte_range.ranges) != 1):
+        byte_range = None
+    if_range = req.if_range
+    if byte_range and if_range.etag:
+        if if_range.etag != etag:
+            byte_range = None
+    elif byte_range and if_range.date:
+        if not last_modified or if_range.date != last_modified:
+            byte_range = None
+
+    if byte_range:
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            headers['Content-Range'] = f'bytes */{size}'
+            return 416, headers, 0, 0
+        headers['Content-Range'] = f'bytes {bounds[0]}-{bounds[1] - 1}/{size}'
+        headers['Content-Length'] = str(bounds[1] - bounds[0])
+        return 206, headers, bounds[0], bounds[1] - bounds[0]
+
+    headers['Content-Length'] = str(size)
+    return 200, headers, 0, size
+
+def stored_representation(req, stat, codec=None, size=None):
+    """What to send for an object stored with `codec`, whose original is `size` bytes.
+
+    Returns the stat to plan the download with, whether to decompress and
+    extra headers. Clients that accept the codec get the stored bytes with
+    Content-Encoding (ranges then count those bytes); others get the
+    original, decompressed on the way out.
+    """
+    if not codec or codec == IDENTITY:
+        return stat, False, {}
+    if req.accept_encodings[codec]:
+        encoded = SimpleNamespace(etag=f"{stat.etag}-{codec}", size=stat.size, last_modified=stat.last_modified)
+        return encoded, False, {'Content-Encoding': codec, 'Vary': 'Accept-Encoding'}
+    decoded = SimpleNamespace(etag=stat.etag, size=size, last_modified=stat.last_modified)
+    return decoded, True, {'Vary': 'Accept-Encoding'}
+
+def _stream_object(object_name, stat, filename, codec=None, size=None):
+    """Build a streamed, conditional and range-aware response for an object."""
+    stat, decode, encoding_headers = stored_representation(request, stat, codec, size)
+    status, headers, offset, length = download_plan(request, stat, filename)
+    headers.update(encoding_headers)
+
+    if status not in (200, 206) or not length:
+        body = iter(())
+    elif decode:
+        body = iter_decoded(codec, minio_service.iter_file(object_name), offset, length)
+    elif status == 206:
+        body = minio_service.iter_file(object_name, offset=offset, length=length)
+    else:
+        body = minio_service.iter_file(object_name)
+    return Response(
+        body,
+        status=status,
+        mimetype='application/octet-stream',
+        headers=headers,
+        direct_passthrough=True
+    )
+
 @quick_upload_bp.route('/<file_id>', methods=['GET', 'OPTIONS'])
 @jwt_required()
 def get_file_details(file_id):
@@ -185,23 +453,153 @@ def get_file_details(file_id):
         elif file.filename.lower().endswith(('.mp4', '.avi', '.mov', '.webm')):
             content_type = f'video/{file.filename.split(".")[-1].lower()}'
 
-        return jsonify({
-            'id': file.id,
-            'filename': file.filename,
-            'title': file.title,
-            'description': file.description,
-            'folder_type': file.folder_type,
-            'size': file.size,
-            'content_type': content_type,
-            'url': file.cloudinary_url,
-            'device_name': file.device_name,
-            'created_at': file.created_at.isoformat() if file.created_at else None
-        }), 200
+        file_data = serialize_file(file)
+        file_data['content_type'] = content_type
+        return jsonify(file_data), 200
 
     except Exception as e:
-        print(f"File details error: {e}")
+        log.exception('File details error', file_id=file_id)
         return jsonify({'error': str(e)}), 500
 
+@quick_upload_bp.route('/<file_id>/thumbnail', methods=['GET', 'OPTIONS'])
+@jwt_required(locations=['headers', 'query_string'])
+def get_thumbnail(file_id):
+    """JPEG preview of an image or video, fitted into ?size= pixels.
+
+    Takes the token as ?jwt= too, so it can be used as an <img> src. The
+    thumbnail_url of a file carries ?v=, and responses for the current
+    version may be cached indefinitely.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        row = db.session.execute(
+            db.select(File.thumbnail_status, File.thumbnail_version)
+            .where(File.id == file_id, File.user_id == current_user_id)
+        ).first()
+
+        if not row:
+            return jsonify({'error': 'File not found'}), 404
+        status, version = row
+        if status == 'pending':
+            return jsonify({'error': 'Thumbnail is being generated'}), 202, {'Retry-After': '2'}
+        if status != 'ready':
+            return jsonify({'error': 'No thumbnail for this file'}), 404
+        if not minio_service.available:
+            return jsonify({'error': 'MinIO not available'}), 404
+
+        object_name = thumbnail_object_name(file_id, pick_size(request.args.get('size', type=int)))
+        try:
+            data = b''.join(minio_service.iter_file(object_name))
+        except Exception as e:
+            log.warning('Thumbnail read error', file_id=file_id, error=str(e))
+            return jsonify({'error': 'Thumbnail not found in storage'}), 404
+
+        response = Response(data, mimetype='image/jpeg')
+        if request.args.get('v') == str(version or 0):
+            response.headers['Cache-Control'] = f'private, max-age={Config.THUMBNAIL_CACHE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'private, no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
+
+    except Exception as e:
+        log.exception('Thumbnail error', file_id=file_id)
+        return jsonify({'error': str(e)}), 500
+
+@quick_upload_bp.route('/thumbnails/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_thumbnail_metrics():
+    return jsonify(thumbnail_pipeline.metrics()), 200
+
+@quick_upload_bp.route('/storage/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_storage_metrics():
+    return jsonify(minio_service.metrics()), 200
+
+def backfill_thumbnails(retry_all=False):
+    """Render pending previews (e.g. jobs dropped by a full queue or a restart) inline.
+
+    With retry_all, failed renders and files uploaded before previews
+    existed are rendered too. Returns the number of files processed.
+    """
+    statuses = [File.thumbnail_status == 'pending']
+    if retry_all:
+        statuses += [File.thumbnail_status == 'failed', File.thumbnail_status.is_(None)]
+    ids = db.session.scalars(db.select(File.id).where(db.or_(*statuses))).all()
+
+    count = 0
+    for file_id in ids:
+        file = db.session.get(File, file_id)
+        if file is None or not preview_kind(file.filename):
+            continue
+        generate_thumbnails(file_id, file.object_name)
+        count += 1
+    return count
+
+def _move_files(files, new_folder):
+    """Move files to new_folder with server-side copies.
+
+    Copies run on a bounded thread pool. Only files whose copy succeeded are
+    updated in the database, and the old objects are removed after the
+    commit, so a failure never leaves a row pointing at a missing object.
+    Returns the moved files and a {file_id: error} dict for the rest.
+    """
+    pending = [
+        (f, f.object_name, file_object_name(new_folder, f.id, f.filename))
+        for f in files if f.folder_type != new_folder and not f.blob_id
+    ]
+    # Deduplicated files live under their digest, so only the row changes
+    unchanged = [f for f in files if f.folder_type == new_folder]
+    relabel = [f for f in files if f.folder_type != new_folder and f.blob_id]
+    errors = {}
+
+    copied = []
+    with ThreadPoolExecutor(max_workers=Config.MOVE_CONCURRENCY) as pool:
+        futures = {
+            pool.submit(minio_service.copy_file, old_object, new_object): (f, old_object, new_object)
+            for f, old_object, new_object in pending
+        }
+        for future in as_completed(futures):
+            f, old_object, new_object = futures[future]
+            try:
+                future.result()
+                copied.append((f, old_object, new_object))
+            except Exception as e:
+                log.warning('MinIO move error', file_id=f.id, error=str(e))
+                errors[f.id] = str(e)
+
+    if not copied and not relabel:
+        return unchanged, errors
+
+    for f, _, new_object in copied:
+        f.folder_type = new_folder
+        f.object_name = new_object
+        f.cloudinary_url = f"http://{Config.MINIO_ENDPOINT}/{minio_service.bucket}/{new_object}"
+        record_change(f, 'move')
+    for f in relabel:
+        f.folder_type = new_folder
+        record_change(f, 'move')
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for _, _, new_object in copied:
+            minio_service.delete_file(new_object)
+        raise
+
+    with ThreadPoolExecutor(max_workers=Config.MOVE_CONCURRENCY) as pool:
+        removed = pool.map(minio_service.delete_file, [old_object for _, old_object, _ in copied])
+        for (f, old_object, _), ok in zip(copied, removed):
+            if not ok:
+                log.warning('MinIO move: could not remove old object', file_id=f.id, object_name=old_object)
+
+    return unchanged + relabel + [f for f, _, _ in copied], errors
+
 @quick_upload_bp.route('/move/<file_id>', methods=['POST', 'OPTIONS'])
 @jwt_required()
 def move_file(file_id):
@@ -221,54 +619,202 @@ def move_file(file_id):
         if not new_folder:
             return jsonify({'error': 'New folder type required'}), 400
 
-        old_folder = file.folder_type
-        
-        # Move in MinIO if available
-        if minio_service.available:
-            try:
-                old_object = f"{old_folder}/{file_id}_{file.filename}"
-                new_object = f"{new_folder}/{file_id}_{file.filename}"
-                
-                # Get file data
-                response = minio_service.client.get_object(minio_service.bucket, old_object)
-                file_data = response.read()
-                
-                # Upload to new location
-                from io import BytesIO
-                minio_service.client.put_object(
-                    minio_service.bucket,
-                    new_object,
-                    BytesIO(file_data),
-                    length=len(file_data)
-                )
-                
-                # Delete old location
-                minio_service.client.remove_object(minio_service.bucket, old_object)
-            except Exception as e:
-                print(f"MinIO move error: {e}")
+        if not minio_service.available:
+            return jsonify({'error': 'MinIO not available'}), 500
 
-        # Update database
-        file.folder_type = new_folder
-        db.session.commit()
+        moved, errors = _move_files([file], new_folder)
+        if errors:
+            return jsonify({'error': f'Move failed: {errors[file.id]}'}), 500
 
         return jsonify({
             'message': 'File moved successfully',
             'new_folder': new_folder,
-            'file': {
-                'id': file.id,
-                'filename': file.filename,
-                'title': file.title,
-                'description': file.description,
-                'folder_type': file.folder_type,
-                'size': file.size,
-                'device_name': file.device_name,
-                'url': file.cloudinary_url,
-                'created_at': file.created_at.isoformat() if file.created_at else None
-            }
+            'file': serialize_file(file)
         }), 200
 
     except Exception as e:
-        print(f"Move error: {e}")
+        log.exception('Move error', file_id=file_id)
+        return jsonify({'error': str(e)}), 500
+
+@quick_upload_bp.route('/move', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def move_files():
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        file_ids = data.get('file_ids') or []
+        new_folder = data.get('folder_type')
+
+        if not new_folder:
+            return jsonify({'error': 'New folder type required'}), 400
+        if not file_ids:
+            return jsonify({'error': 'file_ids required'}), 400
+        if len(file_ids) > Config.MOVE_BATCH_LIMIT:
+            return jsonify({'error': f'At most {Config.MOVE_BATCH_LIMIT} files per request'}), 400
+
+        if not minio_service.available:
+            return jsonify({'error': 'MinIO not available'}), 500
+
+        files = File.query.filter(File.user_id == current_user_id, File.id.in_(file_ids)).all()
+        found = {f.id for f in files}
+        moved, errors = _move_files(files, new_folder)
+        for missing_id in file_ids:
+            if missing_id not in found:
+                errors[missing_id] = 'File not found'
+
+        return jsonify({
+            'message': f'Moved {len(moved)} of {len(file_ids)} files',
+            'new_folder': new_folder,
+            'moved': [f.id for f in moved],
+            'failed': errors
+        }), 200 if not errors else 207
+
+    except Exception as e:
+        log.exception('Batch move error')
+        return jsonify({'error': str(e)}), 500
+
+def _block_size(value):
+    block_size = int(value or Config.DELTA_BLOCK_SIZE)
+    if not Config.DELTA_MIN_BLOCK_SIZE <= block_size <= Config.DELTA_MAX_BLOCK_SIZE:
+        raise ValueError(
+            f'block_size must be between {Config.DELTA_MIN_BLOCK_SIZE} and {Config.DELTA_MAX_BLOCK_SIZE}'
+        )
+    return block_size
+
+@quick_upload_bp.route('/<file_id>/signatures', methods=['GET', 'OPTIONS'])
+@jwt_required()
+def get_block_signatures(file_id):
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        file = File.query.filter_by(id=file_id, user_id=current_user_id).first()
+
+        if not file:
+            return jsonify({'error': 'File not found'}), 404
+        if not minio_service.available:
+            return jsonify({'error': 'MinIO not available'}), 500
+
+        if file.content_codec not in (None, IDENTITY):
+            return jsonify({'error': 'Delta updates are not available for compressed files'}), 409
+
+        block_size = _block_size(request.args.get('block_size'))
+        object_name = file.object_name
+        stat = minio_service.stat_file(object_name)
+
+        return jsonify({
+            'file_id': file.id,
+            'size': stat.size,
+            'etag': stat.etag,
+            'block_size': block_size,
+            'weak_algorithm': WEAK_ALGORITHM,
+            'blocks': block_signatures(object_name, block_size, stat.etag)
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.exception('Signature error', file_id=file_id)
+        return jsonify({'error': str(e)}), 500
+
+@quick_upload_bp.route('/<file_id>/delta', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def upload_delta(file_id):
+    """Replace a file's content from the stored version plus changed blocks.
+
+    Multipart form: `delta` is JSON with base_etag and block_size (from the
+    signatures endpoint), the new size and the ops; `data` holds the literal
+    bytes of all data ops, in order.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        file = File.query.filter_by(id=file_id, user_id=current_user_id).first()
+
+        if not file:
+            return jsonify({'error': 'File not found'}), 404
+        if not minio_service.available:
+            return jsonify({'error': 'MinIO not available'}), 500
+
+        if file.content_codec not in (None, IDENTITY):
+            return jsonify({'error': 'Delta updates are not available for compressed files'}), 409
+
+        delta = json.loads(request.form.get('delta') or '{}')
+        ops = delta.get('ops')
+        if not isinstance(ops, list) or not ops:
+            return jsonify({'error': 'ops required'}), 400
+        block_size = _block_size(delta.get('block_size'))
+
+        source_object = file.object_name
+        stat = minio_service.stat_file(source_object)
+        if delta.get('base_etag') != stat.etag:
+            return jsonify({'error': 'File changed since its signatures were read', 'etag': stat.etag}), 409
+
+        segments = plan_segments(ops, block_size, stat.size)
+        size = sum(segment[-1] for segment in segments)
+        if delta.get('size') is not None and int(delta['size']) != size:
+            return jsonify({'error': f"Ops describe {size} bytes, expected {delta['size']}"}), 400
+        check_quota(current_user_id, size - (file.size or 0))
+
+        # The new version is written beside the live object and swapped in
+        # with the commit, so readers never see a half-written file
+        target_object = file_object_name(file.folder_type, file.id, file.filename, version=uuid.uuid4().hex[:12])
+        data = request.files.get('data')
+        result = apply_delta(
+            source_object,
+            stat.etag,
+            target_object,
+            segments,
+            data.stream if data else io.BytesIO(),
+            {'title': file.title, 'description': file.description or '', 'device': file.device_name}
+        )
+
+        try:
+            file = db.session.get(File, file.id, with_for_update=True, populate_existing=True)
+            if file is None or file.object_name != source_object:
+                # Another update or a move got there first
+                db.session.rollback()
+                minio_service.delete_file(target_object)
+                return jsonify({'error': 'File changed since its signatures were read'}), 409
+            old_object = None
+            if file.blob_id:
+                # Shared blobs are swept once unreferenced (sweep_blobs)
+                release_blob(file.blob_id)
+                file.blob_id = None
+            else:
+                old_object = source_object
+            file.object_name = target_object
+            file.cloudinary_url = f"http://{Config.MINIO_ENDPOINT}/{minio_service.bucket}/{target_object}"
+            file.size = result['size']
+            if file.content_codec:
+                file.stored_size = result['size']
+            schedule_thumbnails(file, target_object)
+            record_change(file, 'update')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            minio_service.delete_file(target_object)
+            raise
+
+        if old_object and not minio_service.delete_file(old_object):
+            log.warning('Delta upload: could not remove old object', file_id=file.id, object_name=old_object)
+
+        return jsonify(dict(result, message='File updated successfully', file=serialize_file(file))), 200
+
+    except QuotaExceeded as e:
+        return jsonify(e.to_dict()), 413
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Delta upload error', file_id=file_id)
         return jsonify({'error': str(e)}), 500
 
 @quick_upload_bp.route('/delete/<file_id>', methods=['DELETE', 'OPTIONS'])
@@ -284,17 +830,58 @@ def delete_file(file_id):
         if not file:
             return jsonify({'error': 'File not found'}), 404
 
-        # Delete from MinIO
-        if minio_service.available:
-            object_name = f"{file.folder_type}/{file_id}_{file.filename}"
-            minio_service.delete_file(object_name)
+        if file.blob_id:
+            # Shared blobs are swept once unreferenced (sweep_blobs)
+            release_blob(file.blob_id)
+            object_name = None
+        else:
+            object_name = file.object_name
 
         # Delete from database
         db.session.delete(file)
+        record_change(file, 'delete')
         db.session.commit()
 
+        # Delete from MinIO
+        if minio_service.available and object_name:
+            minio_service.delete_file(object_name)
+        if minio_service.available and file.thumbnail_status:
+            delete_thumbnails(file_id)
+
         return jsonify({'message': 'File deleted successfully'}), 200
 
     except Exception as e:
-        print(f"Delete error: {e}")
+        log.exception('Delete error', file_id=file_id)
+        return jsonify({'error': str(e)}), 500
+
+
+@quick_upload_bp.route('/dedup/stats', methods=['GET'])
+@jwt_required()
+def get_dedup_stats():
+    try:
+        current_user_id = get_jwt_identity()
+        return jsonify(dedup_stats(current_user_id)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@quick_upload_bp.route('/usage', methods=['GET'])
+@jwt_required()
+def get_storage_usage():
+    """Bytes and files stored, in total and per folder, and the quota."""
+    try:
+        current_user_id = get_jwt_identity()
+        return jsonify(get_usage(current_user_id)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@quick_upload_bp.route('/compression/stats', methods=['GET'])
+@jwt_required()
+def get_compression_stats():
+    try:
+        current_user_id = get_jwt_identity()
+        return jsonify(compression_stats(current_user_id)), 200
+
+    except Exception as e:
         return jsonify({'error': str(e)}), 500
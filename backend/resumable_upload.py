@@ -0,0 +1,354 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import uuid
+from datetime import datetime, timedelta
+from minio.helpers import MIN_PART_SIZE, MAX_MULTIPART_COUNT
+from config import Config
+from services.minio_service import file_object_name, minio_service
+from models import db, File, UploadSession, UploadPart
+from serializers import serialize_file
+from services.sync_journal import record_change
+from services.thumbnails import schedule_thumbnails
+from services.usage import QuotaExceeded, check_quota
+from services.log import get_logger
+
+resumable_upload_bp = Blueprint('resumable_upload', __name__)
+log = get_logger('uploads')
+
+def _get_session(session_id, user_id):
+    return UploadSession.query.filter_by(id=session_id, user_id=user_id).first()
+
+def _uploaded_parts(session):
+    """(part_number, etag, size) of every part received so far.
+
+    Chunks sent through the API are recorded, but chunks PUT straight to
+    storage with presigned URLs are only known to storage, so it is asked
+    whenever the records don't add up to a complete upload.
+    """
+    parts = [(p.part_number, p.etag, p.size) for p in session.parts]
+    recorded_size = sum(size for _, _, size in parts)
+    if (not parts or [n for n, _, _ in parts] != list(range(1, len(parts) + 1))
+            or (session.total_size is not None and recorded_size != session.total_size)):
+        parts = minio_service.list_parts(session.object_name, session.upload_id)
+    return parts
+
+def _part_urls(session, part_numbers):
+    return [
+        {'part_number': n, 'url': minio_service.presigned_part_url(session.object_name, session.upload_id, n)}
+        for n in part_numbers
+    ]
+
+def _session_status(session, uploaded=None):
+    if uploaded is None:
+        uploaded = [(p.part_number, p.etag, p.size) for p in session.parts]
+    parts = [{'part_number': n, 'size': size} for n, _, size in uploaded]
+    return {
+        'upload_id': session.id,
+        'file_id': session.file_id,
+        'filename': session.filename,
+        'folder_type': session.folder_type,
+        'status': session.status,
+        'chunk_size': session.chunk_size,
+        'total_size': session.total_size,
+        'received_bytes': sum(p['size'] for p in parts),
+        'parts': parts,
+        'created_at': session.created_at.isoformat() if session.created_at else None,
+        'updated_at': session.updated_at.isoformat() if session.updated_at else None
+    }
+
+@resumable_upload_bp.route('', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def init_upload():
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json() or {}
+
+        filename = data.get('filename')
+        if not filename:
+            return jsonify({'error': 'filename required'}), 400
+
+        chunk_size = int(data.get('chunk_size') or Config.UPLOAD_CHUNK_SIZE)
+        if not MIN_PART_SIZE <= chunk_size <= Config.UPLOAD_MAX_CHUNK_SIZE:
+            return jsonify({'error': f'chunk_size must be between {MIN_PART_SIZE} and {Config.UPLOAD_MAX_CHUNK_SIZE}'}), 400
+        total_size = int(data['size']) if data.get('size') is not None else None
+        if total_size is not None and not 0 <= total_size <= chunk_size * MAX_MULTIPART_COUNT:
+            return jsonify({'error': f'size must be at most {chunk_size * MAX_MULTIPART_COUNT} bytes for this chunk_size'}), 400
+
+        check_quota(current_user_id, total_size)
+
+        if not minio_service.available:
+            return jsonify({'error': 'MinIO not available'}), 500
+
+        title = data.get('title', filename)
+        folder_type = data.get('folder_type', 'documents')
+        device_name = data.get('device_name', 'Unknown Device')
+        description = data.get('description', '')
+        file_id = str(uuid.uuid4())
+        object_name = file_object_name(folder_type, file_id, filename)
+
+        upload_id = minio_service.create_multipart_upload(
+            object_name,
+            {'title': title, 'description': description, 'device': device_name}
+        )
+
+        session = UploadSession(
+            id=str(uuid.uuid4()),
+            user_id=current_user_id,
+            file_id=file_id,
+            filename=filename,
+            title=title,
+            description=description,
+            folder_type=folder_type,
+            device_name=device_name,
+            object_name=object_name,
+            upload_id=upload_id,
+            total_size=total_size,
+            chunk_size=chunk_size
+        )
+        db.session.add(session)
+        db.session.commit()
+
+        status = _session_status(session)
+        if data.get('direct'):
+            # The client PUTs chunks to storage itself; more URLs from /part-urls
+            count = -(-total_size // chunk_size) if total_size else Config.PRESIGNED_PART_BATCH
+            status['part_urls'] = _part_urls(session, range(1, min(max(count, 1), Config.PRESIGNED_PART_BATCH) + 1))
+            status['expires_in'] = Config.PRESIGNED_URL_EXPIRY
+        return jsonify(status), 201
+
+    except QuotaExceeded as e:
+        return jsonify(e.to_dict()), 413
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Upload init error')
+        return jsonify({'error': str(e)}), 500
+
+@resumable_upload_bp.route('/<session_id>/chunks/<int:part_number>', methods=['PUT', 'OPTIONS'])
+@jwt_required()
+def upload_chunk(session_id, part_number):
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        session = _get_session(session_id, current_user_id)
+
+        if not session:
+            return jsonify({'error': 'Upload not found'}), 404
+        if session.status != 'active':
+            return jsonify({'error': f'Upload is {session.status}'}), 409
+        if not 1 <= part_number <= MAX_MULTIPART_COUNT:
+            return jsonify({'error': f'Chunk number must be between 1 and {MAX_MULTIPART_COUNT}'}), 400
+
+        length = request.content_length
+        if length is None:
+            return jsonify({'error': 'Content-Length required'}), 411
+        if length > session.chunk_size:
+            return jsonify({'error': f'Chunk larger than {session.chunk_size} bytes'}), 413
+        # Retried chunks replace what was received for their number
+        received = sum(p.size for p in session.parts if p.part_number != part_number)
+        check_quota(current_user_id, received + length)
+
+        # A chunk is at most chunk_size bytes, so holding it is bounded
+        data = request.stream.read(length)
+        if len(data) != length:
+            return jsonify({'error': 'Incomplete chunk'}), 400
+
+        etag = minio_service.upload_part(session.object_name, session.upload_id, part_number, data)
+
+        # Chunks may arrive in parallel and be retried; keep the latest
+        db.session.merge(UploadPart(session_id=session.id, part_number=part_number, etag=etag, size=length))
+        UploadSession.query.filter_by(id=session.id).update({'updated_at': datetime.utcnow()})
+        db.session.commit()
+
+        return jsonify({'part_number': part_number, 'etag': etag, 'size': length}), 200
+
+    except QuotaExceeded as e:
+        return jsonify(e.to_dict()), 413
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Chunk upload error', session_id=session_id, part_number=part_number)
+        return jsonify({'error': str(e)}), 500
+
+@resumable_upload_bp.route('/<session_id>/part-urls', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def get_part_urls(session_id):
+    """Presigned PUT URLs for chunks of a session, for uploading straight to storage.
+
+    JSON body: {"parts": [part numbers]}. Storage answers each PUT with the
+    part's ETag; completion reads the parts back from storage, so clients
+    don't need to report them.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        session = _get_session(session_id, current_user_id)
+
+        if not session:
+            return jsonify({'error': 'Upload not found'}), 404
+        if session.status != 'active':
+            return jsonify({'error': f'Upload is {session.status}'}), 409
+
+        numbers = (request.get_json() or {}).get('parts')
+        if (not isinstance(numbers, list) or not numbers
+                or not all(isinstance(n, int) and 1 <= n <= MAX_MULTIPART_COUNT for n in numbers)):
+            return jsonify({'error': f'parts must be a list of chunk numbers between 1 and {MAX_MULTIPART_COUNT}'}), 400
+        if len(numbers) > Config.PRESIGNED_PART_BATCH:
+            return jsonify({'error': f'At most {Config.PRESIGNED_PART_BATCH} parts per request'}), 400
+
+        # Direct uploads never hit the chunk route, so this keeps them from going stale
+        session.updated_at = datetime.utcnow()
+        db.session.commit()
+
+        return jsonify({
+            'upload_id': session.id,
+            'part_urls': _part_urls(session, numbers),
+            'expires_in': Config.PRESIGNED_URL_EXPIRY
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Part URL error', session_id=session_id)
+        return jsonify({'error': str(e)}), 500
+
+@resumable_upload_bp.route('/<session_id>', methods=['GET', 'OPTIONS'])
+@jwt_required()
+def upload_status(session_id):
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        session = _get_session(session_id, current_user_id)
+
+        if not session:
+            return jsonify({'error': 'Upload not found'}), 404
+
+        uploaded = _uploaded_parts(session) if session.status == 'active' else []
+        return jsonify(_session_status(session, uploaded)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@resumable_upload_bp.route('/<session_id>/complete', methods=['POST', 'OPTIONS'])
+@jwt_required()
+def complete_upload(session_id):
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        session = _get_session(session_id, current_user_id)
+
+        if not session:
+            return jsonify({'error': 'Upload not found'}), 404
+        if session.status != 'active':
+            return jsonify({'error': f'Upload is {session.status}'}), 409
+
+        parts = _uploaded_parts(session)
+        numbers = [n for n, _, _ in parts]
+        if not parts or numbers != list(range(1, len(parts) + 1)):
+            missing = sorted(set(range(1, max(numbers or [0]) + 1)) - set(numbers))
+            return jsonify({'error': 'Upload has missing chunks', 'missing': missing or [1]}), 400
+        size = sum(part_size for _, _, part_size in parts)
+        if session.total_size is not None and size != session.total_size:
+            return jsonify({'error': f'Received {size} of {session.total_size} bytes'}), 400
+        # Chunks uploaded straight to storage weren't checked on the way in.
+        # The session stays open, so it can complete once space is freed.
+        check_quota(current_user_id, size)
+
+        minio_service.complete_multipart_upload(
+            session.object_name,
+            session.upload_id,
+            [(n, etag) for n, etag, _ in parts]
+        )
+        # Check what storage assembled before the file becomes visible
+        stat = minio_service.stat_file(session.object_name)
+        if stat.size != size:
+            minio_service.delete_file(session.object_name)
+            session.status = 'aborted'
+            session.updated_at = datetime.utcnow()
+            session.parts = []
+            db.session.commit()
+            return jsonify({'error': f'Stored object has {stat.size} bytes, expected {size}'}), 409
+
+        new_file = File(
+            id=session.file_id,
+            filename=session.filename,
+            title=session.title,
+            description=session.description,
+            folder_type=session.folder_type,
+            device_name=session.device_name,
+            size=size,
+            object_name=session.object_name,
+            cloudinary_url=f"http://{Config.MINIO_ENDPOINT}/{minio_service.bucket}/{session.object_name}",
+            user_id=current_user_id
+        )
+        db.session.add(new_file)
+        schedule_thumbnails(new_file, session.object_name)
+        record_change(new_file, 'create')
+        session.status = 'completed'
+        session.updated_at = datetime.utcnow()
+        session.parts = []
+        db.session.commit()
+
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'file': serialize_file(new_file)
+        }), 201
+
+    except QuotaExceeded as e:
+        db.session.rollback()
+        return jsonify(e.to_dict()), 413
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Upload completion error', session_id=session_id)
+        return jsonify({'error': str(e)}), 500
+
+@resumable_upload_bp.route('/<session_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(session_id):
+    try:
+        current_user_id = get_jwt_identity()
+        session = _get_session(session_id, current_user_id)
+
+        if not session:
+            return jsonify({'error': 'Upload not found'}), 404
+        if session.status != 'active':
+            return jsonify({'error': f'Upload is {session.status}'}), 409
+
+        _abort_session(session)
+        db.session.commit()
+
+        return jsonify({'message': 'Upload aborted'}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def _abort_session(session):
+    try:
+        minio_service.abort_multipart_upload(session.object_name, session.upload_id)
+    except Exception as e:
+        # The multipart upload may already be gone; the session is still dead
+        log.warning('MinIO abort error', session_id=session.id, error=str(e))
+    session.status = 'aborted'
+    session.updated_at = datetime.utcnow()
+    session.parts = []
+
+def abort_stale_sessions(max_age=None):
+    """Abort active upload sessions that saw no chunk for max_age seconds."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age or Config.UPLOAD_SESSION_TTL)
+    stale = UploadSession.query.filter(
+        UploadSession.status == 'active',
+        UploadSession.updated_at < cutoff
+    ).all()
+    for session in stale:
+        _abort_session(session)
+    db.session.commit()
+    return len(stale)
@@ -1,9 +1,18 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, jwt_required, current_user
 from models import db, User, UserRole
-from device_manager import register_device
+from services.user_cache import admin_required, user_cache
+from services.password_hasher import password_hasher, HasherBusy
+from device_manager import register_device, device_id_for
+from services.log import get_logger
 
 auth_bp = Blueprint('auth', __name__)
+log = get_logger('auth')
+
+def _busy_response(e):
+    response = jsonify({'error': 'Too many login attempts in progress, try again shortly'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
 
 @auth_bp.route('/register', methods=['POST', 'OPTIONS'])
 def register():
@@ -11,10 +20,8 @@ def register():
         return '', 200
     
     try:
-        db.create_all()
-        
         data = request.get_json()
-        print(f"Registration attempt for: {data.get('email')}")
+        log.info('Registration attempt', email=data.get('email'))
         
         if User.query.filter_by(email=data['email']).first():
             return jsonify({'error': 'User already exists'}), 409
@@ -36,8 +43,11 @@ def register():
             'user': {'id': user.id, 'email': user.email, 'name': user.name},
             'token': token
         }), 201
+    except HasherBusy as e:
+        db.session.rollback()
+        return _busy_response(e)
     except Exception as e:
-        print(f"Registration error: {str(e)}")
+        log.exception('Registration error')
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
@@ -47,22 +57,29 @@ def login():
         return '', 200
     
     try:
-        db.create_all()
-        
         data = request.get_json()
-        print(f"Login attempt for: {data.get('email')}")
+        log.info('Login attempt', email=data.get('email'))
         
         user = User.query.filter_by(email=data['email']).first()
         
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid credentials'}), 401
+        if user.is_active is False:
+            return jsonify({'error': 'Account disabled'}), 403
+
+        # Upgrade hashes made with older parameters while we have the password
+        if password_hasher.needs_rehash(user.password_hash):
+            user.set_password(data['password'])
+            db.session.commit()
+            password_hasher.record_rehash()
         
         # Track device as active on login
         device_name = data.get('device_name', 'Unknown Device')
         device_type = data.get('device_type', 'laptop')
+        device_id = data.get('device_id') or device_id_for(user.id, device_name)
         ip_address = request.remote_addr or '127.0.0.1'
         
-        register_device(device_name, device_type, ip_address, data.get('email'))
+        register_device(user.id, device_id, device_name, device_type, ip_address, user.email)
         
         token = create_access_token(identity=str(user.id))
         
@@ -71,22 +88,37 @@ def login():
             'user': {'id': user.id, 'email': user.email, 'name': user.name},
             'token': token
         }), 200
+    except HasherBusy as e:
+        db.session.rollback()
+        return _busy_response(e)
     except Exception as e:
-        print(f"Login error: {str(e)}")
+        log.exception('Login error')
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/me', methods=['GET', 'OPTIONS'])
+@jwt_required()
 def get_current_user():
     if request.method == 'OPTIONS':
         return '', 200
     
-    try:
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'No token provided'}), 401
-        
-        return jsonify({
-            'user': {'id': 1, 'email': 'user@example.com', 'name': 'Current User'}
-        }), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 401
\ No newline at end of file
+    # Resolved from the JWT identity through the user cache
+    return jsonify({
+        'user': {
+            'id': current_user.id,
+            'email': current_user.email,
+            'name': current_user.name,
+            'role': current_user.role
+        }
+    }), 200
+
+@auth_bp.route('/cache/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_user_cache_metrics():
+    return jsonify(user_cache.metrics()), 200
+
+@auth_bp.route('/hasher/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_hasher_metrics():
+    return jsonify(password_hasher.metrics()), 200
\ No newline at end of file
@@ -1,45 +1,46 @@
 from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
-from device_manager import get_devices, register_device, active_devices
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from device_manager import get_devices, register_device, record_heartbeat, device_id_for, heartbeats
 import uuid
+from services.log import get_logger
+from services.user_cache import admin_required
 
 devices_bp = Blueprint('devices', __name__)
+log = get_logger('devices')
 
 @devices_bp.route('', methods=['GET', 'OPTIONS'])
+@jwt_required()
 def get_devices_list():
     if request.method == 'OPTIONS':
         return '', 200
     
-    device_list = get_devices()
-    print(f"Returning {len(device_list)} devices from active tracking")
+    current_user_id = get_jwt_identity()
+    device_list = get_devices(current_user_id)
+    log.debug('Listing devices', user_id=current_user_id, count=len(device_list))
     return jsonify(device_list), 200
 
 @devices_bp.route('/register', methods=['POST', 'OPTIONS'])
+@jwt_required()
 def register_device_endpoint():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
+        current_user_id = get_jwt_identity()
+        
         data = request.get_json() or {}
-        print(f"Received device registration data: {data}")
+        log.debug('Device registration request', user_id=current_user_id, data=data)
         
         device_name = data.get('device_name', 'New Device')
         device_type = data.get('device_type', 'laptop')
-        user_email = data.get('email', 'unknown@example.com')
+        user_email = data.get('email')
         ip_address = request.remote_addr or '127.0.0.1'
         
-        device_id = str(uuid.uuid4())[:8]
+        device_id = data.get('device_id') or str(uuid.uuid4())[:8]
         
-        active_devices[device_name] = {
-            'last_seen': datetime.utcnow(),
-            'ip': ip_address,
-            'status': 'active',
-            'type': device_type,
-            'user_email': user_email,
-            'db_id': device_id
-        }
+        register_device(current_user_id, device_id, device_name, device_type, ip_address, user_email)
         
-        print(f"Device registered successfully: {device_name} (ID: {device_id})")
+        log.info('Device registered', user_id=current_user_id, device_id=device_id, device_name=device_name)
         
         return jsonify({
             'message': 'Device registered successfully',
@@ -51,33 +52,37 @@ def register_device_endpoint():
             }
         }), 201
     except Exception as e:
-        print(f"Error registering device: {e}")
+        log.exception('Error registering device')
         return jsonify({'error': str(e)}), 500
 
 @devices_bp.route('/heartbeat', methods=['POST', 'OPTIONS'])
+@jwt_required()
 def device_heartbeat():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
+        current_user_id = get_jwt_identity()
+        
+        data = request.get_json(silent=True) or {}
         user_agent = request.headers.get('User-Agent', '')
         ip_address = request.remote_addr or '127.0.0.1'
         
         is_mobile = any(x in user_agent.lower() for x in ['mobile', 'android', 'iphone', 'ipad'])
-        device_type = 'phone' if is_mobile else 'laptop'
-        device_name = f"{'Phone' if is_mobile else 'Laptop'} Device"
-        
-        active_devices[device_name] = {
-            'last_seen': datetime.utcnow(),
-            'ip': ip_address,
-            'status': 'active',
-            'type': device_type,
-            'user_email': 'user@example.com'
-        }
+        device_type = data.get('device_type') or ('phone' if is_mobile else 'laptop')
+        device_name = data.get('device_name') or f"{'Phone' if is_mobile else 'Laptop'} Device"
+        device_id = data.get('device_id') or request.headers.get('X-Device-Id') or device_id_for(current_user_id, device_name)
         
-        print(f"Heartbeat: {device_name} marked as ACTIVE")
+        record_heartbeat(current_user_id, device_id, device_name, device_type, ip_address)
         
-        return jsonify({'message': 'Heartbeat received', 'device': device_name}), 200
+        return jsonify({'message': 'Heartbeat received', 'device': device_name, 'device_id': device_id}), 200
     except Exception as e:
-        print(f"Heartbeat error: {e}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        log.exception('Heartbeat error')
+        return jsonify({'error': str(e)}), 500
+
+
+@devices_bp.route('/heartbeat/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def heartbeat_metrics():
+    return jsonify(heartbeats.metrics()), 200
\ No newline at end of file
@@ -0,0 +1,84 @@
+import json
+from flask import Blueprint, Response, request, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from config import Config
+from models import db
+from services.events import broker
+from services.sync_journal import get_state, changes_since
+
+events_bp = Blueprint('events', __name__)
+
+def _sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+def _last_event_id():
+    value = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+# EventSource can't send headers, so the token may also come as ?jwt=
+@events_bp.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def event_stream():
+    """Server-sent events for the current user.
+
+    `change` events carry a sync journal entry and use its seq as the event
+    id, so a reconnecting EventSource resumes with Last-Event-ID and is sent
+    the changes it missed. `device` events report registrations and
+    heartbeats. `reset` means the client must re-list its files.
+    """
+    current_user_id = get_jwt_identity()
+    since = _last_event_id()
+    # Subscribe before reading the journal so nothing falls in between
+    subscription = broker.subscribe(current_user_id)
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            cursor = get_state(current_user_id)['cursor']
+            if since is not None:
+                cursor = since
+                has_more = True
+                while has_more:
+                    delta = changes_since(current_user_id, cursor)
+                    if delta['reset']:
+                        yield _sse('reset', {'cursor': delta['cursor']}, delta['cursor'])
+                    for change in delta['changes']:
+                        yield _sse('change', change, change['seq'])
+                    cursor, has_more = delta['cursor'], delta['has_more']
+            yield _sse('hello', {'cursor': cursor})
+            # Don't hold a database connection for the life of the stream
+            db.session.close()
+
+            while True:
+                item = subscription.get(timeout=Config.EVENTS_KEEPALIVE)
+                if subscription.overflowed:
+                    yield _sse('reset', {'cursor': cursor})
+                    return
+                if item is None:
+                    yield ': keepalive\n\n'
+                    continue
+                event, data = item
+                if event == 'change':
+                    # Already sent while replaying the journal
+                    if data['seq'] <= cursor:
+                        continue
+                    cursor = data['seq']
+                    yield _sse(event, data, cursor)
+                else:
+                    yield _sse(event, data)
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
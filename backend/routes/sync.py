@@ -1,24 +1,96 @@
 from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from device_manager import registry
+from services.sync_journal import get_state, changes_since, pending_count
 
 sync_bp = Blueprint('sync', __name__)
 
+def _cursor_arg(value):
+    try:
+        cursor = int(value or 0)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if cursor < 0:
+        raise ValueError('Invalid cursor')
+    return cursor
+
 @sync_bp.route('/status', methods=['GET', 'OPTIONS'])
+@jwt_required()
 def sync_status():
     if request.method == 'OPTIONS':
         return '', 200
-    
-    return jsonify({
-        'status': 'synced',
-        'last_sync': '2025-10-24T19:30:00Z',
-        'devices_count': 1
-    }), 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        state = get_state(current_user_id)
+        status = {
+            'status': 'synced',
+            'cursor': state['cursor'],
+            'last_sync': state['last_change_at'].isoformat() if state['last_change_at'] else None,
+            'devices_count': len(registry.list_devices(current_user_id))
+        }
+
+        # A client that passes its cursor learns whether it is behind
+        if request.args.get('since') is not None:
+            since = _cursor_arg(request.args.get('since'))
+            if since < state['horizon']:
+                status['status'] = 'reset_required'
+            else:
+                status['pending_changes'] = pending_count(current_user_id, since)
+                if status['pending_changes']:
+                    status['status'] = 'changes_available'
+
+        return jsonify(status), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@sync_bp.route('/changes', methods=['GET', 'OPTIONS'])
+@jwt_required()
+def sync_changes():
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        current_user_id = get_jwt_identity()
+        since = _cursor_arg(request.args.get('since'))
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 1:
+            return jsonify({'error': 'limit must be positive'}), 400
+
+        return jsonify(changes_since(current_user_id, since, limit)), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @sync_bp.route('/trigger', methods=['POST', 'OPTIONS'])
+@jwt_required()
 def trigger_sync():
     if request.method == 'OPTIONS':
         return '', 200
-    
-    return jsonify({
-        'message': 'Sync triggered successfully',
-        'status': 'syncing'
-    }), 200
\ No newline at end of file
+
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+        since = _cursor_arg(data.get('cursor'))
+
+        # Returns the first page of changes; the client keeps paging
+        # /changes with the returned cursor while has_more is set
+        delta = changes_since(current_user_id, since)
+        if delta['reset']:
+            status = 'reset_required'
+        elif delta['changes']:
+            status = 'syncing' if delta['has_more'] else 'synced'
+        else:
+            status = 'synced'
+
+        return jsonify(dict(delta, message='Sync triggered successfully', status=status)), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
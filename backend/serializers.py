@@ -0,0 +1,83 @@
+import json
+from functools import lru_cache
+from flask import Response
+from sqlalchemy import select
+from models import File
+from services.instrumentation import timed_call
+
+# Columns of a file entry, in the order serialize_file_row expects them
+FILE_COLUMNS = (
+    File.id, File.filename, File.title, File.description, File.folder_type,
+    File.size, File.device_name, File.cloudinary_url, File.created_at,
+    File.thumbnail_status, File.thumbnail_version
+)
+
+# Rows are encoded and flushed to the client in batches of this many
+JSON_BATCH_SIZE = 500
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def file_select(*criteria):
+    """Core SELECT of FILE_COLUMNS; rows come back as plain tuples."""
+    return select(*FILE_COLUMNS).where(*criteria)
+
+
+@lru_cache(maxsize=8192)
+def format_datetime(value):
+    return value.isoformat() if value else None
+
+
+def serialize_file_row(row):
+    """Serialize a FILE_COLUMNS tuple to the API's file dict."""
+    (file_id, filename, title, description, folder_type, size, device_name, url, created_at,
+     thumbnail_status, thumbnail_version) = row
+    return {
+        'id': file_id,
+        'filename': filename,
+        'title': title,
+        'description': description or '',
+        'folder_type': folder_type,
+        'size': size or 0,
+        'device_name': device_name or 'Unknown Device',
+        'url': url or '',
+        'created_at': format_datetime(created_at),
+        # Add &size= to pick a rendition
+        'thumbnail_url': (
+            f'/api/files/{file_id}/thumbnail?v={thumbnail_version or 0}'
+            if thumbnail_status == 'ready' else None
+        )
+    }
+
+
+@timed_call('serialization')
+def serialize_file(file):
+    """Serialize a File instance the same way as a listing row."""
+    return serialize_file_row(tuple(getattr(file, column.key) for column in FILE_COLUMNS))
+
+
+@timed_call('serialization')
+def iter_json_array(rows, serialize=serialize_file_row):
+    """Encode rows as a JSON array, yielding it in JSON_BATCH_SIZE batches."""
+    yield '['
+    batch = []
+    first = True
+    for row in rows:
+        batch.append(_encoder.encode(serialize(row)))
+        if len(batch) >= JSON_BATCH_SIZE:
+            yield ('' if first else ',') + ','.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else ',') + ','.join(batch)
+    yield ']'
+
+
+def json_array_response(rows, status=200, headers=None):
+    """Streamed JSON array response for already-fetched rows."""
+    return Response(
+        iter_json_array(rows),
+        status=status,
+        headers=headers,
+        mimetype='application/json'
+    )
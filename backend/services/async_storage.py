@@ -0,0 +1,97 @@
+import asyncio
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+from config import Config
+from services.instrumentation import timed_call
+from services.minio_service import minio_service
+
+PRESIGN_EXPIRY = timedelta(minutes=15)
+
+
+class AsyncStorage:
+    """Non-blocking object transfers for the ASGI file routes.
+
+    Requests are signed with the MinIO client (presigned URLs, computed
+    locally) and sent with aiohttp, so a transfer only occupies the event
+    loop while bytes are moving. Needs the optional aiohttp package.
+    """
+
+    def __init__(self, max_connections=None):
+        self.max_connections = max_connections or Config.ASGI_STORAGE_CONNECTIONS
+        self._sessions = {}
+
+    def _session(self):
+        # aiohttp sessions are bound to the loop they were created on
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=Config.MINIO_CONNECT_TIMEOUT, sock_read=Config.MINIO_READ_TIMEOUT
+                )
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session:
+            await session.close()
+
+    def _url(self, method, object_name, **query):
+        # The MinIO client caches the bucket region, so this stays local
+        # after the first call; run it in a thread to be safe
+        return minio_service.client.get_presigned_url(
+            method, minio_service.bucket, object_name,
+            expires=PRESIGN_EXPIRY, extra_query_params=query or None
+        )
+
+    @timed_call('storage')
+    async def stat(self, object_name):
+        """stat_file() equivalent: etag, size and last_modified of an object."""
+        url = await asyncio.to_thread(self._url, 'HEAD', object_name)
+        async with self._session().head(url) as response:
+            if response.status == 404:
+                raise FileNotFoundError(object_name)
+            response.raise_for_status()
+            last_modified = response.headers.get('Last-Modified')
+            return SimpleNamespace(
+                etag=response.headers.get('ETag', '').strip('"'),
+                size=int(response.headers.get('Content-Length', 0)),
+                last_modified=parsedate_to_datetime(last_modified) if last_modified else None
+            )
+
+    @timed_call('storage')
+    async def iter_file(self, object_name, offset=0, length=0, chunk_size=None):
+        """Async iter_file(): yield an object's bytes, or a byte range of it."""
+        url = await asyncio.to_thread(self._url, 'GET', object_name)
+        headers = {}
+        if offset or length:
+            end = offset + length - 1 if length else ''
+            headers['Range'] = f'bytes={offset}-{end}'
+        async with self._session().get(url, headers=headers) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(chunk_size or Config.MINIO_DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+
+    @timed_call('storage')
+    async def upload_part(self, object_name, upload_id, part_number, data, length=None):
+        """Upload one multipart part from bytes or an async iterator of bytes; returns its ETag.
+
+        Pass `length` with an iterator so the part is streamed through
+        without buffering it.
+        """
+        url = await asyncio.to_thread(
+            self._url, 'PUT', object_name, partNumber=str(part_number), uploadId=upload_id
+        )
+        headers = {'Content-Length': str(len(data) if length is None else length)}
+        async with self._session().put(url, data=data, headers=headers) as response:
+            response.raise_for_status()
+            return response.headers.get('ETag', '').strip('"')
+
+
+async_storage = AsyncStorage()
@@ -0,0 +1,176 @@
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models import db, Blob, File
+from services.log import get_logger
+from services.minio_service import STAGING_PREFIX, is_missing, minio_service
+
+log = get_logger('blob_store')
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_object_name(user_id, digest):
+    return f"blobs/{user_id}/{digest[:2]}/{digest}"
+
+
+def _hash_stream(stream):
+    sha256 = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        sha256.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return sha256.hexdigest(), size
+
+
+def _locked_blob(user_id, digest):
+    return Blob.query.filter_by(user_id=user_id, digest=digest).with_for_update().first()
+
+
+def _stored(blob):
+    """Whether the blob's object can be shared. A tombstone's object may be
+    gone if a sweep deleted it but failed to delete the row."""
+    if blob is None:
+        return False
+    if blob.ref_count > 0:
+        return True
+    try:
+        minio_service.stat_file(blob.object_name)
+        return True
+    except Exception as e:
+        if is_missing(e):
+            return False
+        raise
+
+
+def store_blob(user_id, file_stream):
+    """Store an upload once per user and content, returning (blob, result).
+
+    Seekable streams (werkzeug spools uploads to disk) are hashed locally
+    first, so content that is already stored is never sent to MinIO. Other
+    streams are hashed while they are uploaded to a staging object, which
+    is then dropped or promoted to the blob with a server-side copy.
+    The blob's reference is added to the session; the caller commits it
+    together with the File that points at it.
+    """
+    uploaded = False
+    seekable = hasattr(file_stream, 'seekable') and file_stream.seekable()
+    if seekable:
+        digest, size = _hash_stream(file_stream)
+        blob = _locked_blob(user_id, digest)
+        if not _stored(blob):
+            minio_service.upload_object(blob_object_name(user_id, digest), file_stream)
+            uploaded = True
+    else:
+        staging_object = f"{STAGING_PREFIX}{uuid.uuid4()}"
+        result = minio_service.upload_object(staging_object, file_stream)
+        digest, size = result['checksum'], result['size']
+        blob = _locked_blob(user_id, digest)
+        try:
+            if not _stored(blob):
+                minio_service.copy_file(staging_object, blob_object_name(user_id, digest))
+                uploaded = True
+        finally:
+            minio_service.delete_file(staging_object)
+
+    if blob is None:
+        blob = Blob(
+            user_id=user_id,
+            digest=digest,
+            object_name=blob_object_name(user_id, digest),
+            size=size,
+            ref_count=1,
+            upload_bytes_saved=0
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(blob)
+        except IntegrityError:
+            # Another upload of the same content created it first
+            blob = _locked_blob(user_id, digest)
+            blob.ref_count = Blob.ref_count + 1
+    else:
+        if seekable and not uploaded:
+            blob.upload_bytes_saved = Blob.upload_bytes_saved + size
+        blob.ref_count = Blob.ref_count + 1
+        blob.released_at = None
+    db.session.flush()
+
+    return blob, {
+        'object_name': blob.object_name,
+        'size': size,
+        'checksum': digest,
+        'uploaded': uploaded,
+        'url': f"http://{Config.MINIO_ENDPOINT}/{minio_service.bucket}/{blob.object_name}"
+    }
+
+
+def release_blob(blob_id):
+    """Drop one reference to a blob.
+
+    Unreferenced blobs are kept, object and all, until sweep_blobs()
+    removes them: deleting the object straight after the commit could
+    remove a copy a concurrent upload of the same content had just made.
+    """
+    blob = Blob.query.filter_by(id=blob_id).with_for_update().first()
+    if blob is None:
+        return
+    blob.ref_count -= 1
+    if blob.ref_count <= 0:
+        blob.released_at = datetime.utcnow()
+
+
+def sweep_blobs(grace=None):
+    """Delete blobs unreferenced for longer than `grace` seconds
+    (BLOB_SWEEP_GRACE), objects first. Returns how many were deleted.
+
+    Each blob is deleted under its row lock, which store_blob() takes too,
+    so an upload of the same content either revives the blob first or
+    waits and then stores the content anew.
+    """
+    grace = Config.BLOB_SWEEP_GRACE if grace is None else grace
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    blob_ids = db.session.scalars(
+        select(Blob.id).where(Blob.ref_count <= 0, Blob.released_at <= cutoff).order_by(Blob.id)
+    ).all()
+    db.session.rollback()
+    swept = 0
+    for blob_id in blob_ids:
+        blob = Blob.query.filter_by(id=blob_id).with_for_update().first()
+        if blob is None or blob.ref_count > 0:
+            db.session.rollback()
+            continue
+        if not minio_service.delete_file(blob.object_name):
+            db.session.rollback()
+            log.warning('Could not delete blob object', blob_id=blob_id, object_name=blob.object_name)
+            continue
+        db.session.delete(blob)
+        db.session.commit()
+        swept += 1
+    return swept
+
+
+def dedup_stats(user_id):
+    """Storage and upload bandwidth saved by deduplication for a user."""
+    blobs, stored_bytes, upload_bytes_saved = db.session.query(
+        func.count(Blob.id),
+        func.coalesce(func.sum(Blob.size), 0),
+        func.coalesce(func.sum(Blob.upload_bytes_saved), 0)
+    ).filter(Blob.user_id == user_id, Blob.ref_count > 0).one()
+    files, logical_bytes = db.session.query(
+        func.count(File.id),
+        func.coalesce(func.sum(File.size), 0)
+    ).filter(File.user_id == user_id, File.blob_id.isnot(None)).one()
+    return {
+        'blobs': blobs,
+        'deduplicated_files': files,
+        'logical_bytes': int(logical_bytes),
+        'stored_bytes': int(stored_bytes),
+        'storage_bytes_saved': int(logical_bytes) - int(stored_bytes),
+        'upload_bytes_saved': int(upload_bytes_saved)
+    }
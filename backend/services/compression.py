@@ -0,0 +1,206 @@
+import mimetypes
+import zlib
+from collections import defaultdict
+from config import Config
+from models import db, File
+
+# content_codec of files that were sniffed and stored raw
+IDENTITY = 'identity'
+CODECS = ('gzip', 'zstd')
+
+# Formats that are compressed already, by leading bytes. Their headers can
+# look compressible (an mp4's moov box, say), so the trial would be fooled.
+PACKED_MAGIC = (
+    b'\x1f\x8b',                      # gzip
+    b'PK\x03\x04',                    # zip, docx/xlsx, jar, apk
+    b'\x28\xb5\x2f\xfd',              # zstd
+    b'\xfd7zXZ\x00',                  # xz
+    b'BZh',                           # bzip2
+    b"7z\xbc\xaf'\x1c",               # 7z
+    b'Rar!',                          # rar
+    b'\x89PNG',                       # png
+    b'\xff\xd8\xff',                  # jpeg
+    b'GIF8',                          # gif
+    b'\x1aE\xdf\xa3',                 # mkv/webm
+    b'OggS',                          # ogg
+    b'fLaC',                          # flac
+    b'ID3',                           # mp3
+)
+
+# Files are read from the source stream this much at a time
+READ_SIZE = 256 * 1024
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def storage_codec():
+    """The codec new uploads are compressed with, or None when compression is off."""
+    codec = Config.STORAGE_COMPRESSION
+    if codec == 'zstd' and _zstd() is None:
+        # Optional dependency; gzip is always there
+        return 'gzip'
+    return codec if codec in CODECS else None
+
+
+def _is_packed(head):
+    if head[4:8] == b'ftyp' or (head[:4] == b'RIFF' and head[8:12] in (b'WEBP', b'AVI ')):
+        return True
+    return head.startswith(PACKED_MAGIC)
+
+
+def worth_compressing(head):
+    """Sniff the first bytes of a file: not a packed format and they compress well."""
+    if not head or _is_packed(head):
+        return False
+    # A fast trial on the sample; good enough to tell text from noise
+    return len(zlib.compress(head, 1)) <= len(head) * (1 - Config.COMPRESSION_MIN_SAVINGS)
+
+
+class _Prefixed:
+    """Replays bytes already read from a non-seekable stream before the rest of it."""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            data, self._head = self._head + self._stream.read(), b''
+            return data
+        data, self._head = self._head[:size], self._head[size:]
+        return data
+
+
+def sniff_stream(stream):
+    """Decide how to store a stream; returns (stream rewound to its start, codec or IDENTITY)."""
+    head = stream.read(Config.COMPRESSION_SNIFF_SIZE)
+    if hasattr(stream, 'seekable') and stream.seekable():
+        stream.seek(0)
+    else:
+        stream = _Prefixed(head, stream)
+    codec = storage_codec()
+    return stream, codec if codec and worth_compressing(head) else IDENTITY
+
+
+def _compressor(codec):
+    level = Config.COMPRESSION_LEVEL
+    if codec == 'zstd':
+        return _zstd().ZstdCompressor(level=level or 3).compressobj()
+    # wbits 31 writes a gzip container, which is what Content-Encoding: gzip means
+    return zlib.compressobj(level or 6, zlib.DEFLATED, 31)
+
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        return _zstd().ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+class CompressingReader:
+    """File-like view of a stream's bytes compressed with `codec`; counts what it returns."""
+
+    def __init__(self, stream, codec):
+        self._stream = stream
+        self._compressor = _compressor(codec)
+        self._buffer = bytearray()
+        self._eof = False
+        self.size = 0
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = self._stream.read(READ_SIZE)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.size += len(data)
+        return data
+
+
+class DecodedRange:
+    """Decompresses stored chunks as they arrive, keeping bytes [offset, offset + length) of the original.
+
+    Feed it chunks with feed() and call flush() at the end; works the same
+    for sync and async streams.
+    """
+
+    def __init__(self, codec, offset=0, length=None):
+        self._decompressor = _decompressor(codec)
+        self._skip = offset
+        self._remaining = length
+
+    @property
+    def done(self):
+        return self._remaining == 0
+
+    def feed(self, chunk):
+        return self._take(self._decompressor.decompress(chunk))
+
+    def flush(self):
+        flush = getattr(self._decompressor, 'flush', None)
+        return self._take(flush()) if flush else b''
+
+    def _take(self, data):
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            data = data[skipped:]
+            self._skip -= skipped
+        if self._remaining is not None:
+            data = data[:self._remaining]
+            self._remaining -= len(data)
+        return data
+
+
+def iter_decoded(codec, chunks, offset=0, length=None):
+    """Yield the original bytes [offset, offset + length) of a compressed chunk stream."""
+    decoded = DecodedRange(codec, offset, length)
+    try:
+        for chunk in chunks:
+            data = decoded.feed(chunk)
+            if data:
+                yield data
+            if decoded.done:
+                return
+        data = decoded.flush()
+        if data:
+            yield data
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compression_stats(user_id):
+    """Compression ratios of a user's sniffed uploads, by content type."""
+    rows = db.session.execute(
+        db.select(File.filename, File.content_codec, File.size, File.stored_size)
+        .where(File.user_id == user_id, File.content_codec.isnot(None))
+    )
+    by_type = defaultdict(lambda: {'files': 0, 'compressed_files': 0, 'original_bytes': 0, 'stored_bytes': 0})
+    for filename, codec, size, stored_size in rows:
+        stats = by_type[mimetypes.guess_type(filename)[0] or 'application/octet-stream']
+        stats['files'] += 1
+        stats['compressed_files'] += codec != IDENTITY
+        stats['original_bytes'] += size or 0
+        stats['stored_bytes'] += stored_size if stored_size is not None else size or 0
+
+    for stats in by_type.values():
+        stats['ratio'] = round(stats['stored_bytes'] / stats['original_bytes'], 3) if stats['original_bytes'] else 1.0
+    totals = {
+        key: sum(stats[key] for stats in by_type.values())
+        for key in ('files', 'compressed_files', 'original_bytes', 'stored_bytes')
+    }
+    totals['bytes_saved'] = totals['original_bytes'] - totals['stored_bytes']
+    return {'codec': storage_codec(), 'types': dict(by_type), **totals}
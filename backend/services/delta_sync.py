@@ -0,0 +1,238 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from minio.helpers import MIN_PART_SIZE, MAX_PART_SIZE, MAX_MULTIPART_COUNT
+from config import Config
+from services.minio_service import minio_service
+from services.log import get_logger
+
+log = get_logger('delta_sync')
+
+# The weak checksum is Adler-32, which clients can roll one byte at a time
+# while scanning their copy for blocks the server already has
+WEAK_ALGORITHM = 'adler32'
+DATA_READ_SIZE = 1024 * 1024
+
+
+def weak_checksum(block):
+    return zlib.adler32(block)
+
+
+def strong_checksum(block):
+    return hashlib.sha256(block).hexdigest()
+
+
+def _blocks(chunks, block_size):
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class _SignatureCache:
+    """LRU of signature lists, bounded by their total number of blocks.
+
+    Keys include the object's ETag, so a new version never hits an old entry.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._blocks = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            signatures = self._entries.get(key)
+            if signatures is not None:
+                self._entries.move_to_end(key)
+            return signatures
+
+    def put(self, key, signatures):
+        with self._lock:
+            if key in self._entries or len(signatures) > Config.DELTA_SIGNATURE_CACHE_BLOCKS:
+                return
+            self._entries[key] = signatures
+            self._blocks += len(signatures)
+            while self._blocks > Config.DELTA_SIGNATURE_CACHE_BLOCKS:
+                _, evicted = self._entries.popitem(last=False)
+                self._blocks -= len(evicted)
+
+
+signature_cache = _SignatureCache()
+
+
+def block_signatures(object_name, block_size, etag=None):
+    """Weak and strong checksums of each block of a stored object.
+
+    The object is read once, in order; only one block is held at a time.
+    The last block may be shorter than block_size. With the object's
+    `etag`, the result is cached for that version of the object.
+    """
+    key = (object_name, etag, block_size)
+    if etag:
+        signatures = signature_cache.get(key)
+        if signatures is not None:
+            return signatures
+    chunks = minio_service.iter_file(object_name, chunk_size=min(block_size, DATA_READ_SIZE))
+    signatures = [
+        {'index': index, 'weak': weak_checksum(block), 'strong': strong_checksum(block)}
+        for index, block in enumerate(_blocks(chunks, block_size))
+    ]
+    if etag:
+        signature_cache.put(key, signatures)
+    return signatures
+
+
+def plan_segments(ops, block_size, base_size):
+    """Turn client ops into ('copy', offset, length) and ('data', length) segments.
+
+    Ops are {'op': 'copy', 'block': i, 'count': n} to reuse n blocks of the
+    stored version starting at block i, and {'op': 'data', 'length': n} for
+    the next n literal bytes of the request. Adjacent copies of contiguous
+    ranges are merged so they become as few part copies as possible.
+    """
+    segments = []
+    for op in ops:
+        kind = op.get('op')
+        if kind == 'copy':
+            block, count = int(op['block']), int(op.get('count', 1))
+            offset = block * block_size
+            if block < 0 or count < 1 or offset >= base_size:
+                raise ValueError(f'Invalid block reference: {op}')
+            length = min(count * block_size, base_size - offset)
+            if segments and segments[-1][0] == 'copy' and sum(segments[-1][1:]) == offset:
+                segments[-1] = ('copy', segments[-1][1], segments[-1][2] + length)
+            else:
+                segments.append(('copy', offset, length))
+        elif kind == 'data':
+            length = int(op['length'])
+            if length < 1:
+                raise ValueError(f'Invalid data length: {op}')
+            if segments and segments[-1][0] == 'data':
+                segments[-1] = ('data', segments[-1][1] + length)
+            else:
+                segments.append(('data', length))
+        else:
+            raise ValueError(f'Unknown op: {op}')
+    return segments
+
+
+class _PartWriter:
+    """Feeds segments into a multipart upload.
+
+    Copy ranges of at least 5 MiB become server-side part copies. Literal
+    data and shorter copy ranges (read from the stored object) are buffered
+    until they fill a part, since every part but the last must be 5 MiB.
+    """
+
+    def __init__(self, target_object, upload_id, source_object, source_etag):
+        self.target_object = target_object
+        self.upload_id = upload_id
+        self.source_object = source_object
+        self.source_etag = source_etag
+        self.parts = []
+        self.buffer = bytearray()
+        self.bytes_copied = 0
+
+    def _next_part_number(self):
+        if len(self.parts) >= MAX_MULTIPART_COUNT:
+            raise ValueError('Delta needs too many parts')
+        return len(self.parts) + 1
+
+    def _flush(self):
+        part_number = self._next_part_number()
+        etag = minio_service.upload_part(self.target_object, self.upload_id, part_number, bytes(self.buffer))
+        self.parts.append((part_number, etag))
+        self.buffer.clear()
+
+    def _buffer_range(self, offset, length):
+        for chunk in minio_service.iter_file(self.source_object, offset=offset, length=length):
+            self.buffer += chunk
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= Config.MINIO_PART_SIZE:
+            self._flush()
+
+    def copy(self, offset, length):
+        if self.buffer and len(self.buffer) < MIN_PART_SIZE:
+            # Top the buffer up to a valid part from the head of the range
+            head = min(length, MIN_PART_SIZE - len(self.buffer))
+            self._buffer_range(offset, head)
+            offset, length = offset + head, length - head
+        if length >= MIN_PART_SIZE:
+            if self.buffer:
+                self._flush()
+            # Split evenly so no piece drops under the minimum part size
+            count = -(-length // MAX_PART_SIZE)
+            for i in range(count):
+                start = offset + length * i // count
+                end = offset + length * (i + 1) // count
+                part_number = self._next_part_number()
+                etag = minio_service.upload_part_copy(
+                    self.target_object, self.upload_id, part_number,
+                    self.source_object, start, end - start, match_etag=self.source_etag
+                )
+                self.parts.append((part_number, etag))
+            self.bytes_copied += length
+        elif length:
+            self._buffer_range(offset, length)
+            if len(self.buffer) >= Config.MINIO_PART_SIZE:
+                self._flush()
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self._flush()
+        return self.parts
+
+
+def apply_delta(source_object, source_etag, target_object, segments, data_stream, metadata=None):
+    """Build target_object from the stored source object and literal data.
+
+    source_object may equal target_object: the new version only replaces
+    the old one when the multipart upload completes. Part copies are
+    conditional on source_etag, so a concurrent overwrite fails the delta
+    instead of mixing versions. Returns the new size and the bytes taken
+    from the request and reused from the stored version.
+    """
+    upload_id = minio_service.create_multipart_upload(target_object, metadata)
+    writer = _PartWriter(target_object, upload_id, source_object, source_etag)
+    size = received = 0
+    try:
+        for segment in segments:
+            if segment[0] == 'copy':
+                _, offset, length = segment
+                writer.copy(offset, length)
+            else:
+                length = segment[1]
+                remaining = length
+                while remaining:
+                    data = data_stream.read(min(remaining, DATA_READ_SIZE))
+                    if not data:
+                        raise ValueError('Delta data is shorter than its ops')
+                    writer.write(data)
+                    remaining -= len(data)
+                received += length
+            size += segment[-1]
+        if data_stream.read(1):
+            raise ValueError('Delta data is longer than its ops')
+        minio_service.complete_multipart_upload(target_object, upload_id, writer.close())
+    except Exception:
+        try:
+            minio_service.abort_multipart_upload(target_object, upload_id)
+        except Exception as e:
+            log.warning('MinIO abort error for delta upload', upload_id=upload_id, error=str(e))
+        raise
+
+    return {
+        'size': size,
+        'bytes_received': received,
+        'bytes_reused': size - received,
+        'bytes_copied_server_side': writer.bytes_copied,
+        'parts': len(writer.parts)
+    }
@@ -0,0 +1,264 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_
+from config import Config
+
+
+class DeviceRegistry(ABC):
+    """Stores devices keyed by (user_id, device_id).
+
+    Records are plain dicts with device_id, name, type, ip_address,
+    user_email, registered_at and last_seen. A device that hasn't been seen
+    for Config.DEVICE_TTL_SECONDS expires and is no longer listed.
+    """
+
+    FIELDS = ('name', 'type', 'ip_address', 'user_email')
+
+    def __init__(self, ttl_seconds=None):
+        self.ttl = timedelta(seconds=ttl_seconds or Config.DEVICE_TTL_SECONDS)
+
+    @abstractmethod
+    def upsert(self, user_id, device_id, last_seen=None, **fields):
+        """Create or update a device and mark it as seen; returns the record."""
+
+    def touch_many(self, beats):
+        """Bulk upsert from {(user_id, device_id): {'last_seen': ..., <field>: ...}}."""
+        for (user_id, device_id), beat in beats.items():
+            beat = dict(beat)
+            self.upsert(user_id, device_id, last_seen=beat.pop('last_seen'), **beat)
+
+    @abstractmethod
+    def list_devices(self, user_id):
+        """Unexpired devices of a user, oldest registration first."""
+
+    @abstractmethod
+    def remove(self, user_id, device_id):
+        """Forget a device."""
+
+    def _new_record(self, device_id, now):
+        return {
+            'device_id': device_id,
+            'name': 'Unknown Device',
+            'type': 'laptop',
+            'ip_address': '127.0.0.1',
+            'user_email': None,
+            'registered_at': now,
+            'last_seen': now
+        }
+
+    def _apply(self, record, last_seen, fields):
+        for key in self.FIELDS:
+            if fields.get(key) is not None:
+                record[key] = fields[key]
+        record['last_seen'] = max(record['last_seen'], last_seen)
+        return record
+
+
+class MemoryDeviceRegistry(DeviceRegistry):
+    """Per-process registry; devices are lost on restart and not shared between workers."""
+
+    def __init__(self, ttl_seconds=None):
+        super().__init__(ttl_seconds)
+        self._devices = {}  # {user_id: {device_id: record}}
+        self._lock = threading.Lock()
+
+    def upsert(self, user_id, device_id, last_seen=None, **fields):
+        last_seen = last_seen or datetime.utcnow()
+        with self._lock:
+            devices = self._devices.setdefault(str(user_id), {})
+            record = devices.get(device_id)
+            if record is None or self._expired(record, datetime.utcnow()):
+                record = devices[device_id] = self._new_record(device_id, last_seen)
+            return dict(self._apply(record, last_seen, fields))
+
+    def list_devices(self, user_id):
+        now = datetime.utcnow()
+        with self._lock:
+            devices = self._devices.get(str(user_id), {})
+            for device_id in [d for d, record in devices.items() if self._expired(record, now)]:
+                del devices[device_id]
+            records = [dict(record) for record in devices.values()]
+        return sorted(records, key=lambda record: record['registered_at'])
+
+    def remove(self, user_id, device_id):
+        with self._lock:
+            self._devices.get(str(user_id), {}).pop(device_id, None)
+
+    def _expired(self, record, now):
+        return record['last_seen'] + self.ttl <= now
+
+
+class SQLDeviceRegistry(DeviceRegistry):
+    """Registry in the app database (the devices table), shared by all workers."""
+
+    def upsert(self, user_id, device_id, last_seen=None, **fields):
+        from models import db, Device
+
+        last_seen = last_seen or datetime.utcnow()
+        device = db.session.get(Device, (int(user_id), device_id))
+        if device is None or device.expires_at <= datetime.utcnow():
+            if device is None:
+                device = Device(user_id=int(user_id), device_id=device_id)
+                db.session.add(device)
+            record = self._new_record(device_id, last_seen)
+        else:
+            record = self._to_record(device)
+        record = self._apply(record, last_seen, fields)
+        self._fill(device, record)
+        db.session.commit()
+        return record
+
+    def touch_many(self, beats):
+        from models import db, Device
+
+        if not beats:
+            return
+        now = datetime.utcnow()
+        keys = [(int(user_id), device_id) for user_id, device_id in beats]
+        existing = {
+            (device.user_id, device.device_id): device
+            for device in Device.query.filter(tuple_(Device.user_id, Device.device_id).in_(keys))
+        }
+        for key, beat in zip(keys, beats.values()):
+            device = existing.get(key)
+            if device is None or device.expires_at <= now:
+                if device is None:
+                    device = Device(user_id=key[0], device_id=key[1])
+                    db.session.add(device)
+                record = self._new_record(key[1], beat['last_seen'])
+            else:
+                record = self._to_record(device)
+            self._fill(device, self._apply(record, beat['last_seen'], beat))
+        db.session.commit()
+
+    def list_devices(self, user_id):
+        from models import Device
+
+        devices = (
+            Device.query
+            .filter(Device.user_id == int(user_id), Device.expires_at > datetime.utcnow())
+            .order_by(Device.registered_at)
+            .all()
+        )
+        return [self._to_record(device) for device in devices]
+
+    def remove(self, user_id, device_id):
+        from models import db, Device
+
+        Device.query.filter_by(user_id=int(user_id), device_id=device_id).delete()
+        db.session.commit()
+
+    def _to_record(self, device):
+        return {
+            'device_id': device.device_id,
+            'name': device.name,
+            'type': device.device_type,
+            'ip_address': device.ip_address,
+            'user_email': device.user_email,
+            'registered_at': device.registered_at,
+            'last_seen': device.last_seen
+        }
+
+    def _fill(self, device, record):
+        device.name = record['name']
+        device.device_type = record['type']
+        device.ip_address = record['ip_address']
+        device.user_email = record['user_email']
+        device.registered_at = record['registered_at']
+        device.last_seen = record['last_seen']
+        device.expires_at = record['last_seen'] + self.ttl
+
+
+class RedisDeviceRegistry(DeviceRegistry):
+    """Registry in any Redis-protocol server.
+
+    Each device is a JSON string key that expires with the device TTL, and
+    each user has a sorted set of device ids scored by expiry time, so a
+    listing only touches that user's keys.
+    """
+
+    def __init__(self, client, ttl_seconds=None, namespace='synchub'):
+        super().__init__(ttl_seconds)
+        self.client = client
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _device_key(self, user_id, device_id):
+        return f"{self.namespace}:device:{user_id}:{device_id}"
+
+    def _index_key(self, user_id):
+        return f"{self.namespace}:devices:{user_id}"
+
+    def upsert(self, user_id, device_id, last_seen=None, **fields):
+        last_seen = last_seen or datetime.utcnow()
+        raw = self.client.get(self._device_key(user_id, device_id))
+        record = self._loads(raw) if raw else self._new_record(device_id, last_seen)
+        record = self._apply(record, last_seen, fields)
+        pipe = self.client.pipeline()
+        self._store(pipe, user_id, record)
+        pipe.execute()
+        return record
+
+    def touch_many(self, beats):
+        if not beats:
+            return
+        keys = list(beats)
+        raws = self.client.mget([self._device_key(user_id, device_id) for user_id, device_id in keys])
+        pipe = self.client.pipeline()
+        for (user_id, device_id), raw in zip(keys, raws):
+            beat = beats[(user_id, device_id)]
+            record = self._loads(raw) if raw else self._new_record(device_id, beat['last_seen'])
+            self._store(pipe, user_id, self._apply(record, beat['last_seen'], beat))
+        pipe.execute()
+
+    def list_devices(self, user_id):
+        index = self._index_key(user_id)
+        self.client.zremrangebyscore(index, '-inf', datetime.utcnow().timestamp())
+        device_ids = [d.decode() if isinstance(d, bytes) else d for d in self.client.zrange(index, 0, -1)]
+        if not device_ids:
+            return []
+        raws = self.client.mget([self._device_key(user_id, device_id) for device_id in device_ids])
+        records = [self._loads(raw) for raw in raws if raw]
+        return sorted(records, key=lambda record: record['registered_at'])
+
+    def remove(self, user_id, device_id):
+        pipe = self.client.pipeline()
+        pipe.delete(self._device_key(user_id, device_id))
+        pipe.zrem(self._index_key(user_id), device_id)
+        pipe.execute()
+
+    def _store(self, pipe, user_id, record):
+        ttl = int(self.ttl.total_seconds())
+        expires_at = record['last_seen'] + self.ttl
+        pipe.set(self._device_key(user_id, record['device_id']), self._dumps(record), ex=ttl)
+        pipe.zadd(self._index_key(user_id), {record['device_id']: expires_at.timestamp()})
+        pipe.expire(self._index_key(user_id), ttl)
+
+    def _dumps(self, record):
+        data = dict(record)
+        data['registered_at'] = record['registered_at'].isoformat()
+        data['last_seen'] = record['last_seen'].isoformat()
+        return json.dumps(data)
+
+    def _loads(self, raw):
+        record = json.loads(raw)
+        record['registered_at'] = datetime.fromisoformat(record['registered_at'])
+        record['last_seen'] = datetime.fromisoformat(record['last_seen'])
+        return record
+
+
+def create_device_registry(url=None):
+    """Build the registry selected by a URL: memory://, sql:// or redis://..."""
+    url = url or Config.DEVICE_REGISTRY_URL
+    if url.startswith('memory'):
+        return MemoryDeviceRegistry()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisDeviceRegistry.from_url(url)
+    return SQLDeviceRegistry()
@@ -0,0 +1,181 @@
+import json
+import queue
+import threading
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+from config import Config
+from services.log import get_logger
+
+log = get_logger('events')
+
+PENDING_KEY = 'synchub_pending_events'
+
+
+class Subscription:
+    """One listener's bounded queue of (event, data) for a user.
+
+    A listener that falls MAX_QUEUE events behind is marked overflowed and
+    stops receiving; it should resynchronise and subscribe again rather
+    than hold memory for events it will never catch up on.
+    """
+
+    def __init__(self, broker, user_id, max_queue):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def put(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Next (event, data), or None once `timeout` seconds pass without one."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """In-process pub/sub with one channel per user.
+
+    Only reaches listeners connected to the same worker process; use
+    RedisEventBroker when running more than one.
+    """
+
+    def __init__(self, max_queue=None):
+        self.max_queue = max_queue or Config.EVENTS_MAX_QUEUE
+        self._subscribers = {}  # {user_id: set of Subscription}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, str(user_id), self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event, data):
+        self._deliver(str(user_id), event, data)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _deliver(self, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put((event, data))
+
+
+class RedisEventBroker(EventBroker):
+    """Fans events out to every worker through Redis pub/sub.
+
+    Publishing goes to the user's Redis channel; each process runs one
+    listener thread on the pattern of all user channels and delivers to
+    its local subscribers.
+    """
+
+    def __init__(self, client, namespace='synchub', max_queue=None):
+        super().__init__(max_queue)
+        self.client = client
+        self.namespace = namespace
+        self._listener = None
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _channel(self, user_id):
+        return f"{self.namespace}:events:{user_id}"
+
+    def subscribe(self, user_id):
+        self._ensure_listening()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id, event, data):
+        self.client.publish(self._channel(user_id), json.dumps({'event': event, 'data': data}))
+
+    def _ensure_listening(self):
+        # Started lazily so each forked worker gets its own listener
+        if self._listener and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name='event-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        prefix = self._channel('')
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self._channel('*'))
+                for message in pubsub.listen():
+                    channel = message['channel']
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    payload = json.loads(message['data'])
+                    self._deliver(channel[len(prefix):], payload['event'], payload['data'])
+            except Exception as e:
+                log.exception('Event listener error')
+                threading.Event().wait(1)
+
+
+def create_event_broker(url=None):
+    """Build the broker selected by a URL: memory:// or redis://..."""
+    url = url or Config.EVENTS_BROKER_URL
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisEventBroker.from_url(url)
+    return EventBroker()
+
+
+broker = create_event_broker()
+
+
+def publish(user_id, event, data):
+    try:
+        broker.publish(user_id, event, data)
+    except Exception as e:
+        # Notifications are best effort; clients catch up from the journal
+        log.warning('Event publish error', user_id=user_id, event_type=event, error=str(e))
+
+
+def publish_after_commit(session, user_id, event, data):
+    """Publish once the session's current transaction commits; dropped on rollback."""
+    session.info.setdefault(PENDING_KEY, []).append((user_id, event, data))
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    # Also fired when a savepoint is released; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    for user_id, event, data in session.info.pop(PENDING_KEY, []):
+        publish(user_id, event, data)
+
+
+@sa_event.listens_for(Session, 'after_soft_rollback')
+def _drop_pending(session, previous_transaction):
+    # Savepoint rollbacks leave the outer transaction's events in place
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
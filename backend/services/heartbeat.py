@@ -0,0 +1,120 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from config import Config
+from services.log import get_logger
+
+log = get_logger('heartbeat')
+
+
+class HeartbeatBuffer:
+    """Write-behind buffer between the heartbeat endpoint and the device registry.
+
+    Beats only update an in-memory map holding the latest beat per
+    (user_id, device_id). A background thread flushes the map to the
+    registry every HEARTBEAT_FLUSH_INTERVAL seconds, or sooner once
+    HEARTBEAT_MAX_PENDING devices are waiting, as one bulk upsert.
+    """
+
+    def __init__(self, registry, flush_interval=None, max_pending=None):
+        self.registry = registry
+        self.flush_interval = flush_interval or Config.HEARTBEAT_FLUSH_INTERVAL
+        self.max_pending = max_pending or Config.HEARTBEAT_MAX_PENDING
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._app = None
+        self._stats = {
+            'beats': 0,
+            'flushes': 0,
+            'flushed_devices': 0,
+            'flush_errors': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+        }
+
+    def record(self, user_id, device_id, last_seen=None, **fields):
+        """Queue a beat; repeated beats of a device coalesce into the latest."""
+        beat = dict(fields, last_seen=last_seen or datetime.utcnow())
+        key = (str(user_id), device_id)
+        with self._lock:
+            previous = self._pending.get(key)
+            if previous:
+                beat = {**previous, **{k: v for k, v in beat.items() if v is not None}}
+                beat['last_seen'] = max(previous['last_seen'], beat['last_seen'])
+            self._pending[key] = beat
+            self._stats['beats'] += 1
+            full = len(self._pending) >= self.max_pending
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all pending beats to the registry in one batch."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self.registry.touch_many(batch)
+            except Exception as e:
+                log.exception('Heartbeat flush failed', devices=len(batch))
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+                    # Put the batch back without overwriting newer beats
+                    for key, beat in batch.items():
+                        self._pending.setdefault(key, beat)
+                raise
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['flushed_devices'] += len(batch)
+                self._stats['last_flush_seconds'] = elapsed
+                self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], elapsed)
+                self._stats['total_flush_seconds'] += elapsed
+            return len(batch)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats, queue_depth=len(self._pending))
+        stats['coalesced_beats'] = stats['beats'] - stats['flushed_devices'] - stats['queue_depth']
+        stats['flush_interval'] = self.flush_interval
+        return stats
+
+    def _ensure_started(self):
+        # Started lazily so each forked worker gets its own flusher thread
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._app = current_app._get_current_object()
+            self._thread = threading.Thread(target=self._run, name='heartbeat-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception:
+                pass
+
+    def _flush_at_exit(self):
+        try:
+            with self._app.app_context():
+                self.flush()
+        except Exception:
+            pass
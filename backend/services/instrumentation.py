@@ -0,0 +1,339 @@
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import Config
+from services.log import get_logger
+from services.metrics import Counter, Gauge, Histogram, registry
+
+PHASES = ('db', 'storage', 'serialization')
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'synchub_request_duration_seconds',
+    'Request latency, up to the last byte of the response',
+    ('method', 'route', 'status')
+))
+PHASE_SECONDS = registry.register(Histogram(
+    'synchub_request_phase_seconds',
+    'Time a request spent in the database, in MinIO and serializing responses',
+    ('route', 'phase')
+))
+CALL_SECONDS = registry.register(Histogram(
+    'synchub_call_duration_seconds',
+    'Time in instrumented storage and serialization calls, by function',
+    ('phase', 'operation')
+))
+DB_QUERY_SECONDS = registry.register(Histogram('synchub_db_query_duration_seconds', 'SQL statement latency'))
+DB_QUERIES = registry.register(Counter('synchub_db_queries_total', 'SQL statements run, by route', ('route',)))
+BYTES_IN = registry.register(Counter('synchub_request_bytes_total', 'Request body bytes received', ('route',)))
+BYTES_OUT = registry.register(Counter('synchub_response_bytes_total', 'Response body bytes sent', ('route',)))
+IN_FLIGHT = registry.register(Gauge('synchub_requests_in_flight', 'Requests being handled, streaming ones included'))
+
+_current = contextvars.ContextVar('synchub_request', default=None)
+
+access_log = get_logger('access')
+
+
+class RequestRecord:
+    """Timings and byte counts of one request, from its first byte in to its last byte out."""
+
+    def __init__(self, method, route=None):
+        self.started = time.perf_counter()
+        self.method = method
+        self.route = route
+        self.status = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.db_queries = 0
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+        self.finished = False
+        IN_FLIGHT.inc()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        IN_FLIGHT.dec()
+        duration = time.perf_counter() - self.started
+        route = self.route or 'unmatched'
+        status = str(self.status or 500)
+        REQUEST_SECONDS.observe(duration, method=self.method, route=route, status=status)
+        for phase, seconds in self.timings.items():
+            PHASE_SECONDS.observe(seconds, route=route, phase=phase)
+        DB_QUERIES.inc(self.db_queries, route=route)
+        BYTES_IN.inc(self.bytes_in, route=route)
+        BYTES_OUT.inc(self.bytes_out, route=route)
+
+        fields = dict(
+            method=self.method, route=route, status=int(status), duration_ms=round(duration * 1000, 1),
+            db_ms=round(self.timings['db'] * 1000, 1), db_queries=self.db_queries,
+            storage_ms=round(self.timings['storage'] * 1000, 1),
+            serialization_ms=round(self.timings['serialization'] * 1000, 1),
+            bytes_in=self.bytes_in, bytes_out=self.bytes_out
+        )
+        if duration * 1000 >= Config.LOG_SLOW_REQUEST_MS:
+            access_log.warning('Slow request', **fields)
+        else:
+            access_log.info('Request', **fields)
+
+
+def begin_request(method, route=None):
+    """Start recording a request handled outside Flask (the ASGI file routes); call finish() when done."""
+    record = RequestRecord(method, route)
+    _current.set(record)
+    return record
+
+
+@contextmanager
+def timed(phase):
+    """Count the time spent in the block toward the current request's `phase`."""
+    record = _current.get()
+    if record is None or phase in record.active:
+        # Not in a request, or an outer call already counts this time
+        yield
+        return
+    record.active.add(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.timings[phase] += time.perf_counter() - started
+        record.active.discard(phase)
+
+
+def timed_call(phase):
+    """Decorator: count a function's time toward `phase` and observe it in CALL_SECONDS.
+
+    For generators (sync or async) the time spent producing items is
+    counted, not the time the consumer holds on to them.
+    """
+    def decorate(func):
+        operation = func.__name__
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                iterator = func(*args, **kwargs)
+                spent = 0.0
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            with timed(phase):
+                                item = await iterator.__anext__()
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            spent += time.perf_counter() - started
+                        yield item
+                finally:
+                    await iterator.aclose()
+                    CALL_SECONDS.observe(spent, phase=phase, operation=operation)
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    with timed(phase):
+                        return await func(*args, **kwargs)
+                finally:
+                    CALL_SECONDS.observe(time.perf_counter() - started, phase=phase, operation=operation)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                iterator = func(*args, **kwargs)
+                spent = 0.0
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            with timed(phase):
+                                item = next(iterator)
+                        except StopIteration:
+                            return
+                        finally:
+                            spent += time.perf_counter() - started
+                        yield item
+                finally:
+                    iterator.close()
+                    CALL_SECONDS.observe(spent, phase=phase, operation=operation)
+            return gen_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with timed(phase):
+                    return func(*args, **kwargs)
+            finally:
+                CALL_SECONDS.observe(time.perf_counter() - started, phase=phase, operation=operation)
+        return wrapper
+
+    return decorate
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._synchub_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._synchub_started
+    DB_QUERY_SECONDS.observe(elapsed)
+    record = _current.get()
+    if record is not None:
+        record.timings['db'] += elapsed
+        record.db_queries += 1
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, counting jsonify() time as serialization."""
+
+    def dumps(self, obj, **kwargs):
+        with timed('serialization'):
+            return super().dumps(obj, **kwargs)
+
+
+class _CountingInput:
+    def __init__(self, stream, record):
+        self._stream = stream
+        self._record = record
+
+    def _counted(self, data):
+        self._record.bytes_in += len(data)
+        return data
+
+    def read(self, *args):
+        return self._counted(self._stream.read(*args))
+
+    def readline(self, *args):
+        return self._counted(self._stream.readline(*args))
+
+    def readinto(self, buffer):
+        # werkzeug reads through readinto() where the server's stream has it
+        if not hasattr(self._stream, 'readinto'):
+            data = self._stream.read(len(buffer))
+            buffer[:len(data)] = data
+            size = len(data)
+        else:
+            size = self._stream.readinto(buffer)
+        self._record.bytes_in += size or 0
+        return size
+
+    def readlines(self, *args):
+        return [self._counted(line) for line in self._stream.readlines(*args)]
+
+    def __iter__(self):
+        for line in self._stream:
+            yield self._counted(line)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _CountingBody:
+    def __init__(self, body, record):
+        self._body = body
+        self._record = record
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._record.bytes_out += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._record.finish()
+            _current.set(None)
+
+
+class InstrumentedWSGI:
+    """WSGI middleware recording each request until its response is fully sent.
+
+    Streaming responses (downloads, JSON listings) do most of their work
+    after the view returns, so timing stops when the server closes the
+    response rather than in after_request.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        record = begin_request(environ['REQUEST_METHOD'])
+        environ['synchub.request'] = record
+        environ['wsgi.input'] = _CountingInput(environ['wsgi.input'], record)
+
+        def recording_start_response(status, headers, exc_info=None):
+            record.status = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, recording_start_response)
+        except BaseException:
+            record.finish()
+            _current.set(None)
+            raise
+        return _CountingBody(body, record)
+
+
+def _collect_storage():
+    from services.minio_service import minio_service
+
+    stats = minio_service.metrics()
+    if not stats.get('configured'):
+        return []
+    circuit = stats['circuit']
+    return [
+        ('synchub_storage_requests_total', 'counter', 'HTTP requests sent to MinIO', [({}, stats['requests'])]),
+        ('synchub_storage_failures_total', 'counter', 'MinIO requests that failed after retries',
+         [({}, stats['failures'])]),
+        ('synchub_storage_retries_total', 'counter', 'MinIO requests retried', [({}, stats['retries'])]),
+        ('synchub_storage_pool_timeouts_total', 'counter', 'Requests that found no free pooled connection in time',
+         [({}, stats['pool_timeouts'])]),
+        ('synchub_storage_pool_connections', 'gauge', 'Pooled MinIO connections by state', [
+            ({'state': 'in_use'}, stats['connections_in_use']),
+            ({'state': 'idle'}, stats['connections_idle'])
+        ]),
+        ('synchub_storage_pool_size', 'gauge', 'Maximum pooled MinIO connections', [({}, stats['pool_size'])]),
+        ('synchub_storage_circuit_open', 'gauge', '1 while the storage circuit breaker is not closed',
+         [({}, int(circuit['state'] != 'closed'))]),
+    ]
+
+
+def init_instrumentation(app):
+    """Record request metrics, serve them at /metrics and log requests to the access log."""
+    if not Config.METRICS_ENABLED:
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        registry.add_collector(_collect_storage)
+
+    app.json = TimedJSONProvider(app)
+    app.wsgi_app = InstrumentedWSGI(app.wsgi_app)
+
+    @app.before_request
+    def label_request():
+        record = request.environ.get('synchub.request')
+        if record is not None and request.url_rule is not None:
+            # The rule (/api/files/<file_id>/download), not the path, to keep label values bounded
+            record.route = request.url_rule.rule
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if Config.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {Config.METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
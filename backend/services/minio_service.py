@@ -1,77 +1,342 @@
 from minio import Minio
+from minio.commonconfig import REPLACE, ComposeSource, CopySource
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+from minio.helpers import MAX_PART_SIZE, normalize_headers
 from config import Config
+from services.compression import IDENTITY, CompressingReader, sniff_stream, storage_codec
+from services.instrumentation import timed_call
+from services.log import get_logger
+from services.storage_http import CircuitBreaker, build_pool
+import hashlib
+import itertools
+import queue
+import threading
 import uuid
-from io import BytesIO
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+log = get_logger('storage')
+
+# Uploads are written here first when their final key is not yet known
+# (a folder sent after the file, a digest computed while uploading)
+STAGING_PREFIX = 'staging/'
+
+
+def file_object_name(folder_type, file_id, filename, version=None):
+    """Key of a file's own object; File.object_name records the key in use.
+    Content written in place of a live object (delta updates) gets a
+    `version` so it never overwrites the object the row points at."""
+    if version:
+        return f"{folder_type}/{file_id}.{version}_{filename}"
+    return f"{folder_type}/{file_id}_{filename}"
+
+
+def is_missing(error):
+    """Whether a storage error means the object doesn't exist, as opposed to
+    storage being unreachable or refusing the request."""
+    if isinstance(error, S3Error):
+        return error.code == 'NoSuchKey'
+    return isinstance(error, FileNotFoundError)
+
+
+class ChecksumReader:
+    """File-like wrapper that counts and hashes bytes as they are read."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        if chunk:
+            self.size += len(chunk)
+            self._sha256.update(chunk)
+        return chunk
+
+    @property
+    def checksum(self):
+        return self._sha256.hexdigest()
+
 
 class MinIOService:
     def __init__(self):
+        self._stat_pool = ThreadPoolExecutor(max_workers=Config.MINIO_STAT_CONCURRENCY)
+        self._public_client = None
+        self.client = None
+        self.http = None
+        self.bucket = Config.MINIO_BUCKET
+        self.breaker = CircuitBreaker()
+        self._bucket_ready = False
+        self._bucket_lock = threading.Lock()
         try:
             # Allow localhost for development
             if not Config.MINIO_ENDPOINT:
-                print("MinIO endpoint not configured")
-                self.available = False
+                log.warning('MinIO endpoint not configured')
                 return
                 
+            self.http = build_pool(self.breaker)
             self.client = Minio(
                 Config.MINIO_ENDPOINT,
                 access_key=Config.MINIO_ACCESS_KEY,
                 secret_key=Config.MINIO_SECRET_KEY,
-                secure=Config.MINIO_SECURE
+                secure=Config.MINIO_SECURE,
+                http_client=self.http
             )
-            self.bucket = Config.MINIO_BUCKET
-            
-            # Quick connection test with timeout
-            try:
-                self.client.bucket_exists(self.bucket)
-                self._ensure_bucket()
-                self.available = True
-                print("MinIO service initialized successfully")
-            except Exception as conn_error:
-                print(f"MinIO connection failed: {conn_error}")
-                self.available = False
         except Exception as e:
-            print(f"MinIO initialization failed: {e}")
-            self.available = False
+            log.exception('MinIO initialization failed')
+            self.client = None
+            return
+        
+        if self.available:
+            log.info('MinIO service initialized', endpoint=Config.MINIO_ENDPOINT, bucket=self.bucket)
+    
+    @property
+    def available(self):
+        """Whether storage can be used right now.
+
+        MinIO being down at startup no longer disables storage for the life
+        of the process: the bucket is checked the first time storage is
+        reachable, and the circuit breaker takes storage out of service
+        while requests keep failing and lets it back in once one succeeds.
+        """
+        if self.client is None or not self.breaker.allow():
+            return False
+        return self._bucket_ready or self._check_bucket()
+    
+    def _check_bucket(self):
+        with self._bucket_lock:
+            if not self._bucket_ready:
+                try:
+                    self._ensure_bucket()
+                    self._bucket_ready = True
+                except Exception as conn_error:
+                    log.error('MinIO connection failed', error=str(conn_error))
+                    # Don't let every request wait on an unreachable server
+                    self.breaker.trip()
+            return self._bucket_ready
+    
+    def metrics(self):
+        if self.http is None:
+            return {'configured': False}
+        return dict(self.http.metrics(), configured=True, bucket_ready=self._bucket_ready)
     
     def _ensure_bucket(self):
         try:
             if not self.client.bucket_exists(self.bucket):
                 self.client.make_bucket(self.bucket)
-                print(f"Created MinIO bucket: {self.bucket}")
+                log.info('Created MinIO bucket', bucket=self.bucket)
         except Exception as e:
-            print(f"Failed to ensure bucket: {e}")
+            log.warning('Failed to ensure bucket', bucket=self.bucket, error=str(e))
             raise
     
-    def upload_file(self, file_stream, filename, folder_type, file_id, metadata=None):
+    def upload_file(self, file_stream, filename, folder_type, file_id, metadata=None, compress=False):
+        object_name = file_object_name(folder_type, file_id, filename)
+        result = self.upload_object(object_name, file_stream, metadata, compress)
+        result['file_id'] = file_id
+        return result
+    
+    @timed_call('storage')
+    def upload_object(self, object_name, file_stream, metadata=None, compress=False):
+        """Stream an upload into an object.
+
+        With `compress`, the content is sniffed and, if the compression
+        policy allows, stored compressed; the codec is recorded in the
+        object's metadata and returned, with the stored size.
+        """
         if not self.available:
             raise Exception("MinIO service not available")
         
-        object_name = f"{folder_type}/{file_id}_{filename}"
+        if hasattr(file_stream, 'seekable') and file_stream.seekable():
+            file_stream.seek(0)
         
-        file_stream.seek(0)
-        file_data = file_stream.read()
-        file_size = len(file_data)
+        codec = None
+        if compress and storage_codec():
+            file_stream, codec = sniff_stream(file_stream)
         
-        self.client.put_object(
+        # Stream the upload as a multipart upload of unknown length so only a
+        # few parts are ever buffered, whatever the size of the file.
+        reader = ChecksumReader(file_stream)
+        body = reader
+        metadata = dict(metadata or {})
+        if codec and codec != IDENTITY:
+            body = CompressingReader(reader, codec)
+            metadata['content-codec'] = codec
+        result = self.client.put_object(
             self.bucket,
             object_name,
-            BytesIO(file_data),
-            length=file_size,
-            metadata=metadata or {}
+            body,
+            length=-1,
+            metadata=metadata,
+            part_size=Config.MINIO_PART_SIZE,
+            num_parallel_uploads=Config.MINIO_UPLOAD_PARALLELISM
         )
         
         return {
             'object_name': object_name,
-            'file_id': file_id,
-            'size': file_size,
+            'size': reader.size,
+            'checksum': reader.checksum,
+            'codec': codec,
+            'stored_size': body.size,
+            'etag': result.etag,
             'url': f"http://{Config.MINIO_ENDPOINT}/{self.bucket}/{object_name}"
         }
     
+    @timed_call('storage')
+    def create_multipart_upload(self, object_name, metadata=None):
+        if not self.available:
+            raise Exception("MinIO service not available")
+        headers = normalize_headers(metadata)
+        return self.client._create_multipart_upload(self.bucket, object_name, headers)
+    
+    @timed_call('storage')
+    def upload_part(self, object_name, upload_id, part_number, data):
+        """Upload one part of a multipart upload; returns its ETag."""
+        if not self.available:
+            raise Exception("MinIO service not available")
+        return self.client._upload_part(self.bucket, object_name, data, None, upload_id, part_number)
+    
+    @timed_call('storage')
+    def upload_part_copy(self, object_name, upload_id, part_number, source_object, offset, length, match_etag=None):
+        """Fill one part with a byte range of another object, server-side; returns its ETag."""
+        if not self.available:
+            raise Exception("MinIO service not available")
+        headers = CopySource(self.bucket, source_object, match_etag=match_etag).gen_copy_headers()
+        headers['x-amz-copy-source-range'] = f"bytes={offset}-{offset + length - 1}"
+        etag, _ = self.client._upload_part_copy(self.bucket, object_name, upload_id, part_number, headers)
+        return etag
+    
+    @timed_call('storage')
+    def complete_multipart_upload(self, object_name, upload_id, parts):
+        """Assemble the object from [(part_number, etag), ...] in part order."""
+        if not self.available:
+            raise Exception("MinIO service not available")
+        return self.client._complete_multipart_upload(
+            self.bucket, object_name, upload_id,
+            [Part(part_number, etag) for part_number, etag in sorted(parts)]
+        )
+    
+    @timed_call('storage')
+    def abort_multipart_upload(self, object_name, upload_id):
+        if not self.available:
+            raise Exception("MinIO service not available")
+        self.client._abort_multipart_upload(self.bucket, object_name, upload_id)
+    
+    @timed_call('storage')
+    def stat_file(self, object_name):
+        if not self.available:
+            raise Exception("MinIO service not available")
+        return self.client.stat_object(self.bucket, object_name)
+    
+    @timed_call('storage')
+    def iter_file(self, object_name, offset=0, length=0, chunk_size=None):
+        """Yield an object's bytes (or a byte range of it) chunk by chunk.
+
+        The GET is only issued once iteration starts, and the connection is
+        returned to the pool when the generator finishes or is closed.
+        """
+        if not self.available:
+            raise Exception("MinIO service not available")
+        response = self.client.get_object(self.bucket, object_name, offset=offset, length=length)
+        try:
+            for chunk in response.stream(chunk_size or Config.MINIO_DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+    
+    @timed_call('storage')
+    def copy_file(self, source_object, target_object, metadata=None):
+        """Server-side copy; sources over 5 GiB are composed from part copies.
+
+        The source's user metadata is kept unless `metadata` replaces it.
+        """
+        if not self.available:
+            raise Exception("MinIO service not available")
+        stat = self.client.stat_object(self.bucket, source_object)
+        if stat.size <= MAX_PART_SIZE:
+            return self.client.copy_object(
+                self.bucket, target_object, CopySource(self.bucket, source_object),
+                metadata=metadata, metadata_directive=REPLACE if metadata else None
+            )
+        if metadata is None:
+            metadata = {
+                key: value for key, value in (stat.metadata or {}).items()
+                if key.lower().startswith('x-amz-meta-')
+            }
+        return self.client.compose_object(
+            self.bucket,
+            target_object,
+            [ComposeSource(self.bucket, source_object)],
+            metadata=metadata
+        )
+    
     def get_file_url(self, object_name):
+        """Presigned GET for use by the server itself (signed for MINIO_ENDPOINT)."""
         if not self.available:
             return None
         return self.client.presigned_get_object(self.bucket, object_name)
     
+    def _presign_client(self):
+        # URLs handed to clients are signed for the host the clients use;
+        # signing is local, the region is the only thing looked up
+        if not Config.MINIO_PUBLIC_ENDPOINT:
+            return self.client
+        if self._public_client is None:
+            self._public_client = Minio(
+                Config.MINIO_PUBLIC_ENDPOINT,
+                access_key=Config.MINIO_ACCESS_KEY,
+                secret_key=Config.MINIO_SECRET_KEY,
+                secure=Config.MINIO_PUBLIC_SECURE,
+                region=self.client._get_region(self.bucket),
+                http_client=self.http
+            )
+        return self._public_client
+    
+    def presigned_download_url(self, object_name, filename=None, content_encoding=None):
+        """Short-lived GET URL for a client; `filename` sets the download's name.
+
+        `content_encoding` labels a compressed object so the client decodes it.
+        """
+        if not self.available:
+            raise Exception("MinIO service not available")
+        response_headers = {}
+        if filename:
+            response_headers['response-content-disposition'] = f'attachment; filename="{filename}"'
+        if content_encoding:
+            response_headers['response-content-encoding'] = content_encoding
+        return self._presign_client().presigned_get_object(
+            self.bucket, object_name,
+            expires=timedelta(seconds=Config.PRESIGNED_URL_EXPIRY),
+            response_headers=response_headers or None
+        )
+    
+    def presigned_part_url(self, object_name, upload_id, part_number):
+        """Short-lived URL a client can PUT one part of a multipart upload to."""
+        if not self.available:
+            raise Exception("MinIO service not available")
+        return self._presign_client().get_presigned_url(
+            'PUT', self.bucket, object_name,
+            expires=timedelta(seconds=Config.PRESIGNED_URL_EXPIRY),
+            extra_query_params={'partNumber': str(part_number), 'uploadId': upload_id}
+        )
+    
+    @timed_call('storage')
+    def list_parts(self, object_name, upload_id):
+        """Parts stored so far for a multipart upload, as [(part_number, etag, size)]."""
+        if not self.available:
+            raise Exception("MinIO service not available")
+        parts, marker = [], None
+        while True:
+            result = self.client._list_parts(self.bucket, object_name, upload_id, part_number_marker=marker)
+            parts.extend((int(part.part_number), part.etag, int(part.size)) for part in result.parts)
+            if not result.is_truncated:
+                return parts
+            marker = result.next_part_number_marker
+    
+    @timed_call('storage')
     def delete_file(self, object_name):
         if not self.available:
             return False
@@ -81,77 +346,203 @@ class MinIOService:
         except:
             return False
     
+    @timed_call('storage')
+    def delete_prefix(self, prefix):
+        """Delete every object under a prefix; returns how many were removed."""
+        if not self.available:
+            return 0
+        names = [obj.object_name for obj in self.client.list_objects(self.bucket, prefix=prefix, recursive=True)]
+        errors = list(self.client.remove_objects(self.bucket, (DeleteObject(name) for name in names)))
+        for error in errors:
+            log.warning('Failed to delete object', object_name=error.name, error=error.message)
+        return len(names) - len(errors)
+    
+    # Folder types whose objects may also live under legacy prefixes
+    FOLDER_ALIASES = {
+        'music': ['music', 'audio'],
+        'images': ['images', 'pictures'],
+        'videos': ['videos', 'video'],
+        'documents': ['documents'],
+        'archives': ['archives'],
+        'others': ['others']
+    }
+    
     def list_files(self, folder_type=None):
         if not self.available:
             return []
         
         try:
-            # Handle folder name mapping
-            folder_mapping = {
-                'music': ['music', 'audio'],
-                'images': ['images', 'pictures'],
-                'videos': ['videos', 'video'],
-                'documents': ['documents'],
-                'archives': ['archives'],
-                'others': ['others']
-            }
-            
-            if folder_type:
-                # Get all possible folder names for this type
-                possible_folders = folder_mapping.get(folder_type, [folder_type])
-                all_files = []
-                for folder in possible_folders:
-                    prefix = f"{folder}/"
-                    objects = self.client.list_objects(self.bucket, prefix=prefix, recursive=True)
-                    all_files.extend(list(objects))
-                objects = all_files
-            else:
-                objects = self.client.list_objects(self.bucket, recursive=True)
-            
-            files = []
-            for obj in objects:
+            return list(self.iter_files(folder_type))
+        except Exception as e:
+            log.exception('Error listing files', folder_type=folder_type)
+            return []
+    
+    @timed_call('storage')
+    def iter_files(self, folder_type=None, prefix=None, start_after=None, limit=None, with_metadata=True):
+        """Lazily yield file entries for the objects in the bucket, in key order.
+
+        The prefixes of a folder type's aliases are listed concurrently. User
+        metadata comes from the listing itself (include_user_meta); objects the
+        listing returns without any metadata are stat'ed in batches on a
+        bounded thread pool. with_metadata=False skips metadata altogether.
+        """
+        if not self.available:
+            return
+        
+        if prefix is not None:
+            prefixes = [prefix]
+        elif folder_type:
+            prefixes = [f"{folder}/" for folder in self.FOLDER_ALIASES.get(folder_type, [folder_type])]
+        else:
+            prefixes = [None]
+        
+        listings = [
+            self.client.list_objects(
+                self.bucket,
+                prefix=p,
+                recursive=True,
+                start_after=start_after,
+                include_user_meta=with_metadata
+            )
+            for p in sorted(prefixes, key=lambda p: p or '')
+        ]
+        if len(listings) > 1:
+            # Alias prefixes don't overlap, so key order is prefix order
+            stop = threading.Event()
+            listings = [_prefetch(listing, stop) for listing in listings]
+            objects = itertools.chain.from_iterable(listings)
+        else:
+            stop = None
+            objects = listings[0]
+        
+        try:
+            if limit is not None:
+                objects = itertools.islice(objects, limit)
+            batches = _batched(objects, Config.MINIO_LIST_BATCH_SIZE)
+            for batch in batches:
+                if with_metadata:
+                    metadata = self._batch_metadata(batch)
+                else:
+                    metadata = [{}] * len(batch)
+                for obj, obj_metadata in zip(batch, metadata):
+                    yield self._file_entry(obj, obj_metadata)
+        finally:
+            if stop:
+                stop.set()
+    
+    @timed_call('storage')
+    def iter_objects(self, start_after=None):
+        """Lazily yield (object name, size, last modified) for every object in
+        the bucket after `start_after`, in key order, without metadata."""
+        if not self.available:
+            raise Exception("MinIO service not available")
+        for obj in self.client.list_objects(self.bucket, recursive=True, start_after=start_after):
+            yield obj.object_name, obj.size, obj.last_modified
+    
+    def _batch_metadata(self, objects):
+        """User metadata for each object, stat'ing those listed without any."""
+        metadata = [_user_metadata(obj.metadata) for obj in objects]
+        missing = [i for i, obj in enumerate(objects) if not obj.metadata]
+        if missing:
+            def stat(i):
                 try:
-                    # Get object metadata
-                    stat = self.client.stat_object(self.bucket, obj.object_name)
-                    metadata = stat.metadata or {}
-                    
-                    # Parse object name to get file info
-                    path_parts = obj.object_name.split('/')
-                    if len(path_parts) >= 2:
-                        folder = path_parts[0]
-                        filename_with_id = path_parts[1]
-                        # Extract original filename (remove UUID prefix)
-                        if '_' in filename_with_id:
-                            file_id = filename_with_id.split('_')[0]
-                            original_filename = '_'.join(filename_with_id.split('_')[1:])
-                        else:
-                            file_id = filename_with_id
-                            original_filename = filename_with_id
-                    else:
-                        folder = 'documents'
-                        file_id = obj.object_name
-                        original_filename = obj.object_name
-                    
-                    files.append({
-                        'id': file_id,
-                        'filename': original_filename,
-                        'title': metadata.get('title', original_filename),
-                        'description': metadata.get('description', ''),
-                        'folder_type': folder,
-                        'size': obj.size,
-                        'device_name': metadata.get('device', 'Unknown Device'),
-                        'url': f"http://{Config.MINIO_ENDPOINT}/{self.bucket}/{obj.object_name}",
-                        'object_name': obj.object_name,
-                        'created_at': obj.last_modified.isoformat() if obj.last_modified else None
-                    })
+                    return _user_metadata(self.client.stat_object(self.bucket, objects[i].object_name).metadata)
                 except Exception as e:
-                    print(f"Error processing file {obj.object_name}: {e}")
-                    continue
-            
-            return files
+                    log.warning('Error reading object metadata', object_name=objects[i].object_name, error=str(e))
+                    return {}
+            for i, obj_metadata in zip(missing, self._stat_pool.map(stat, missing)):
+                metadata[i] = obj_metadata
+        return metadata
+    
+    def _file_entry(self, obj, metadata):
+        # Parse object name to get file info
+        path_parts = obj.object_name.split('/')
+        if len(path_parts) >= 2:
+            folder = path_parts[0]
+            filename_with_id = path_parts[1]
+            # Extract original filename (remove UUID prefix)
+            if '_' in filename_with_id:
+                file_id = filename_with_id.split('_')[0]
+                original_filename = '_'.join(filename_with_id.split('_')[1:])
+            else:
+                file_id = filename_with_id
+                original_filename = filename_with_id
+        else:
+            folder = 'documents'
+            file_id = obj.object_name
+            original_filename = obj.object_name
+        
+        return {
+            'id': file_id,
+            'filename': original_filename,
+            'title': metadata.get('title', original_filename),
+            'description': metadata.get('description', ''),
+            'folder_type': folder,
+            'size': obj.size,
+            'device_name': metadata.get('device', 'Unknown Device'),
+            'url': f"http://{Config.MINIO_ENDPOINT}/{self.bucket}/{obj.object_name}",
+            'object_name': obj.object_name,
+            'created_at': obj.last_modified.isoformat() if obj.last_modified else None
+        }
+
+
+def _user_metadata(metadata):
+    """Normalize listing or stat metadata to {name: value} for X-Amz-Meta-* keys."""
+    return {
+        key.lower()[len('x-amz-meta-'):]: value
+        for key, value in (metadata or {}).items()
+        if key.lower().startswith('x-amz-meta-')
+    }
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _prefetch(iterable, stop, buffer_size=1000):
+    """Consume iterable on a background thread, yielding its items in order.
+
+    At most buffer_size items are read ahead. Setting stop makes the
+    background thread give up early.
+    """
+    items = queue.Queue(maxsize=buffer_size)
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
         except Exception as e:
-            print(f"Error listing files: {e}")
-            return []
+            put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    def consume():
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    return consume()
 
 # Global instance
 minio_service = MinIOService()
\ No newline at end of file
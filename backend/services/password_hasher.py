@@ -0,0 +1,117 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import Config
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many password operations in progress')
+        self.retry_after = retry_after
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # werkzeug expands defaults (scrypt -> scrypt:32768:8:1), so compare
+    # against the prefix of a real hash rather than the configured string
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Runs password hashing on a small process pool.
+
+    Request threads wait for their own hash, but at most `workers + queue`
+    hash or verify calls are admitted at once; beyond that HasherBusy is
+    raised straight away, so a login burst can only tie up that many
+    request threads and the rest stay free for other traffic. With
+    workers=0 hashing runs inline, still behind the same admission limit.
+    """
+
+    def __init__(self, method=None, workers=None, queue=None, timeout=None, retry_after=None):
+        self.method = method or Config.PASSWORD_HASH_METHOD
+        self.workers = Config.PASSWORD_HASH_WORKERS if workers is None else workers
+        self.queue = Config.PASSWORD_HASH_QUEUE if queue is None else queue
+        self.timeout = timeout or Config.PASSWORD_HASH_TIMEOUT
+        self.retry_after = retry_after or Config.PASSWORD_HASH_RETRY_AFTER
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + self.queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._stats = {'hashes': 0, 'verifies': 0, 'rejected': 0, 'rehashes': 0}
+
+    def hash(self, password):
+        self._count('hashes')
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        self._count('verifies')
+        return self._run(_verify, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with other parameters than the configured ones."""
+        return password_hash.split('$', 1)[0] != _method_prefix(self.method)
+
+    def record_rehash(self):
+        self._count('rehashes')
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(method=self.method, workers=self.workers, queue=self.queue)
+        return stats
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HasherBusy(self.retry_after)
+        if self.workers <= 0:
+            try:
+                return func(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._get_pool().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the hash finishes, even if the caller times out
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next caller
+            with self._lock:
+                self._pool = None
+            raise
+
+    def _get_pool(self):
+        # One pool per process: a forked server worker must not share its parent's
+        pid = os.getpid()
+        if self._pool is not None and self._pool_pid == pid:
+            return self._pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = pid
+            return self._pool
+
+
+password_hasher = PasswordHasher()
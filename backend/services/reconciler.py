@@ -0,0 +1,283 @@
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, tuple_
+from config import Config
+from models import db, Blob, File, ReconcileCheckpoint
+from services.blob_store import release_blob
+from services.log import get_logger
+from services.minio_service import is_missing, minio_service
+from services.sync_journal import record_change
+from services.thumbnails import THUMBNAIL_PREFIX, delete_thumbnails
+
+log = get_logger('reconciler')
+
+CHECKPOINT = 'storage'
+
+# Counts reported per run and kept per pass
+COUNTERS = (
+    'objects', 'files', 'matched', 'orphan_objects', 'orphan_thumbnails',
+    'missing_objects', 'size_mismatches', 'unreferenced_blobs',
+    'deleted_objects', 'deleted_files',
+)
+
+
+def _iter_files(start_after):
+    """Yield the files table in object key order after `start_after`, keyset
+    paginated on (object_name, id) so only one page is held at a time."""
+    columns = (File.object_name, File.id, File.size, File.stored_size, File.created_at)
+    criteria = [File.object_name.isnot(None)]
+    if start_after is not None:
+        criteria.append(File.object_name > start_after)
+    last = None
+    while True:
+        stmt = select(*columns).where(*criteria)
+        if last is not None:
+            stmt = stmt.where(tuple_(File.object_name, File.id) > last)
+        rows = db.session.execute(
+            stmt.order_by(File.object_name, File.id).limit(Config.RECONCILE_PAGE_SIZE)
+        ).all()
+        # Don't sit in a transaction while the bucket is listed
+        db.session.commit()
+        yield from rows
+        if len(rows) < Config.RECONCILE_PAGE_SIZE:
+            return
+        last = (rows[-1].object_name, rows[-1].id)
+
+
+def _ordered(items, source):
+    """Pass items through, failing if their keys ever go backwards.
+
+    The merge is only sound if the database and the bucket order keys the
+    same way (bytewise); a mismatch would show up as phantom orphans.
+    """
+    previous = None
+    for item in items:
+        if previous is not None and item[0] < previous:
+            raise RuntimeError(f'{source} keys are not in byte order: {item[0]!r} after {previous!r}')
+        previous = item[0]
+        yield item
+
+
+def _merge(objects, files):
+    """Join the two key-ordered streams: yield (key, object, rows) with the
+    object None if the bucket lacks the key and rows empty if no file has it."""
+    obj = next(objects, None)
+    row = next(files, None)
+    while obj is not None or row is not None:
+        if row is None or (obj is not None and obj[0] < row[0]):
+            yield obj[0], obj, []
+            obj = next(objects, None)
+            continue
+        key, rows = row[0], []
+        while row is not None and row[0] == key:
+            rows.append(row)
+            row = next(files, None)
+        if obj is not None and obj[0] == key:
+            yield key, obj, rows
+            obj = next(objects, None)
+        else:
+            yield key, None, rows
+
+
+def _settled(modified, cutoff):
+    # Old enough not to belong to a transfer in progress
+    if modified is None:
+        return False
+    if modified.tzinfo is not None:
+        modified = modified.astimezone(timezone.utc).replace(tzinfo=None)
+    return modified <= cutoff
+
+
+def _stat(key):
+    """The object's stat, or None if it doesn't exist."""
+    try:
+        return minio_service.stat_file(key)
+    except Exception as e:
+        if is_missing(e):
+            return None
+        raise
+
+
+def _check_object(key, size, rows, counts):
+    counts['matched'] += 1
+    for row in rows:
+        expected = row.stored_size if row.stored_size is not None else row.size
+        if expected is not None and expected != size:
+            counts['size_mismatches'] += 1
+            log.warning('Object size mismatch', file_id=row.id, object_name=key, expected=expected, actual=size)
+
+
+def _orphan_object(key, size, counts, repair):
+    # A file or blob may have been given the key since its page was read
+    if db.session.execute(select(File.id).where(File.object_name == key).limit(1)).first():
+        return
+    blob = db.session.execute(select(Blob.ref_count).where(Blob.object_name == key).limit(1)).first()
+    if blob is not None:
+        if blob.ref_count <= 0:
+            # Released; sweep_blobs() deletes it
+            return
+        # Referenced by a blob no file uses: the blob's count is off, so
+        # leave it for a person to look at
+        counts['unreferenced_blobs'] += 1
+        log.warning('Blob without files', object_name=key, size=size)
+        return
+    counts['orphan_objects'] += 1
+    log.warning('Orphaned object', object_name=key, size=size)
+    if repair and minio_service.delete_file(key):
+        counts['deleted_objects'] += 1
+
+
+def _orphan_thumbnails(pending, counts, repair):
+    """Check a batch of (key, file id) thumbnails against the files table."""
+    ids = {file_id for _, file_id in pending}
+    existing = set(db.session.scalars(select(File.id).where(File.id.in_(ids))))
+    for key, file_id in pending:
+        if file_id in existing:
+            continue
+        counts['orphan_thumbnails'] += 1
+        log.warning('Orphaned thumbnail', object_name=key, file_id=file_id)
+        if repair and minio_service.delete_file(key):
+            counts['deleted_objects'] += 1
+    pending.clear()
+
+
+def _missing_object(key, rows, cutoff, counts, repair):
+    rows = [row for row in rows if _settled(row.created_at, cutoff)]
+    # Confirm first: the object may have been written since it was listed
+    if not rows or _stat(key) is not None:
+        return
+    for row in rows:
+        file = db.session.get(File, row.id, with_for_update=True)
+        if file is None or file.object_name != key:
+            # Deleted or moved to another key meanwhile
+            db.session.rollback()
+            continue
+        counts['missing_objects'] += 1
+        log.warning('File missing from storage', file_id=file.id, user_id=file.user_id, object_name=key)
+        if not repair:
+            db.session.rollback()
+            continue
+        if file.blob_id:
+            release_blob(file.blob_id)
+        db.session.delete(file)
+        record_change(file, 'delete')
+        db.session.commit()
+        counts['deleted_files'] += 1
+        if file.thumbnail_status:
+            delete_thumbnails(file.id)
+
+
+def _checkpoint():
+    checkpoint = db.session.get(ReconcileCheckpoint, CHECKPOINT)
+    if checkpoint is None:
+        checkpoint = ReconcileCheckpoint(name=CHECKPOINT, passes=0)
+        db.session.add(checkpoint)
+        db.session.commit()
+    return checkpoint
+
+
+def _save_checkpoint(started_from, started_at, position, counts, finished):
+    """Record the run's progress unless another run got there first."""
+    checkpoint = db.session.get(ReconcileCheckpoint, CHECKPOINT, with_for_update=True, populate_existing=True)
+    if checkpoint.position != started_from:
+        db.session.rollback()
+        log.warning('Reconcile checkpoint moved by another run', expected=started_from, found=checkpoint.position)
+        return False
+    now = datetime.utcnow()
+    stats = json.loads(checkpoint.stats or '{}')
+    for name in COUNTERS:
+        stats[name] = stats.get(name, 0) + counts[name]
+    if started_from is None:
+        checkpoint.pass_started_at = started_at
+    if finished:
+        stats['started_at'] = checkpoint.pass_started_at.isoformat() if checkpoint.pass_started_at else None
+        stats['finished_at'] = now.isoformat()
+        checkpoint.last_pass_stats = json.dumps(stats)
+        checkpoint.stats = None
+        checkpoint.position = None
+        checkpoint.passes += 1
+    else:
+        checkpoint.stats = json.dumps(stats)
+        checkpoint.position = position
+    checkpoint.updated_at = now
+    db.session.commit()
+    return True
+
+
+def reconcile_storage(repair=False, max_keys=None):
+    """Check the next stretch of the bucket against the files table.
+
+    The bucket listing and the files table are both read in key order and
+    merge-joined, so each run is one pass over at most `max_keys` keys
+    (RECONCILE_BATCH) with a page of rows in memory, continuing from the
+    checkpoint the previous run left. A run that reaches the end of the
+    bucket completes the pass and the next one starts over.
+
+    Reported, and with `repair` fixed: objects no file or blob refers to
+    (deleted), thumbnails of files that are gone (deleted) and files whose
+    object is missing (deleted, with a journal entry so clients drop them).
+    Size mismatches and blobs without files are only reported. Anything
+    younger than RECONCILE_GRACE is skipped, and missing objects are
+    confirmed with a stat before a row is touched.
+    """
+    if not minio_service.available:
+        raise Exception("MinIO service not available")
+    max_keys = max_keys or Config.RECONCILE_BATCH
+    started_at = datetime.utcnow()
+    cutoff = started_at - timedelta(seconds=Config.RECONCILE_GRACE)
+    started_from = _checkpoint().position
+    db.session.commit()
+
+    counts = dict.fromkeys(COUNTERS, 0)
+    thumbnails = []
+    objects = _ordered(minio_service.iter_objects(start_after=started_from), 'Bucket')
+    files = _ordered(_iter_files(started_from), 'Files table')
+    position, keys, finished = started_from, 0, True
+    pairs = _merge(objects, files)
+    try:
+        for key, obj, rows in pairs:
+            if keys >= max_keys:
+                finished = False
+                break
+            keys += 1
+            position = key
+            counts['files'] += len(rows)
+            if obj is None:
+                _missing_object(key, rows, cutoff, counts, repair)
+                continue
+            counts['objects'] += 1
+            _, size, modified = obj
+            if rows:
+                _check_object(key, size, rows, counts)
+            elif not _settled(modified, cutoff):
+                continue
+            elif key.startswith(THUMBNAIL_PREFIX):
+                thumbnails.append((key, key[len(THUMBNAIL_PREFIX):].split('/', 1)[0]))
+                if len(thumbnails) >= Config.RECONCILE_PAGE_SIZE:
+                    _orphan_thumbnails(thumbnails, counts, repair)
+            else:
+                _orphan_object(key, size, counts, repair)
+        if thumbnails:
+            _orphan_thumbnails(thumbnails, counts, repair)
+    finally:
+        for stream in (pairs, objects, files):
+            stream.close()
+        db.session.rollback()
+
+    saved = _save_checkpoint(started_from, started_at, position, counts, finished)
+    log.info('Reconciled storage', keys=keys, pass_complete=finished, repair=repair, **counts)
+    return dict(counts, keys=keys, position=None if finished else position, pass_complete=finished, saved=saved)
+
+
+def reconcile_status():
+    """The checkpoint: where the current pass is and what it has found so far."""
+    checkpoint = db.session.get(ReconcileCheckpoint, CHECKPOINT)
+    if checkpoint is None:
+        return {'passes': 0, 'position': None, 'current': {}, 'last_pass': None}
+    return {
+        'passes': checkpoint.passes,
+        'position': checkpoint.position,
+        'pass_started_at': checkpoint.pass_started_at.isoformat() if checkpoint.pass_started_at else None,
+        'current': json.loads(checkpoint.stats or '{}'),
+        'last_pass': json.loads(checkpoint.last_pass_stats) if checkpoint.last_pass_stats else None,
+    }
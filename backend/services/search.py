@@ -0,0 +1,305 @@
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, column, func, literal, literal_column, or_, select, table, text, tuple_
+from config import Config
+from models import db, File
+from serializers import FILE_COLUMNS, file_select
+
+# Size facet buckets: (key, lower bound inclusive, upper bound exclusive)
+SIZE_RANGES = (
+    ('under-1mb', 0, 1 << 20),
+    ('1mb-10mb', 1 << 20, 10 << 20),
+    ('10mb-100mb', 10 << 20, 100 << 20),
+    ('100mb-1gb', 100 << 20, 1 << 30),
+    ('over-1gb', 1 << 30, None),
+)
+
+# Date facet buckets by upload time: (key, newer than, older than) in days
+# ago. The recent ones nest (past-week includes past-day), like a file
+# manager's "modified" menu.
+DATE_RANGES = (
+    ('past-day', 1, None),
+    ('past-week', 7, None),
+    ('past-month', 30, None),
+    ('past-year', 365, None),
+    ('older', None, 365),
+)
+
+# Relevance weights of filename, title and description; Postgres takes
+# them scaled to 0-1 for its D, C, B and A labels
+WEIGHTS = (10.0, 5.0, 1.0)
+POSTGRES_WEIGHTS = "'{0, 0.1, 0.5, 1}'::float4[]"
+
+# Postgres: a generated tsvector column with a GIN index. The 'simple'
+# configuration doesn't stem, as file names are rarely English prose;
+# punctuation in names is turned into spaces so report_2024.pdf is
+# indexed as report, 2024 and pdf. Postgres keeps the column current
+# with every insert and update of the row.
+POSTGRES_INDEX = (
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', regexp_replace(coalesce(filename, ''), '[^[:alnum:]]+', ' ', 'g')), 'A') || "
+    "setweight(to_tsvector('simple', regexp_replace(coalesce(title, ''), '[^[:alnum:]]+', ' ', 'g')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS ix_files_search ON files USING gin (search_vector)",
+)
+
+# SQLite (development): an FTS5 table over the files table's content, kept
+# in step by triggers. It maps rows by rowid, which VACUUM and table
+# rebuilds may renumber; run `flask rebuild-search-index` after either.
+SQLITE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5("
+    "filename, title, description, content='files', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN "
+    "INSERT INTO files_fts(rowid, filename, title, description) "
+    "VALUES (new.rowid, new.filename, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN "
+    "INSERT INTO files_fts(files_fts, rowid, filename, title, description) "
+    "VALUES ('delete', old.rowid, old.filename, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF filename, title, description ON files BEGIN "
+    "INSERT INTO files_fts(files_fts, rowid, filename, title, description) "
+    "VALUES ('delete', old.rowid, old.filename, old.title, old.description); "
+    "INSERT INTO files_fts(rowid, filename, title, description) "
+    "VALUES (new.rowid, new.filename, new.title, new.description); END",
+)
+
+_files_fts = table('files_fts', column('rowid'))
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def ensure_search_index():
+    """Create the full-text index if the database lacks it (databases made by
+    db.create_all()); migrations create it otherwise. Safe to call again."""
+    dialect = _dialect()
+    statements = {'postgresql': POSTGRES_INDEX, 'sqlite': SQLITE_INDEX}.get(dialect, ())
+    fill = dialect == 'sqlite' and not db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'")
+    ).first()
+    for statement in statements:
+        db.session.execute(text(statement))
+    if fill:
+        # A new FTS table starts out empty
+        db.session.execute(text("INSERT INTO files_fts(files_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    return bool(statements)
+
+
+def rebuild_search_index():
+    """Re-index every file. Only the SQLite index can drift (see SQLITE_INDEX);
+    Postgres computes its column from the row itself. Returns the file count."""
+    ensure_search_index()
+    if _dialect() == 'sqlite':
+        db.session.execute(text("INSERT INTO files_fts(files_fts) VALUES ('rebuild')"))
+        db.session.commit()
+    return db.session.query(func.count(File.id)).scalar()
+
+
+def parse_terms(query):
+    """Words of a search query, lowercased. Punctuation separates words, as
+    in the index; each word matches as a prefix."""
+    return re.findall(r'[^\W_]+', (query or '').lower())[:Config.SEARCH_MAX_TERMS]
+
+
+def _match(terms, dialect):
+    """How to match and rank the terms: (criteria, rank expression, whether
+    higher ranks are better, ranked join).
+
+    A ranked join, where set, replaces the criteria in the query that sorts
+    by rank (the rank function needs the index table joined); counts use
+    the criteria, which let the planner start from the user's files.
+    """
+    if dialect == 'postgresql':
+        query = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        vector = literal_column('files.search_vector')
+        return [vector.op('@@')(query)], func.ts_rank_cd(text(POSTGRES_WEIGHTS), vector, query), True, None
+
+    if dialect == 'sqlite':
+        fts = literal_column('files_fts')
+        # Quoted, so words like AND or NEAR aren't read as operators
+        match = fts.op('MATCH')(' '.join('"%s"*' % term.replace('"', '""') for term in terms))
+        rowid = literal_column('files.rowid')
+        criteria = [rowid.in_(select(_files_fts.c.rowid).where(match))]
+        return criteria, func.bm25(fts, *WEIGHTS), False, and_(_files_fts.c.rowid == rowid, match)
+
+    # Anything else: every word somewhere in the three fields, unranked
+    criteria = [
+        or_(*(field.ilike(f'%{term}%') for field in (File.filename, File.title, File.description)))
+        for term in terms
+    ]
+    return criteria, None, False, None
+
+
+def _bucket_criterion(bounds, field):
+    """A SIZE_RANGES or DATE_RANGES bucket as one SQL condition."""
+    _, lower, upper = bounds
+    criteria = []
+    if field is File.created_at:
+        now = datetime.utcnow()
+        # Bounds are in days ago, so the lower one is the newer edge
+        if lower is not None:
+            criteria.append(File.created_at >= now - timedelta(days=lower))
+        if upper is not None:
+            criteria.append(File.created_at < now - timedelta(days=upper))
+    else:
+        if lower:
+            criteria.append(field >= lower)
+        if upper is not None:
+            criteria.append(field < upper)
+    return and_(*criteria)
+
+
+def _filter_groups(filters):
+    """Criteria per facet; values within a facet are alternatives."""
+    groups = {}
+    if filters.get('folder_type'):
+        groups['folder_type'] = [File.folder_type.in_(filters['folder_type'])]
+    if filters.get('device_name'):
+        groups['device_name'] = [File.device_name.in_(filters['device_name'])]
+
+    size = []
+    if filters.get('size'):
+        size.append(or_(*(_bucket_criterion(r, File.size) for r in SIZE_RANGES if r[0] in filters['size'])))
+    if filters.get('min_size') is not None:
+        size.append(File.size >= filters['min_size'])
+    if filters.get('max_size') is not None:
+        size.append(File.size <= filters['max_size'])
+    if size:
+        groups['size'] = size
+
+    date = []
+    if filters.get('date'):
+        date.append(or_(*(_bucket_criterion(r, File.created_at) for r in DATE_RANGES if r[0] in filters['date'])))
+    if filters.get('created_after') is not None:
+        date.append(File.created_at >= filters['created_after'])
+    if filters.get('created_before') is not None:
+        date.append(File.created_at < filters['created_before'])
+    if date:
+        groups['date'] = date
+    return groups
+
+
+def validate_filters(filters):
+    """Raise ValueError for facet values search_files() doesn't know."""
+    for name, ranges in (('size', SIZE_RANGES), ('date', DATE_RANGES)):
+        unknown = set(filters.get(name) or ()) - {key for key, _, _ in ranges}
+        if unknown:
+            raise ValueError(f"Unknown {name} range: {', '.join(sorted(unknown))}")
+
+
+def _after(position, rank, descending):
+    """Rows sorting after `position`, the (rank, created_at, id) of the last
+    row of the previous page (rank None when results aren't ranked)."""
+    last_rank, created_at, file_id = position
+    older = tuple_(File.created_at, File.id) < (created_at, file_id)
+    if rank is None:
+        return older
+    worse = rank < last_rank if descending else rank > last_rank
+    return or_(worse, and_(rank == last_rank, older))
+
+
+def _capped_count(stmt):
+    """Count the rows of `stmt` up to SEARCH_COUNT_LIMIT, so a broad query
+    doesn't count the whole library; past the limit it's "<limit>+"."""
+    cap = Config.SEARCH_COUNT_LIMIT
+    counted = db.session.execute(
+        select(func.count()).select_from(stmt.limit(cap + 1).subquery())
+    ).scalar()
+    return f'{cap}+' if counted > cap else counted
+
+
+def search_files(user_id, query, filters=None, limit=None, after=None, facets=True, total=True):
+    """Search a user's files by filename, title and description.
+
+    `filters` maps folder_type, device_name, size and date to lists of
+    accepted values (size and date take SIZE_RANGES and DATE_RANGES keys),
+    plus min_size, max_size, created_after and created_before. Without a
+    query every file passing the filters matches, newest first; with one,
+    files containing all of its words (as prefixes) match, best first.
+
+    Pages are keyset-paginated on (rank, created_at, id): pass the previous
+    page's next_position as `after`. The total (capped, see _capped_count)
+    and the facet counts are only computed when asked for. Facet counts are
+    over the matching files, each ignoring its own facet's filter so the
+    other choices can be offered alongside.
+    """
+    filters = filters or {}
+    validate_filters(filters)
+    limit = max(1, min(limit or Config.SEARCH_PAGE_SIZE, Config.SEARCH_MAX_PAGE_SIZE))
+    dialect = _dialect()
+
+    base = [File.user_id == int(user_id)]
+    matched, rank, descending, ranked_join = [], None, False, None
+    terms = parse_terms(query)
+    if terms:
+        matched, rank, descending, ranked_join = _match(terms, dialect)
+        if dialect == 'sqlite':
+            # Unary + hides the user_id indexes from SQLite's planner, so it
+            # starts from the matching rows rather than all the user's files
+            base = [text('+files.user_id = :owner').bindparams(owner=int(user_id))]
+    groups = _filter_groups(filters)
+
+    def scoped(stmt, exclude=None, ranked=False):
+        criteria = list(base)
+        if ranked and ranked_join is not None:
+            stmt = stmt.join(_files_fts, ranked_join)
+        else:
+            criteria.extend(matched)
+        for name, group in groups.items():
+            if name != exclude:
+                criteria.extend(group)
+        return stmt.where(*criteria)
+
+    ranking = (rank if rank is not None else literal(None)).label('rank')
+    stmt = scoped(select(*FILE_COLUMNS, ranking).select_from(File), ranked=True)
+    if after is not None:
+        stmt = stmt.where(_after(after, rank, descending))
+    order = [File.created_at.desc(), File.id.desc()]
+    if rank is not None:
+        order.insert(0, rank.desc() if descending else rank.asc())
+    rows = db.session.execute(stmt.order_by(*order).limit(limit + 1)).all()
+
+    columns = len(FILE_COLUMNS)
+    last = rows[limit - 1] if len(rows) > limit else None
+    result = {
+        'results': [row[:columns] for row in rows[:limit]],
+        # FILE_COLUMNS has the id first and created_at ninth
+        'next_position': (last.rank, last[8], last[0]) if last is not None else None,
+    }
+    if total:
+        result['total'] = _capped_count(scoped(select(File.id).select_from(File)))
+    if facets:
+        result['facets'] = _facets(scoped)
+    return result
+
+
+def _value_counts(scoped, field, name):
+    count = func.count().label('count')
+    stmt = (
+        scoped(select(field, count).select_from(File), exclude=name)
+        .group_by(field)
+        .order_by(count.desc(), field)
+        .limit(Config.SEARCH_FACET_LIMIT)
+    )
+    return [{'value': value, 'count': n} for value, n in db.session.execute(stmt)]
+
+
+def _range_counts(scoped, ranges, field, name):
+    columns = [
+        func.sum(case((_bucket_criterion(bounds, field), 1), else_=0)).label(bounds[0].replace('-', '_'))
+        for bounds in ranges
+    ]
+    counts = db.session.execute(scoped(select(*columns).select_from(File), exclude=name)).one()
+    return [{'value': bounds[0], 'count': count or 0} for bounds, count in zip(ranges, counts)]
+
+
+def _facets(scoped):
+    return {
+        'folder_type': _value_counts(scoped, File.folder_type, 'folder_type'),
+        'device_name': _value_counts(scoped, File.device_name, 'device_name'),
+        'size': _range_counts(scoped, SIZE_RANGES, File.size, 'size'),
+        'date': _range_counts(scoped, DATE_RANGES, File.created_at, 'date'),
+    }
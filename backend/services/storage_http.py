@@ -0,0 +1,194 @@
+import os
+import socket
+import threading
+import time
+import certifi
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import EmptyPoolError, HTTPError
+from urllib3.util import Retry, Timeout
+from config import Config
+
+# Retried on connection errors, timeouts and 5xx answers. POSTs (creating
+# and completing multipart uploads) are only retried when the connection
+# could not be made, since they may have taken effect.
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'PUT', 'DELETE'})
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class CircuitBreaker:
+    """Takes a backend out of service while it keeps failing.
+
+    closed: requests flow; `threshold` failures in a row open the circuit.
+    open: allow() is False for `reset_timeout` seconds, so callers fail fast
+    instead of each waiting out timeouts and retries.
+    half-open: after that, calls are let through until one of them reports
+    back; a success closes the circuit, a failure opens it again. Routes
+    check availability before the storage calls they make check it again,
+    so the circuit can't admit just one call and refuse the rest of the
+    trial's request. threshold=0 disables the breaker.
+    """
+
+    def __init__(self, threshold=None, reset_timeout=None):
+        self.threshold = Config.MINIO_BREAKER_THRESHOLD if threshold is None else threshold
+        self.reset_timeout = Config.MINIO_BREAKER_RESET if reset_timeout is None else reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    def allow(self):
+        with self._lock:
+            if self.state != 'open':
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half-open'
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = 'closed'
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.threshold > 0 and (self.state == 'half-open' or self._failures >= self.threshold):
+                self._open()
+
+    def trip(self):
+        """Open the circuit straight away (e.g. the backend is unreachable at startup)."""
+        with self._lock:
+            if self.threshold > 0:
+                self._open()
+
+    def _open(self):
+        if self.state != 'open':
+            self._stats['opened'] += 1
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._stats, state=self.state, consecutive_failures=self._failures)
+
+
+class _CountingRetry(Retry):
+    """Retry that reports each retry it grants to `on_retry`."""
+
+    def __init__(self, *args, on_retry=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_retry = on_retry
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.on_retry = self.on_retry
+        return retry
+
+    def increment(self, *args, **kwargs):
+        # Raises once the retries are used up
+        retry = super().increment(*args, **kwargs)
+        if self.on_retry:
+            self.on_retry()
+        return retry
+
+
+class StoragePool(PoolManager):
+    """urllib3 pool for the MinIO client that feeds a circuit breaker and counts what it does.
+
+    Connection errors, timeouts and 5xx answers left after retries count as
+    failures; any other answer (a 404 included) as a success. Waiting too
+    long for a pooled connection is a local problem and counts as neither.
+    """
+
+    def __init__(self, breaker, pool_timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        retries = self.connection_pool_kw.get('retries')
+        if isinstance(retries, _CountingRetry):
+            retries.on_retry = self.count_retry
+        self.breaker = breaker
+        self.pool_timeout = pool_timeout
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'failures': 0, 'retries': 0, 'pool_timeouts': 0}
+
+    def urlopen(self, method, url, redirect=True, **kw):
+        kw.setdefault('pool_timeout', self.pool_timeout)
+        self._count('requests')
+        try:
+            response = super().urlopen(method, url, redirect=redirect, **kw)
+        except EmptyPoolError:
+            self._count('pool_timeouts')
+            raise
+        except HTTPError:
+            self._count('failures')
+            self.breaker.record_failure()
+            raise
+        if response.status >= 500:
+            self._count('failures')
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def count_retry(self):
+        self._count('retries')
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        in_use = idle = opened = 0
+        for key in self.pools.keys():
+            try:
+                pool = self.pools[key]
+            except KeyError:
+                continue
+            if pool.pool is None:
+                continue
+            # The pool's queue holds idle connections and free slots (None)
+            free = list(pool.pool.queue)
+            in_use += pool.pool.maxsize - len(free)
+            idle += sum(conn is not None for conn in free)
+            opened += pool.num_connections
+        stats.update(
+            pool_size=self.connection_pool_kw.get('maxsize'),
+            connections_in_use=in_use,
+            connections_idle=idle,
+            connections_opened=opened,
+            circuit=self.breaker.metrics()
+        )
+        return stats
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+
+def build_pool(breaker):
+    """The MinIO client's HTTP pool, sized and timed by the MINIO_* settings."""
+    socket_options = list(HTTPConnection.default_socket_options)
+    if Config.MINIO_TCP_KEEPALIVE:
+        # Pooled connections sit idle between requests; keepalives find the
+        # ones a NAT or load balancer dropped before a request is sent on them
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    return StoragePool(
+        breaker,
+        pool_timeout=Config.MINIO_POOL_TIMEOUT,
+        maxsize=Config.MINIO_POOL_SIZE,
+        # Wait for a free connection rather than open one that is thrown away after use
+        block=True,
+        timeout=Timeout(connect=Config.MINIO_CONNECT_TIMEOUT, read=Config.MINIO_READ_TIMEOUT),
+        retries=_CountingRetry(
+            total=Config.MINIO_RETRIES,
+            backoff_factor=Config.MINIO_RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            # Hand the last 5xx to the MinIO client, which turns it into an S3 error
+            raise_on_status=False
+        ),
+        socket_options=socket_options,
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where()
+    )
@@ -0,0 +1,150 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import and_, exists, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from config import Config
+from models import db, ChangeEvent, SyncState
+from serializers import serialize_file
+from services.events import publish_after_commit
+
+ACTIONS = ('create', 'update', 'move', 'delete')
+
+
+def _locked_state(user_id):
+    """The user's sync state row, locked so changes get sequence numbers in commit order."""
+    state = SyncState.query.filter_by(user_id=user_id).with_for_update().first()
+    if state is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(SyncState(user_id=user_id, last_seq=0, horizon_seq=0))
+        except IntegrityError:
+            # A concurrent change created it first
+            pass
+        state = SyncState.query.filter_by(user_id=user_id).with_for_update().first()
+    return state
+
+
+def record_change(file, action, user_id=None):
+    """Append a change of a file to its owner's journal.
+
+    The event is added to the session only; the caller commits it in the
+    same transaction as the change itself, so the journal never shows a
+    change that was rolled back. The file must already carry its new state.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f'Unknown change action: {action}')
+    user_id = int(user_id or file.user_id)
+    now = datetime.utcnow()
+
+    state = _locked_state(user_id)
+    state.last_seq += 1
+    state.last_change_at = now
+
+    event = ChangeEvent(
+        user_id=user_id,
+        seq=state.last_seq,
+        file_id=file.id,
+        action=action,
+        payload=None if action == 'delete' else json.dumps(serialize_file(file)),
+        created_at=now
+    )
+    db.session.add(event)
+    publish_after_commit(db.session, user_id, 'change', serialize_change(event))
+    return event
+
+
+def serialize_change(event):
+    return {
+        'seq': event.seq,
+        'action': event.action,
+        'file_id': event.file_id,
+        'file': json.loads(event.payload) if event.payload else None,
+        'created_at': event.created_at.isoformat() if event.created_at else None
+    }
+
+
+def get_state(user_id):
+    state = db.session.get(SyncState, int(user_id))
+    if state is None:
+        return {'cursor': 0, 'horizon': 0, 'last_change_at': None}
+    return {'cursor': state.last_seq, 'horizon': state.horizon_seq, 'last_change_at': state.last_change_at}
+
+
+def changes_since(user_id, since, limit=None):
+    """Changes after cursor `since`, oldest first.
+
+    Returns a dict with the changes, the cursor to pass next time and
+    whether more changes are waiting. If `since` predates compacted delete
+    events the delta can't be trusted and `reset` is set instead: the
+    client re-lists its files and continues from the returned cursor.
+    """
+    limit = min(limit or Config.SYNC_PAGE_SIZE, Config.SYNC_MAX_PAGE_SIZE)
+    state = get_state(user_id)
+
+    if since < state['horizon'] or since > state['cursor']:
+        return {'reset': True, 'changes': [], 'cursor': state['cursor'], 'has_more': False}
+
+    events = (
+        ChangeEvent.query
+        .filter(ChangeEvent.user_id == int(user_id), ChangeEvent.seq > since)
+        .order_by(ChangeEvent.seq)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    return {
+        'reset': False,
+        'changes': [serialize_change(event) for event in events],
+        'cursor': events[-1].seq if events else since,
+        'has_more': has_more
+    }
+
+
+def pending_count(user_id, since):
+    return ChangeEvent.query.filter(
+        ChangeEvent.user_id == int(user_id), ChangeEvent.seq > since
+    ).count()
+
+
+def compact_journal(retention=None, tombstone_retention=None):
+    """Shrink the journal without changing what a delta sync ends up with.
+
+    Events older than `retention` seconds that a later event of the same
+    file supersedes are dropped; each event carries the full file, so a
+    client replaying from any cursor still converges. Delete events older
+    than `tombstone_retention` are dropped too and move the user's horizon,
+    so clients with an older cursor are told to reset.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=retention or Config.SYNC_JOURNAL_RETENTION)
+    tombstone_cutoff = now - timedelta(seconds=tombstone_retention or Config.SYNC_TOMBSTONE_RETENTION)
+
+    newer = aliased(ChangeEvent)
+    superseded = ChangeEvent.query.filter(
+        ChangeEvent.created_at < cutoff,
+        exists().where(and_(
+            newer.user_id == ChangeEvent.user_id,
+            newer.file_id == ChangeEvent.file_id,
+            newer.seq > ChangeEvent.seq
+        ))
+    ).delete(synchronize_session=False)
+
+    tombstones = ChangeEvent.query.filter(
+        ChangeEvent.action == 'delete',
+        ChangeEvent.created_at < tombstone_cutoff
+    )
+    horizons = (
+        tombstones.with_entities(ChangeEvent.user_id, func.max(ChangeEvent.seq))
+        .group_by(ChangeEvent.user_id)
+        .all()
+    )
+    for user_id, seq in horizons:
+        SyncState.query.filter(
+            SyncState.user_id == user_id, SyncState.horizon_seq < seq
+        ).update({'horizon_seq': seq}, synchronize_session=False)
+    removed_tombstones = tombstones.delete(synchronize_session=False)
+
+    db.session.commit()
+    return {'superseded': superseded, 'tombstones': removed_tombstones}
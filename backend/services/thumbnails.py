@@ -0,0 +1,259 @@
+import io
+import mimetypes
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+from config import Config
+from services.compression import IDENTITY, iter_decoded
+from models import db, File
+from services.minio_service import minio_service
+from services.sync_journal import record_change
+from services.log import get_logger
+
+log = get_logger('thumbnails')
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional; images are rendered with ffmpeg without it
+    Image = ImageOps = None
+
+PENDING_KEY = 'pending_thumbnails'
+
+# Video posters are taken from the first keyframe after this many seconds
+POSTER_OFFSET = 1.0
+
+# Renditions of a file live under THUMBNAIL_PREFIX/{file id}/
+THUMBNAIL_PREFIX = 'thumbnails/'
+
+
+def thumbnail_object_name(file_id, size):
+    return f"{THUMBNAIL_PREFIX}{file_id}/{size}.jpg"
+
+
+def pick_size(requested=None):
+    """The smallest configured size that covers `requested`, or the largest one."""
+    sizes = Config.THUMBNAIL_SIZES
+    if not requested:
+        return sizes[0]
+    return next((size for size in sizes if size >= requested), sizes[-1])
+
+
+@lru_cache(maxsize=1)
+def _ffmpeg():
+    return shutil.which(Config.THUMBNAIL_FFMPEG)
+
+
+def preview_kind(filename):
+    """'image' or 'video' if this server can render a preview of the file, else None."""
+    if not Config.THUMBNAILS_ENABLED:
+        return None
+    mime = mimetypes.guess_type(filename)[0] or ''
+    if mime.startswith('image/') and mime != 'image/svg+xml' and (Image or _ffmpeg()):
+        return 'image'
+    if mime.startswith('video/') and _ffmpeg():
+        return 'video'
+    return None
+
+
+def _run_ffmpeg(input_args, size, data=None):
+    """One frame of the input, fitted into a size x size box, as JPEG bytes."""
+    # ffmpeg's -q:v runs from 2 (best) to 31
+    quality = max(2, min(31, round(31 - Config.THUMBNAIL_QUALITY * 0.29)))
+    result = subprocess.run(
+        [
+            _ffmpeg(), '-v', 'error', *input_args,
+            '-vf', f"scale=w='min(iw,{size})':h='min(ih,{size})':force_original_aspect_ratio=decrease",
+            '-frames:v', '1', '-f', 'image2pipe', '-c:v', 'mjpeg', '-q:v', str(quality), 'pipe:1'
+        ],
+        input=data, capture_output=True, timeout=Config.THUMBNAIL_TIMEOUT, check=True
+    )
+    return result.stdout
+
+
+def render_image(data, sizes):
+    """JPEG renditions {size: bytes} of an image, each fitted into a size x size box."""
+    if Image is None:
+        return {size: _run_ffmpeg(['-i', 'pipe:0'], size, data) for size in sizes}
+
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs can be decoded at a fraction of their size, which is most of the work
+        image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+
+        renditions = {}
+        # Largest first, so each rendition is scaled down from the previous one
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=Config.THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            renditions[size] = buffer.getvalue()
+        return renditions
+
+
+def render_video(url, sizes):
+    """Poster renditions of a video from a keyframe; ffmpeg only reads the ranges it needs."""
+    poster = _run_ffmpeg(['-skip_frame', 'nokey', '-ss', str(POSTER_OFFSET), '-i', url], max(sizes))
+    if not poster:
+        # Shorter than the offset
+        poster = _run_ffmpeg(['-skip_frame', 'nokey', '-i', url], max(sizes))
+    if not poster:
+        raise ValueError('No video frame found')
+    return render_image(poster, sizes)
+
+
+def delete_thumbnails(file_id):
+    minio_service.delete_prefix(f"{THUMBNAIL_PREFIX}{file_id}/")
+
+
+def generate_thumbnails(file_id, object_name):
+    """Render and store a file's previews and record the outcome; returns the new status."""
+    file = db.session.get(File, file_id)
+    if file is None:
+        return None
+    filename, size, codec = file.filename, file.size, file.content_codec
+    compressed = codec not in (None, IDENTITY)
+    # Don't hold a transaction open while rendering
+    db.session.rollback()
+
+    kind = preview_kind(filename)
+    if kind is None:
+        status = None
+    elif kind == 'image' and (size or 0) > Config.THUMBNAIL_MAX_SOURCE_SIZE:
+        status = 'unsupported'
+    elif kind == 'video' and compressed:
+        # ffmpeg reads the stored object by URL, so it needs the raw bytes.
+        # Uploads with a preview aren't compressed; older ones may be.
+        status = 'unsupported'
+    else:
+        try:
+            if kind == 'image':
+                chunks = minio_service.iter_file(object_name)
+                if compressed:
+                    chunks = iter_decoded(codec, chunks)
+                renditions = render_image(b''.join(chunks), Config.THUMBNAIL_SIZES)
+            else:
+                renditions = render_video(minio_service.get_file_url(object_name), Config.THUMBNAIL_SIZES)
+            for rendition_size, data in renditions.items():
+                minio_service.upload_object(thumbnail_object_name(file_id, rendition_size), io.BytesIO(data))
+            status = 'ready'
+        except Exception as e:
+            log.warning('Thumbnail rendering failed', file_id=file_id, kind=kind, error=str(e))
+            status = 'failed'
+
+    file = db.session.get(File, file_id)
+    if file is None:
+        # Deleted while rendering
+        delete_thumbnails(file_id)
+        return None
+    file.thumbnail_status = status
+    if status == 'ready':
+        file.thumbnail_version = (file.thumbnail_version or 0) + 1
+        # Clients pick up the new thumbnail_url like any other change
+        record_change(file, 'update')
+    db.session.commit()
+    return status
+
+
+class ThumbnailPipeline:
+    """Renders previews on a background thread pool.
+
+    Threads are enough: Pillow releases the GIL while decoding and
+    resizing, and ffmpeg runs as a subprocess. At most `workers + queue`
+    jobs are accepted at a time; the rest stay pending until
+    `flask generate-thumbnails` picks them up. With workers=0 nothing is
+    rendered in the background at all.
+    """
+
+    def __init__(self, workers=None, queue=None):
+        self.workers = Config.THUMBNAIL_WORKERS if workers is None else workers
+        self.queue = Config.THUMBNAIL_QUEUE if queue is None else queue
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + self.queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._stats = {'queued': 0, 'dropped': 0, 'ready': 0, 'failed': 0, 'unsupported': 0}
+
+    def submit(self, app, file_id, object_name):
+        """Queue a render; False if the queue is full (the file stays pending)."""
+        if self.workers <= 0 or not self._slots.acquire(blocking=False):
+            self._count('dropped')
+            return False
+        try:
+            future = self._get_pool().submit(self._run, app, file_id, object_name)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._count('queued')
+        return True
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(
+            workers=self.workers, queue=self.queue, sizes=Config.THUMBNAIL_SIZES,
+            pillow=Image is not None, ffmpeg=bool(_ffmpeg())
+        )
+        return stats
+
+    def _run(self, app, file_id, object_name):
+        with app.app_context():
+            try:
+                status = generate_thumbnails(file_id, object_name)
+                if status in self._stats:
+                    self._count(status)
+            except Exception as e:
+                db.session.rollback()
+                log.exception('Thumbnail job error', file_id=file_id)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnails')
+            return self._pool
+
+
+thumbnail_pipeline = ThumbnailPipeline()
+
+
+def schedule_thumbnails(file, object_name):
+    """Mark a new or changed file's previews pending and render them once the transaction commits.
+
+    Call before the commit, like record_change().
+    """
+    if preview_kind(file.filename) is None:
+        file.thumbnail_status = None
+        return
+    file.thumbnail_status = 'pending'
+    db.session.info.setdefault(PENDING_KEY, []).append(
+        (current_app._get_current_object(), file.id, object_name)
+    )
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _submit_pending(session):
+    if session.in_nested_transaction():
+        return
+    for app, file_id, object_name in session.info.pop(PENDING_KEY, []):
+        thumbnail_pipeline.submit(app, file_id, object_name)
+
+
+@sa_event.listens_for(Session, 'after_soft_rollback')
+def _drop_pending(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,213 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event as sa_event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from config import Config
+from models import db, File, StorageUsage, SyncState, User
+from services.log import get_logger
+
+log = get_logger('usage')
+
+# File columns the aggregates depend on
+ACCOUNTED = ('user_id', 'folder_type', 'size')
+
+# Keep the previous value of these when they are set on an instance a commit
+# expired, so a change can be taken off the aggregate it was counted in
+for _key in ACCOUNTED:
+    sa_event.listen(getattr(File, _key), 'set', lambda *args: None, active_history=True)
+
+
+class QuotaExceeded(Exception):
+    """Storing the bytes would take the user past their storage quota."""
+
+    def __init__(self, used, quota, requested):
+        super().__init__('Storage quota exceeded')
+        self.used = used
+        self.quota = quota
+        self.requested = requested
+
+    def to_dict(self):
+        return {'error': str(self), 'used': self.used, 'quota': self.quota, 'requested': self.requested}
+
+
+def _committed(state, key):
+    # The value the database has, loading it if it was expired
+    history = state.attrs[key].load_history()
+    return (history.non_added() or [None])[0]
+
+
+def _count(deltas, values, sign):
+    user_id, folder_type, size = values
+    if user_id is None:
+        return
+    delta = deltas[(int(user_id), folder_type)]
+    delta[0] += sign * (size or 0)
+    delta[1] += sign
+
+
+@sa_event.listens_for(Session, 'before_flush')
+def _count_changes(session, flush_context, instances):
+    """Apply the flush's file inserts, deletes and changes to the aggregates,
+    in the same transaction, so they commit or roll back together."""
+    deltas = defaultdict(lambda: [0, 0])
+    for obj in session.new:
+        if isinstance(obj, File):
+            _count(deltas, tuple(getattr(obj, key) for key in ACCOUNTED), 1)
+    for obj in session.deleted:
+        if isinstance(obj, File):
+            state = inspect(obj)
+            _count(deltas, tuple(_committed(state, key) for key in ACCOUNTED), -1)
+    for obj in session.dirty:
+        if isinstance(obj, File):
+            state = inspect(obj)
+            if not any(state.attrs[key].history.has_changes() for key in ACCOUNTED):
+                continue
+            old = tuple(_committed(state, key) for key in ACCOUNTED)
+            new = tuple(getattr(obj, key) for key in ACCOUNTED)
+            if old != new:
+                _count(deltas, old, -1)
+                _count(deltas, new, 1)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+def _apply(connection, deltas):
+    table = StorageUsage.__table__
+    now = datetime.utcnow()
+    dialect = connection.dialect.name
+    # In key order, so transactions touching several rows lock them alike
+    for (user_id, folder_type), (size, count) in sorted(deltas.items()):
+        if not size and not count:
+            continue
+        if dialect in ('postgresql', 'sqlite'):
+            insert = (postgresql if dialect == 'postgresql' else sqlite).insert(table).values(
+                user_id=user_id, folder_type=folder_type, bytes=size, file_count=count, updated_at=now
+            )
+            connection.execute(insert.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.folder_type],
+                set_={
+                    'bytes': table.c.bytes + insert.excluded.bytes,
+                    'file_count': table.c.file_count + insert.excluded.file_count,
+                    'updated_at': insert.excluded.updated_at
+                }
+            ))
+            continue
+        updated = connection.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.folder_type == folder_type)
+            .values(bytes=table.c.bytes + size, file_count=table.c.file_count + count, updated_at=now)
+        )
+        if updated.rowcount == 0:
+            connection.execute(table.insert().values(
+                user_id=user_id, folder_type=folder_type, bytes=size, file_count=count, updated_at=now
+            ))
+
+
+def quota_for(user_id):
+    """The user's quota in bytes, 0 if unlimited."""
+    quota = db.session.execute(select(User.storage_quota).where(User.id == int(user_id))).scalar()
+    return Config.STORAGE_QUOTA if quota is None else quota
+
+
+def get_usage(user_id):
+    """A user's bytes and files, in total and per folder, read from the aggregates."""
+    rows = db.session.execute(
+        select(StorageUsage.folder_type, StorageUsage.bytes, StorageUsage.file_count)
+        .where(StorageUsage.user_id == int(user_id))
+        .order_by(StorageUsage.folder_type)
+    ).all()
+    folders = [
+        {'folder_type': folder_type, 'bytes': max(size, 0), 'files': max(count, 0)}
+        for folder_type, size, count in rows if size or count
+    ]
+    used = sum(folder['bytes'] for folder in folders)
+    quota = quota_for(user_id)
+    return {
+        'bytes': used,
+        'files': sum(folder['files'] for folder in folders),
+        'quota': quota or None,
+        'available': max(quota - used, 0) if quota else None,
+        'folders': folders
+    }
+
+
+def check_quota(user_id, requested):
+    """Raise QuotaExceeded if `requested` more bytes don't fit in the user's
+    quota. Call it before sending the bytes to storage."""
+    quota = quota_for(user_id)
+    if not quota or not requested or requested <= 0:
+        return
+    used = db.session.execute(
+        select(func.coalesce(func.sum(StorageUsage.bytes), 0)).where(StorageUsage.user_id == int(user_id))
+    ).scalar()
+    if used + requested > quota:
+        raise QuotaExceeded(used, quota, requested)
+
+
+def reconcile_usage(batch_size=None):
+    """Check the aggregates against the files table and correct any drift.
+
+    The files table is the authority, not the bucket: quotas count the
+    logical bytes of each file (File.size), while the bucket holds them
+    compressed (STORAGE_COMPRESSION) and shared between files
+    (STORAGE_DEDUP), so bucket totals can't be compared with usage. That
+    rows match their objects is what reconcile_storage() checks, per key.
+
+    Drift means a change bypassed the ORM (bulk SQL, manual fixes) or the
+    files predate the aggregates. Users are checked in batches. Each batch
+    locks its users' sync state rows, which every journaled file change
+    takes too, so files can't change while they are summed. Returns the
+    number of users checked, folders corrected and bytes of drift found.
+    """
+    batch_size = batch_size or Config.USAGE_RECONCILE_BATCH
+    result = {'users': 0, 'corrected': 0, 'drift_bytes': 0}
+    last_id = 0
+    while True:
+        user_ids = db.session.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).all()
+        if not user_ids:
+            return result
+        last_id = user_ids[-1]
+        result['users'] += len(user_ids)
+
+        db.session.execute(
+            select(SyncState.user_id).where(SyncState.user_id.in_(user_ids))
+            .order_by(SyncState.user_id).with_for_update()
+        ).all()
+        actual = {
+            (user_id, folder_type): (size or 0, count)
+            for user_id, folder_type, size, count in db.session.execute(
+                select(File.user_id, File.folder_type, func.sum(File.size), func.count())
+                .where(File.user_id.in_(user_ids))
+                .group_by(File.user_id, File.folder_type)
+            )
+        }
+        recorded = {
+            (row.user_id, row.folder_type): row
+            for row in StorageUsage.query.filter(StorageUsage.user_id.in_(user_ids))
+        }
+
+        now = datetime.utcnow()
+        for key in sorted(set(actual) | set(recorded)):
+            size, count = actual.get(key, (0, 0))
+            row = recorded.get(key)
+            if row is not None and (row.bytes, row.file_count) == (size, count):
+                continue
+            if row is None and not count:
+                continue
+            log.warning(
+                'Usage drift', user_id=key[0], folder_type=key[1],
+                recorded_bytes=row.bytes if row else 0, actual_bytes=size,
+                recorded_files=row.file_count if row else 0, actual_files=count
+            )
+            result['corrected'] += 1
+            result['drift_bytes'] += abs(size - (row.bytes if row else 0))
+            if row is None:
+                db.session.add(StorageUsage(
+                    user_id=key[0], folder_type=key[1], bytes=size, file_count=count, updated_at=now
+                ))
+            else:
+                row.bytes, row.file_count, row.updated_at = size, count, now
+        db.session.commit()
@@ -0,0 +1,156 @@
+import functools
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import g, has_app_context, jsonify
+from flask_jwt_extended import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from config import Config
+from models import db, User, UserRole
+
+PENDING_KEY = 'pending_user_invalidations'
+
+# Detached snapshot of a user; safe to share between requests and threads
+UserRecord = namedtuple('UserRecord', ['id', 'email', 'name', 'role', 'is_active'])
+
+
+def _record(user):
+    return UserRecord(user.id, user.email, user.name, user.role.value, user.is_active)
+
+
+class UserCache:
+    """Process-wide LRU of user records with a TTL.
+
+    Lookups check the current request first (flask.g), then this cache,
+    and only then the database. Updates and deletes of a User invalidate
+    its entry in this process; other workers see the change once their
+    entry expires after USER_CACHE_TTL seconds.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or Config.USER_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else Config.USER_CACHE_TTL
+        self._entries = OrderedDict()  # {user_id: (expires_at, record)}
+        self._lock = threading.Lock()
+        self._stats = {
+            'request_hits': 0,
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, user_id):
+        """The user's record, or None if there is no such active user."""
+        user_id = int(user_id)
+        request_cache = self._request_cache()
+        if request_cache is not None and user_id in request_cache:
+            with self._lock:
+                self._stats['request_hits'] += 1
+            return request_cache[user_id]
+
+        record = self._get_cached(user_id)
+        if record is None:
+            user = db.session.get(User, user_id)
+            record = _record(user) if user else None
+            if record:
+                self._put(user_id, record)
+
+        if request_cache is not None:
+            request_cache[user_id] = record
+        return record
+
+    def invalidate(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._stats['invalidations'] += 1
+        request_cache = self._request_cache()
+        if request_cache is not None:
+            request_cache.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), maxsize=self.maxsize, ttl=self.ttl)
+        lookups = stats['request_hits'] + stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['request_hits'] + stats['hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _get_cached(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry[1]
+            if entry:
+                del self._entries[user_id]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            return None
+
+    def _put(self, user_id, record):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _request_cache(self):
+        if not has_app_context():
+            return None
+        if '_user_cache' not in g:
+            g._user_cache = {}
+        return g._user_cache
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    # Until the commit, a concurrent lookup still reads the old row and
+    # could cache it again, so the entry is dropped once committed
+    object_session(target).info.setdefault(PENDING_KEY, set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    # Also fired when a savepoint is released; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    for user_id in session.info.pop(PENDING_KEY, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_pending(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
+
+
+def admin_required(view):
+    """Route decorator, below @jwt_required(): 403 for anyone but admins."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user.role != UserRole.ADMIN.value:
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def load_user(identity):
+    """JWT user lookup: inactive or deleted users make the token invalid."""
+    record = user_cache.get(identity)
+    if record is None or record.is_active is False:
+        return None
+    return record
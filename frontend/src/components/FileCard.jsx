@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import { Link } from 'react-router-dom';
 import { useFiles } from '../context/FileContext';
+import axiosInstance from '../api/axiosInstance';
 import { formatDate } from '../utils/formatDate';
 import Toast from './Toast';
 
@@ -73,6 +74,15 @@ const FileCard = ({ file }) => {
         className="bg-white/10 backdrop-blur-lg rounded-lg shadow-md hover:shadow-lg transition-shadow duration-300 overflow-hidden cursor-pointer border border-white/20"
         onClick={handleCardClick}
       >
+        {file.thumbnail_url && (
+          // Thumbnails are a few KB and cacheable for good, unlike the file itself
+          <img
+            src={`${axiosInstance.defaults.baseURL}${file.thumbnail_url}&size=512&jwt=${encodeURIComponent(localStorage.getItem('token') || '')}`}
+            alt={file.title}
+            loading="lazy"
+            className="w-full h-40 object-cover bg-black/20"
+          />
+        )}
         <div className="p-6">
           <div className="flex justify-between items-start mb-4">
             <div className="flex-1">
@@ -2,21 +2,13 @@ import React, { useEffect, useState } from 'react';
 import { useFiles } from '../context/FileContext';
 
 const SyncStatus = () => {
-  const { syncStatus, checkSync } = useFiles();
+  const { syncStatus } = useFiles();
   const [lastChecked, setLastChecked] = useState(null);
 
+  // Status updates are pushed by the server, no need to poll
   useEffect(() => {
-    // Initial check
-    checkSync();
     setLastChecked(new Date());
-    
-    const interval = setInterval(() => {
-      checkSync();
-      setLastChecked(new Date());
-    }, 30000); // Check every 30 seconds
-
-    return () => clearInterval(interval);
-  }, []); // Remove checkSync dependency to prevent infinite calls
+  }, [syncStatus]);
 
   return (
     <div className="p-6">
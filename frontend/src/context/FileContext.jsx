@@ -5,10 +5,48 @@ const FileContext = createContext();
 
 export const useFiles = () => useContext(FileContext);
 
+// With direct transfers the browser moves file bytes to and from storage
+// itself using presigned URLs; storage must be reachable from the browser
+const DIRECT_TRANSFERS = import.meta.env.VITE_DIRECT_TRANSFERS === 'true';
+const PART_URL_BATCH = 100;
+// /api/files is paginated; the library is fetched a page of this many at a
+// time, following X-Next-Cursor until the last page
+const FILES_PAGE_LIMIT = 1000;
+
+const uploadDirect = async ({ title, description, file, folder_type, device_name }) => {
+  const { data: session } = await axiosInstance.post('/api/files/uploads', {
+    filename: file.name,
+    size: file.size,
+    title,
+    description,
+    folder_type: folder_type || 'documents',
+    device_name: device_name || 'Current Device',
+    direct: true
+  });
+  const chunkSize = session.chunk_size;
+  const count = Math.max(1, Math.ceil(file.size / chunkSize));
+  let urls = session.part_urls;
+  for (let n = 1; n <= count; n++) {
+    let part = urls.find((p) => p.part_number === n);
+    if (!part) {
+      const parts = Array.from({ length: Math.min(PART_URL_BATCH, count - n + 1) }, (_, i) => n + i);
+      const res = await axiosInstance.post(`/api/files/uploads/${session.upload_id}/part-urls`, { parts });
+      urls = res.data.part_urls;
+      part = urls[0];
+    }
+    const res = await fetch(part.url, { method: 'PUT', body: file.slice((n - 1) * chunkSize, n * chunkSize) });
+    if (!res.ok) throw new Error(`Chunk ${n} failed with ${res.status}`);
+    console.log('Upload progress:', Math.min(n * chunkSize, file.size) / file.size);
+  }
+  const res = await axiosInstance.post(`/api/files/uploads/${session.upload_id}/complete`);
+  return res.data;
+};
+
 export const FileProvider = ({ children }) => {
   const [files, setFiles] = useState([]);
   const [syncStatus, setSyncStatus] = useState('checking');
   const [recentFiles, setRecentFiles] = useState([]);
+  const [lastDeviceEvent, setLastDeviceEvent] = useState(null);
 
   const checkSync = async () => {
     try {
@@ -26,14 +64,47 @@ export const FileProvider = ({ children }) => {
 
   const fetchFiles = React.useCallback(async () => {
     try {
-      const res = await axiosInstance.get('/api/files');
-      setFiles(res.data);
+      const all = [];
+      let cursor = null;
+      do {
+        const res = await axiosInstance.get('/api/files', {
+          params: { limit: FILES_PAGE_LIMIT, ...(cursor ? { cursor } : {}) }
+        });
+        all.push(...res.data);
+        cursor = res.headers['x-next-cursor'];
+      } while (cursor);
+      setFiles(all);
     } catch (error) {
       console.error('Error fetching files:', error);
     }
   }, []);
 
+  // Server-sent events replace polling: the server pushes file changes
+  // and device activity, and EventSource reconnects by itself
+  React.useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token || typeof EventSource === 'undefined') return;
+
+    const source = new EventSource(
+      `${axiosInstance.defaults.baseURL}/api/events/stream?jwt=${encodeURIComponent(token)}`
+    );
+    source.addEventListener('hello', () => checkSync());
+    source.addEventListener('change', () => {
+      setSyncStatus('synced');
+      fetchFiles();
+    });
+    source.addEventListener('reset', () => fetchFiles());
+    source.addEventListener('device', (event) => setLastDeviceEvent(JSON.parse(event.data)));
+
+    return () => source.close();
+  }, [fetchFiles]);
+
   const uploadFile = React.useCallback(async ({ title, description, file, folder_type, device_name }) => {
+    if (DIRECT_TRANSFERS) {
+      const data = await uploadDirect({ title, description, file, folder_type, device_name });
+      fetchFiles();
+      return data;
+    }
     const formData = new FormData();
     formData.append('title', title);
     formData.append('description', description);
@@ -55,6 +126,13 @@ export const FileProvider = ({ children }) => {
       // Track as recent file when downloaded
       trackRecentFile(id);
 
+      if (DIRECT_TRANSFERS) {
+        // Storage serves the bytes and names the file
+        const { data } = await axiosInstance.get(`/api/files/${id}/download-url`);
+        window.location.assign(data.url);
+        return;
+      }
+
       // Get the download URL from backend
       const response = await axiosInstance.get(`/api/files/${id}/download`, {
         responseType: 'blob'
@@ -135,7 +213,7 @@ export const FileProvider = ({ children }) => {
   };
 
   return (
-    <FileContext.Provider value={{ files, syncStatus, recentFiles, fetchFiles, uploadFile, downloadFile, syncAll, deleteFile, moveFile, checkSync, trackRecentFile }}>
+    <FileContext.Provider value={{ files, syncStatus, recentFiles, lastDeviceEvent, fetchFiles, uploadFile, downloadFile, syncAll, deleteFile, moveFile, checkSync, trackRecentFile }}>
       {children}
     </FileContext.Provider>
   );
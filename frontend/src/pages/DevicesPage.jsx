@@ -1,7 +1,9 @@
 import React, { useState, useEffect } from 'react';
 import axiosInstance from '../api/axiosInstance';
+import { useFiles } from '../context/FileContext';
 
 const DevicesPage = () => {
+  const { lastDeviceEvent } = useFiles();
   const [devices, setDevices] = useState([]);
   const [loading, setLoading] = useState(true);
   const [showAddDevice, setShowAddDevice] = useState(false);
@@ -32,6 +34,18 @@ const DevicesPage = () => {
     return () => clearInterval(heartbeatInterval);
   }, []);
 
+  // Registrations and heartbeats of other devices arrive as pushed events
+  useEffect(() => {
+    if (!lastDeviceEvent) return;
+    if (!devices.some(device => device.id === lastDeviceEvent.id)) {
+      fetchDevices();
+      return;
+    }
+    setDevices(prev => prev.map(device => device.id === lastDeviceEvent.id
+      ? { ...device, status: lastDeviceEvent.status, last_seen: lastDeviceEvent.last_seen }
+      : device));
+  }, [lastDeviceEvent]);
+
   const fetchDevices = async () => {
     try {
       setLoading(true);